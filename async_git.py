@@ -0,0 +1,137 @@
+import os
+import re
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from git import Git, GitCommandError # type: ignore
+from git_logic import GitManager
+from index_store import IndexStore
+from progress import Progress, GitProgress, OperationCancelled
+
+def git_argv(git, command, *args, config=(), **kwargs):
+    """Command line GitPython would run for getattr(git(c=config), command)(*args, **kwargs)."""
+    options = [option for entry in config for option in ('-c', entry)]
+    return [Git.GIT_PYTHON_GIT_EXECUTABLE, *options, command.replace('_', '-'),
+            *git.transform_kwargs(**kwargs), *[str(arg) for arg in args]]
+
+async def run_git_async(git, command, *args, progress: Progress = None, part=(0, 1), phase=None, cancel: threading.Event = None, config=(), **kwargs):
+    """run_git as an asyncio subprocess: same arguments, output, progress parsing and errors.
+    Setting cancel, or cancelling the task, kills git."""
+    if cancel is not None and cancel.is_set():
+        raise OperationCancelled()
+    tracked = progress is not None and progress.callback is not None
+    argv = git_argv(git, command, *(('--progress',) if tracked else ()), *args, config=config, **kwargs)
+    env = {**os.environ, "LANGUAGE": "C", "LC_ALL": "C", **git.environment()}  # git's messages are parsed
+    process = await asyncio.create_subprocess_exec(*argv, cwd=git.working_dir, env=env, stdin=asyncio.subprocess.DEVNULL,
+                                                   stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    handler = GitProgress(progress or Progress(), part, phase)
+    parse = handler.new_message_handler()
+    errors = []
+
+    async def read_stderr():
+        pending = b""
+        while block := await process.stderr.read(4096):
+            # git redraws its progress with \r: one update per segment
+            *lines, pending = re.split(rb'[\r\n]', pending + block)
+            for line in lines:
+                if line:
+                    parse(line) if tracked else errors.append(line.decode(errors='replace'))
+        if pending:
+            parse(pending) if tracked else errors.append(pending.decode(errors='replace'))
+
+    communicate = asyncio.ensure_future(asyncio.gather(process.stdout.read(), read_stderr(), process.wait()))
+    try:
+        while not communicate.done():
+            await asyncio.wait([communicate], timeout=0.2)
+            if cancel is not None and cancel.is_set() and process.returncode is None:
+                process.terminate()
+        stdout, _, status = communicate.result()
+    except asyncio.CancelledError:
+        if process.returncode is None:
+            process.terminate()
+        await asyncio.wait([communicate])
+        raise
+    if status != 0:
+        if cancel is not None and cancel.is_set():
+            raise OperationCancelled()
+        raise GitCommandError(argv, status, "\n".join(handler.error_lines + handler.other_lines + errors))
+    output = stdout.decode(errors='replace')
+    return output[:-1] if output.endswith("\n") else output
+
+class AsyncGitManager:
+    """Coroutine API of a GitManager: several downloads, a refresh and a push can run at the same time.
+
+    Every operation runs on its own fork() of the GitManager, at most `concurrency` at once.
+    The git commands talking to the remote (ls-remote, fetch, push) run as asyncio subprocesses of the
+    running loop; hashing, fast-import and cat-file stay in worker threads. The indices are refreshed
+    once by list() and shared by the operations, pushes of the folder run one after the other.
+    Cancelling an operation's task stops it at its next cancellation point."""
+    def __init__(self, gitManager: GitManager, concurrency=4):
+        self.gitManager = gitManager
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.push_lock = asyncio.Lock()
+        self.refreshing = None  # task of the running list()
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="git")
+
+    def fork(self, loop):
+        forked = self.gitManager.fork()
+        # called from the worker threads: the command runs on the loop, the thread waits for it
+        forked.run_git = lambda *args, **kwargs: asyncio.run_coroutine_threadsafe(run_git_async(*args, **kwargs), loop).result()
+        return forked
+
+    async def run(self, operation, refresh_indices=False):
+        """operation(forked GitManager) in a worker thread, once a slot is free."""
+        loop = asyncio.get_running_loop()
+        async with self.semaphore:
+            forked = self.fork(loop)
+            forked.refresh_indices = refresh_indices
+            future = loop.run_in_executor(self.executor, operation, forked)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the thread cannot be killed: stop it and wait until it left the repository
+                # (again until it ends: an operation clears the flag when it starts)
+                while not future.done():
+                    forked.cancel()
+                    try:
+                        await asyncio.wait([future], timeout=0.2)
+                    except asyncio.CancelledError:
+                        pass  # cancelled again meanwhile: still waits for the thread
+                raise
+
+    async def list(self, progress=None) -> IndexStore:
+        """The indices refreshed from the remote. Calls made while a refresh runs share its result."""
+        if self.refreshing is None or self.refreshing.done():
+            self.refreshing = asyncio.ensure_future(self.run(lambda gitManager: gitManager.get_remote_file_list(progress), refresh_indices=True))
+        return await asyncio.shield(self.refreshing)
+
+    async def get_file(self, files, download_path="Downloads", progress=None, pin=False):
+        """GitManager.get_file, with the indices of list()."""
+        await self.list()
+        return await self.run(lambda gitManager: gitManager.get_file(files, download_path, show_process=progress is not None,
+                                                                     progress=progress, pin=pin))
+
+    async def push(self, progress=None, resume=True, paths=None):
+        """GitManager.push, after the push started before it."""
+        await self.list()
+        async with self.push_lock:
+            return await self.run(lambda gitManager: gitManager.push(progress, resume, paths))
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+class EventLoopThread:
+    """An event loop running in a daemon thread, for callers without one (the Qt GUI)."""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="asyncio", daemon=True)
+        self.thread.start()
+
+    def submit(self, coroutine):
+        """Schedule coroutine on the loop. Returns a concurrent.futures.Future: cancel() cancels the task."""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
@@ -0,0 +1,265 @@
+# -*- coding: utf-8 -*-
+"""Offline push / pull benchmark against a local bare repository.
+
+    python benchmark.py run --datasets tiny mixed --output before.json
+    python benchmark.py compare before.json after.json
+
+Every operation runs in its own process, so peak RSS is the peak of that operation only.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import threading
+import platform
+import subprocess
+
+try:
+    import resource
+except ImportError:  # windows
+    resource = None
+
+BLOCK_SIZE = 8 * 1024 * 1024
+MARKER = ".github-cloud-benchmark"  # in every workdir the benchmark created: the only ones it clears
+OPERATIONS = ["push", "push_unchanged", "get_remote_file_list", "get_remote_file_list_cached", "write_indices", "get_file", "get_file_cached"]
+
+# 1. datasets
+def write_file(path, size, rng, compressible):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        remaining = size
+        while remaining:
+            n = min(BLOCK_SIZE, remaining)
+            if compressible:
+                line = b"%d,sensor-%d,%0.3f,ok\n" % (rng.randrange(10**9), rng.randrange(100), rng.random())
+                block = (line * (n // len(line) + 1))[:n]
+            else:
+                block = rng.randbytes(n)
+            f.write(block)
+            remaining -= n
+
+def make_dataset(name, path, tiny_count, big_count, big_size):
+    """tiny: many small compressible files in nested folders, big: a few large random files,
+    mixed: half as many tiny files and as many big files, every other file of each kind compressible."""
+    rng = random.Random(name)  # same content on every run
+    files = []
+    if name in ("tiny", "mixed"):
+        count = tiny_count if name == "tiny" else tiny_count // 2
+        for i in range(count):
+            compressible = name == "tiny" or i % 2 == 0
+            files.append((os.path.join(path, f"dir{i % 50:02d}", f"sub{i % 7}", f"file{i:06d}.txt"), rng.randrange(16, 4096), compressible))
+    if name in ("big", "mixed"):
+        for i in range(big_count):
+            files.append((os.path.join(path, f"big{i}.bin"), big_size, name == "mixed" and i % 2 == 0))
+    for file_path, size, compressible in files:
+        write_file(file_path, size, rng, compressible)
+    return {"files": len(files), "bytes": sum(size for _, size, _ in files)}
+
+def make_remote(path):
+    subprocess.run(['git', 'init', '-q', '--bare', path], check=True)
+    # blobs are fetched by id from the remote
+    subprocess.run(['git', '-C', path, 'config', 'uploadpack.allowFilter', 'true'], check=True)
+    subprocess.run(['git', '-C', path, 'config', 'uploadpack.allowAnySHA1InWant', 'true'], check=True)
+
+def tree_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+# 2. one operation, in a child process
+def peak_rss_kb(who):
+    if resource is None:
+        return None
+    rss = resource.getrusage(who).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss  # bytes on macOS, KB elsewhere
+
+class GitPeak:
+    """Peak RSS (KB) of the git processes started by this one, children of children included.
+    VmHWM of each is sampled from /proc: ru_maxrss of RUSAGE_CHILDREN also counts the Python memory a
+    child held before it exec'd git, so it only ever showed the benchmark's own peak. None without /proc,
+    0 if every git process ended within one sampling interval."""
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peaks = {}  # peaks[pid] = VmHWM
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def __enter__(self):
+        if os.path.isdir("/proc/self"):
+            self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    @property
+    def peak_kb(self):
+        return max(self.peaks.values(), default=0) if os.path.isdir("/proc/self") else None
+
+    def run(self):
+        while not self.stop_event.wait(self.interval):
+            self.sample()
+
+    def sample(self):
+        parents = {}  # parents[pid] = parent pid
+        for entry in os.listdir("/proc"):
+            if entry.isdigit():
+                try:
+                    with open(f"/proc/{entry}/stat") as f:
+                        parents[int(entry)] = int(f.read().rsplit(")", 1)[1].split()[1])
+                except (OSError, ValueError, IndexError):
+                    pass  # exited meanwhile
+        descendants, found = set(), {os.getpid()}
+        while found:
+            found = {pid for pid, parent in parents.items() if parent in found} - descendants
+            descendants |= found
+        for pid in descendants:
+            try:
+                with open(f"/proc/{pid}/status") as f:
+                    for line in f:
+                        if line.startswith("VmHWM:"):
+                            self.peaks[pid] = max(self.peaks.get(pid, 0), int(line.split()[1]))
+            except (OSError, ValueError):
+                pass
+
+def run_operation(op, workdir, dataset):
+    from git_logic import GitManager
+    from manifest import Manifest
+    from utils import generate_timestamp
+    # a fresh workspace for cold operations, the one push filled for the others
+    home = {"get_remote_file_list": "home-cold-", "get_file": "home-download-", "get_file_cached": "home-download-"}.get(op, "home-")
+    os.environ["GITHUB_CLOUD_HOME"] = os.path.join(workdir, home + dataset)
+    local_path = os.path.join(workdir, "data", dataset)
+    remote = os.path.join(workdir, "remote-" + dataset + ".git")
+    download_path = os.path.join(workdir, ("download-cached-" if op == "get_file_cached" else "download-") + dataset)
+    gm = GitManager(local_path, remote)
+
+    measured = {"push": remote, "push_unchanged": remote, "get_file": download_path, "get_file_cached": download_path}.get(op, os.environ["GITHUB_CLOUD_HOME"])
+    before = tree_size(measured)
+    with GitPeak() as git_peak:
+        started = time.perf_counter()
+        if op in ("push", "push_unchanged"):
+            if not gm.push():
+                raise RuntimeError("push failed")  # a failed push is not a fast one
+        elif op in ("get_remote_file_list", "get_remote_file_list_cached"):
+            len(gm.get_remote_file_list())
+        elif op == "write_indices":
+            store = gm.load_indices()
+            started = time.perf_counter()  # scan and hash only, with an empty manifest
+            gm.write_indices(generate_timestamp(), store, Manifest(os.path.join(workdir, "empty-manifest.json")))
+        elif op in ("get_file", "get_file_cached"):  # the second one is served by the download cache
+            os.makedirs(download_path, exist_ok=True)
+            files = list(gm.get_remote_file_list())
+            placed = gm.get_file(files, download_path, show_process=False)
+            if len(placed) != len(files):
+                raise RuntimeError(f"get_file placed {len(placed)} of {len(files)} files")
+        elapsed = time.perf_counter() - started
+    return {"seconds": round(elapsed, 3), "bytes_written": tree_size(measured) - before,
+            "peak_rss_kb": peak_rss_kb(resource.RUSAGE_SELF) if resource else None,
+            "peak_git_rss_kb": git_peak.peak_kb}
+
+def measure(op, workdir, dataset):
+    # git and the benchmark output are noisy: the result is the last stdout line
+    proc = subprocess.run([sys.executable, os.path.abspath(__file__), "_op", op, workdir, dataset],
+                          capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    if proc.returncode != 0:
+        raise RuntimeError(f"{op} on {dataset} failed\n{proc.stdout[-2000:]}\n{proc.stderr[-2000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+# 3. suite
+def git_version():
+    return subprocess.run(['git', '--version'], capture_output=True, text=True).stdout.strip()
+
+def source_version():
+    proc = subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                          cwd=os.path.dirname(os.path.abspath(__file__)))
+    return proc.stdout.strip() or None
+
+def prepare_workdir(workdir):
+    """Empty workdir. A non-empty directory is only cleared if the benchmark created it."""
+    if os.path.isdir(workdir) and os.listdir(workdir):
+        if not os.path.exists(os.path.join(workdir, MARKER)):
+            raise SystemExit(f"benchmark :: {workdir} is not empty and was not created by the benchmark, pass another --workdir")
+        shutil.rmtree(workdir)
+    os.makedirs(workdir, exist_ok=True)
+    open(os.path.join(workdir, MARKER), 'w').close()
+
+def run_suite(args):
+    workdir = os.path.abspath(args.workdir)
+    prepare_workdir(workdir)
+    results = {"version": source_version(), "python": platform.python_version(), "platform": platform.platform(),
+               "git": git_version(), "date": time.strftime("%Y-%m-%d %H:%M:%S"), "datasets": {}}
+    for dataset in args.datasets:
+        print(f"== {dataset}: generating")
+        info = make_dataset(dataset, os.path.join(workdir, "data", dataset), args.tiny_count, args.big_count, args.big_mb * 1024 * 1024)
+        make_remote(os.path.join(workdir, "remote-" + dataset + ".git"))
+        info["operations"] = {}
+        for op in OPERATIONS:
+            info["operations"][op] = measure(op, workdir, dataset)
+            print(f"   {op:30s} {info['operations'][op]}")
+        results["datasets"][dataset] = info
+        if not args.keep:
+            prepare_workdir(workdir)
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=4)
+    print(f"Saved to {args.output}")
+
+def compare(args):
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"{before['version']} -> {after['version']}")
+    for dataset, info in after["datasets"].items():
+        if dataset not in before["datasets"]:
+            continue
+        for op, result in info["operations"].items():
+            old = before["datasets"][dataset]["operations"].get(op)
+            if not old:
+                continue
+            cells = []
+            for key in ("seconds", "bytes_written", "peak_rss_kb", "peak_git_rss_kb"):
+                if old.get(key) and result.get(key) is not None:
+                    cells.append(f"{key} {old[key]} -> {result[key]} ({result[key] / old[key]:.2f}x)")
+            print(f"{dataset:6s} {op:30s} " + ", ".join(cells))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="generate the datasets and measure every operation")
+    run.add_argument("--datasets", nargs="+", default=["tiny", "big", "mixed"], choices=["tiny", "big", "mixed"])
+    run.add_argument("--tiny-count", type=int, default=10000, help="number of tiny files")
+    run.add_argument("--big-count", type=int, default=2, help="number of big files")
+    run.add_argument("--big-mb", type=int, default=2048, help="size of each big file in MB")
+    run.add_argument("--workdir", default=os.path.join(os.path.expanduser('~'), ".github_cloud_benchmark"),
+                     help="empty or missing folder, cleared before every dataset")
+    run.add_argument("--output", default=f"benchmark-{time.strftime('%y%m%d-%H%M%S')}.json")
+    run.add_argument("--keep", action="store_true", help="keep the datasets and remotes of every dataset")
+    cmp = commands.add_parser("compare", help="compare two result files")
+    cmp.add_argument("before")
+    cmp.add_argument("after")
+    op = commands.add_parser("_op")  # internal: one measured operation
+    op.add_argument("op", choices=OPERATIONS)
+    op.add_argument("workdir")
+    op.add_argument("dataset")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        run_suite(args)
+    elif args.command == "compare":
+        compare(args)
+    else:
+        print(json.dumps(run_operation(args.op, args.workdir, args.dataset)))
+
+if __name__ == "__main__":
+    main()
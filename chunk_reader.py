@@ -0,0 +1,155 @@
+import io
+import bisect
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from git import Git # type: ignore
+from compression import decompress
+
+class ChunkReader(io.RawIOBase):
+    """Seekable, read-only view of a stored file made of pieces: chunks, or the blob(s) of a plain file.
+
+    pieces: [(blob, size, codec)] in file order, size is the size after decompression.
+    fetch(blobs): downloads blobs into the repository, missing: the blobs it does not have yet.
+    A piece is fetched on first read and kept decoded in an LRU cache of cache_size bytes.
+    Sequential reads prefetch the next `prefetch` pieces in the background, in one fetch."""
+    def __init__(self, repo_path, pieces, fetch, missing=(), cache_size=64 * 1024 * 1024, prefetch=4):
+        super().__init__()
+        self.repo_path = repo_path
+        self.pieces = pieces
+        self.fetch = fetch
+        self.missing = set(missing)
+        self.cache_size = cache_size
+        self.prefetch = prefetch
+        self.offsets = [0]  # offsets[i] = position of pieces[i] in the file
+        for _, size, _ in pieces:
+            self.offsets.append(self.offsets[-1] + size)
+        self.size = self.offsets[-1]
+        self.position = 0
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # cache[piece index] = decoded bytes, least recently used first
+        self.cached_bytes = 0
+        self.loading = {}  # loading[piece index] = future of the prefetch holding it
+        self.last_piece = None
+        self.git = Git(repo_path)  # cat-file of the reading thread
+        self.executor = None  # prefetch thread, with its own cat-file
+        self.prefetch_git = None
+        self.hits = 0
+        self.misses = 0
+
+    # 1. io interface
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"negative seek position {position}")
+        self.position = position
+        return position
+
+    def readinto(self, buffer):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        view = memoryview(buffer).cast('B')
+        written = 0
+        while written < len(view) and self.position < self.size:
+            index = bisect.bisect_right(self.offsets, self.position) - 1
+            data = self.piece(index)
+            start = self.position - self.offsets[index]
+            n = min(len(view) - written, len(data) - start)
+            view[written:written + n] = data[start:start + n]
+            written += n
+            self.position += n
+        return written
+
+    def readall(self):
+        return self.read(max(self.size - self.position, 0))
+
+    def close(self):
+        if not self.closed:
+            if self.executor:
+                self.executor.shutdown(wait=True)
+                self.prefetch_git.clear_cache()
+            self.git.clear_cache()
+            self.cache.clear()
+        super().close()
+
+    # 2. pieces
+    def piece(self, index):
+        """Decoded bytes of pieces[index], from the cache when possible."""
+        with self.lock:
+            future = self.loading.get(index)
+        if future is not None:
+            future.result()
+        with self.lock:
+            data = self.cache.get(index)
+            if data is not None:
+                self.cache.move_to_end(index)
+                self.hits += 1
+        if data is None:
+            self.misses += 1
+            self.download([index])
+            data = self.load(self.git, index)
+        # sequential: the next pieces are probably read next
+        if self.prefetch and self.last_piece is not None and index == self.last_piece + 1:
+            self.schedule(range(index + 1, min(index + 1 + self.prefetch, len(self.pieces))))
+        self.last_piece = index
+        return data
+
+    def download(self, indexes):
+        with self.lock:
+            blobs = sorted({self.pieces[i][0] for i in indexes} & self.missing)
+        if blobs:
+            self.fetch(blobs)
+            with self.lock:
+                self.missing.difference_update(blobs)
+
+    def load(self, git, index):
+        blob, _, codec = self.pieces[index]
+        data = decompress(git.get_object_data(blob)[3], codec)
+        with self.lock:
+            if index not in self.cache:
+                self.cache[index] = data
+                self.cached_bytes += len(data)
+            self.cache.move_to_end(index)
+            # the piece just read always stays
+            while self.cached_bytes > self.cache_size and len(self.cache) > 1:
+                _, evicted = self.cache.popitem(last=False)
+                self.cached_bytes -= len(evicted)
+        return data
+
+    def schedule(self, indexes):
+        with self.lock:
+            indexes = [i for i in indexes if i not in self.cache and i not in self.loading]
+            if not indexes:
+                return
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=1)
+                self.prefetch_git = Git(self.repo_path)
+            future = self.executor.submit(self._prefetch, indexes)
+            for i in indexes:
+                self.loading[i] = future
+
+    def _prefetch(self, indexes):
+        try:
+            self.download(indexes)  # one fetch for every missing piece
+            for i in indexes:
+                self.load(self.prefetch_git, i)
+        finally:
+            with self.lock:
+                for i in indexes:
+                    self.loading.pop(i, None)
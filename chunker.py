@@ -0,0 +1,106 @@
+import hashlib
+
+try:
+    import numpy  # optional: pip install numpy, hashes whole blocks at once
+except ImportError:
+    numpy = None
+
+READ_SIZE = 8 * 1024 * 1024
+BLOCK_SIZE = 256 * 1024  # bytes hashed at once with numpy
+WINDOW = 32  # h = (h << 1) + gear on 32 bits: a byte is shifted out after 32 steps
+MASK32 = (1 << 32) - 1
+
+# gear table: one fixed pseudo random 32 bit value per byte value
+GEAR = [int.from_bytes(hashlib.sha256(bytes([i])).digest()[:4], 'big') for i in range(256)]
+GEAR_ARRAY = numpy.array(GEAR, dtype=numpy.uint32) if numpy is not None else None
+
+class Chunker:
+    """Content-defined chunker (gear rolling hash with normalized chunking, as in FastCDC).
+    Cut points depend on the content only, so inserting bytes only changes the chunks around the edit.
+
+    The hash at a byte only depends on the WINDOW bytes ending there, so with numpy it is computed for
+    a whole block at once. The pure Python loop is the fallback and finds the same cut points."""
+    def __init__(self, min_size=512*1024, avg_size=1024*1024, max_size=3*1024*1024):
+        if not 0 < min_size <= avg_size <= max_size:
+            raise ValueError(f"invalid chunk sizes: {min_size}/{avg_size}/{max_size}")
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        bits = min(max(avg_size.bit_length() - 1, 2), 30)
+        # the highest bits of h: they depend on the most bytes of the window
+        self.mask_s = ((1 << (bits + 1)) - 1) << (31 - bits)  # harder to match before avg_size
+        self.mask_l = ((1 << (bits - 1)) - 1) << (33 - bits)  # easier to match after avg_size
+
+    def cut(self, buf, length, start=0):
+        """Length of the chunk starting at buf[start], buf holding data up to length."""
+        if length - start <= self.min_size:
+            return length - start
+        end = min(length, start + self.max_size)
+        normal = min(end, start + self.avg_size)
+        first = start + self.min_size  # bytes before min_size never end a chunk
+        if numpy is None:
+            return self.cut_python(buf, start, first, normal, end) - start
+        position = self.find(buf, start, first, normal, self.mask_s) or self.find(buf, start, normal, end, self.mask_l)
+        return (position or end) - start
+
+    def find(self, buf, start, lo, hi, mask):
+        """End of the first byte in buf[lo:hi] whose hash matches mask, None if there is none."""
+        data = numpy.frombuffer(buf, dtype=numpy.uint8)
+        mask = numpy.uint32(mask)
+        for block in range(lo, hi, BLOCK_SIZE):
+            block_end = min(block + BLOCK_SIZE, hi)
+            # the window of the first byte starts before the block, never before the chunk
+            first = max(start, block - WINDOW + 1)
+            h = GEAR_ARRAY[data[first:block_end]]
+            # h[i] = sum of gear[i - k] << k for k < WINDOW, doubling the summed span every step
+            shift = 1
+            while shift < WINDOW:
+                h[shift:] += h[:-shift] << numpy.uint32(shift)
+                shift *= 2
+            hits = numpy.flatnonzero((h[block - first:] & mask) == 0)
+            if len(hits):
+                return block + int(hits[0]) + 1
+        return None
+
+    def cut_python(self, buf, start, first, normal, end):
+        """Same as find(), one byte at a time."""
+        gear = GEAR
+        h = 0
+        # the window of the first byte that can end a chunk
+        for b in buf[max(start, first - WINDOW + 1):first]:
+            h = ((h << 1) + gear[b]) & MASK32
+        i = first
+        mask = self.mask_s
+        for b in buf[i:normal]:
+            h = ((h << 1) + gear[b]) & MASK32
+            i += 1
+            if not h & mask:
+                return i
+        mask = self.mask_l
+        for b in buf[i:end]:
+            h = ((h << 1) + gear[b]) & MASK32
+            i += 1
+            if not h & mask:
+                return i
+        return end
+
+    def chunks(self, file_path):
+        """Yield the chunks (bytes) of a file, reading at most READ_SIZE + max_size bytes at a time."""
+        with open(file_path, 'rb') as f:
+            buf = b""
+            start = 0  # start of the next chunk in buf
+            eof = False
+            while True:
+                if not eof and len(buf) - start < self.max_size:
+                    data = f.read(READ_SIZE)
+                    if data:
+                        # only the unchunked tail is copied, once per READ_SIZE
+                        buf = buf[start:] + data
+                        start = 0
+                        continue
+                    eof = True
+                if start == len(buf):
+                    return
+                n = self.cut(buf, len(buf), start)
+                yield buf[start:start + n]
+                start += n
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""Headless command line for cron and CI boxes, no display needed.
+
+    python -m cli push
+    python -m cli pull photos/a.jpg docs/b.pdf --dest ~/Downloads
+    python -m cli ls photos/ --json
+    python -m cli ls --glob '*.jpg' --min-size 5M --since 2025-01-01
+    python -m cli stat photos/a.jpg
+    python -m cli verify
+    python -m cli watch --debounce 2
+    python -m cli compact --keep 24
+
+The remote and the folders come from the GUI's settings.json, --remote / --root / --dest override them.
+Results go to stdout (one JSON object per line with --json), logs and progress to stderr.
+GitPython is only imported by the commands that talk to git: `ls` and `stat` read the cached index.
+"""
+import os
+import re
+import sys
+import json
+import signal
+import argparse
+import datetime
+import threading
+import contextlib
+from utils import get_remote_url, normalize_remote_url, get_workspace_root, get_workspace_key, get_timestamp
+
+EXIT_OK, EXIT_FAILED, EXIT_CANCELLED = 0, 1, 130
+
+# 1. settings
+def load_settings(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def get_remote(args, settings):
+    # normalized as GitManager does: the workspace key of a local path is that of its file:// uri
+    url = normalize_remote_url(args.remote) if args.remote else get_remote_url(settings.get("GitpubURL", ""), settings.get("GitpubPAT", ""))
+    if not url:
+        raise SystemExit("cli :: no remote: set GitpubURL / GitpubPAT in settings.json or pass --remote")
+    return url
+
+def make_manager(args, settings, local_path=None):
+    from git_logic import GitManager
+    gitManager = GitManager(local_path or settings.get("PushRoot") or os.getcwd(), get_remote(args, settings))
+    if args.metrics:
+        from metrics import make_exporter
+        gitManager.metrics.add_exporter(make_exporter(args.metrics))
+    return gitManager
+
+def open_store(args, settings):
+    """Indices of the remote: the cached copy when there is one (no git, no network), else loaded."""
+    if not args.refresh:
+        from index_store import IndexStore
+        # same file as GitManager.open_index_store()
+        store_path = os.path.join(get_workspace_root(), get_workspace_key(get_remote(args, settings)), "index.sqlite3")
+        if os.path.exists(store_path):
+            store = IndexStore(store_path)
+            if store.sha:
+                return store
+    with contextlib.redirect_stdout(sys.stderr):
+        return make_manager(args, settings).get_remote_file_list()
+
+# 2. output
+def emit(args, record, text):
+    print(json.dumps(record, ensure_ascii=False) if args.json else text, file=OUT, flush=True)
+
+def describe(path, version):
+    if not isinstance(version, dict):
+        return {"path": path, "timestamp": get_timestamp(version)}  # pushed by an older version
+    record = {"path": path, "timestamp": version["timestamp"], "size": version.get("size"), "hash": version.get("hash")}
+    if "chunks" in version:
+        record["chunks"] = len(version["chunks"])
+    if version.get("codec"):
+        record["codec"] = version["codec"]
+    return record
+
+def parse_size(text):
+    """bytes of '1500', '10K', '5M', '2G'."""
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3, "T": 1024 ** 4}
+    text = text.strip().upper().rstrip("B")
+    try:
+        return int(float(text[:-1]) * units[text[-1]]) if text and text[-1] in units else int(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size: {text}")
+
+def parse_date(text):
+    try:
+        return datetime.date.fromisoformat(text)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date (YYYY-MM-DD): {text}")
+
+def parse_regex(text):
+    try:
+        re.compile(text)
+    except re.error as e:
+        raise argparse.ArgumentTypeError(f"invalid regular expression: {text} ({e})")
+    return text
+
+def report_progress(args):
+    if not args.progress:
+        return None
+    from progress import format_progress
+    return lambda snapshot: print(format_progress(snapshot), file=sys.stderr, flush=True)
+
+def run(args, gitManager, operation):
+    """Run operation in a worker thread: Ctrl+C / SIGTERM cancel it cooperatively instead of killing git mid-write."""
+    result = {}
+    def target():
+        with contextlib.redirect_stdout(sys.stderr):  # GitManager logs with print
+            result["value"] = operation()
+    worker = threading.Thread(target=target, daemon=True)
+    previous = signal.signal(signal.SIGTERM, lambda *_: gitManager.cancel())
+    try:
+        worker.start()
+        while worker.is_alive():
+            try:
+                worker.join(0.2)
+            except KeyboardInterrupt:
+                gitManager.cancel()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    if gitManager.cancel_event.is_set():
+        raise SystemExit(EXIT_CANCELLED)
+    if "value" not in result:
+        raise SystemExit(EXIT_FAILED)  # the traceback is on stderr
+    return result["value"]
+
+# 3. commands
+def cmd_push(args, settings):
+    root = args.root or settings.get("PushRoot")
+    if not root:
+        raise SystemExit("cli :: no folder to push: set PushRoot in settings.json or pass --root")
+    gitManager = make_manager(args, settings, root)
+    ok = run(args, gitManager, lambda: gitManager.push(progress=report_progress(args), resume=not args.no_resume))
+    emit(args, {"command": "push", "root": os.path.abspath(root), "ok": bool(ok)}, "pushed" if ok else "push failed")
+    return EXIT_OK if ok else EXIT_FAILED
+
+def cmd_pull(args, settings):
+    dest = args.dest or settings.get("PullRoot") or os.getcwd()
+    os.makedirs(dest, exist_ok=True)
+    gitManager = make_manager(args, settings)
+    progress = report_progress(args)
+    placed = run(args, gitManager, lambda: gitManager.get_file(args.paths, dest, show_process=progress is not None,
+                                                              progress=progress, pin=args.pin))
+    for path in args.paths:
+        if path in placed:
+            emit(args, {"path": path, "output": placed[path]}, f"{path} -> {placed[path]}")
+        else:
+            emit(args, {"path": path, "error": "not found"}, f"{path} :: not found")
+    return EXIT_OK if all(path in placed for path in args.paths) else EXIT_FAILED
+
+def cmd_ls(args, settings):
+    store = open_store(args, settings)
+    rows = store.query(args.prefix, args.glob, args.regex, args.ext, args.min_size, args.max_size, args.since, args.until, args.limit)
+    for path, size, timestamp in rows:
+        record = describe(path, store.latest(path)) if args.json else None
+        emit(args, record, f"{'' if size is None else size:>12}  {timestamp}  {path}" if args.long else path)
+    return EXIT_OK
+
+def cmd_stat(args, settings):
+    store = open_store(args, settings)
+    status = EXIT_OK
+    for path in args.paths:
+        if path not in store:
+            emit(args, {"path": path, "error": "not found"}, f"{path} :: not found")
+            status = EXIT_FAILED
+            continue
+        versions = [describe(path, version) for version in store[path]]
+        text = "\n".join([path] + [f"  {v['timestamp']}  {v.get('size', '')}  {v.get('hash', '')}" for v in versions])
+        emit(args, {"path": path, "versions": versions}, text)
+    return status
+
+def cmd_verify(args, settings):
+    """Read every stored file back and compare it with the content hash in the index."""
+    from manifest import hash_stream
+    gitManager = make_manager(args, settings)
+    def verify():
+        results = []
+        store = gitManager.load_indices()
+        gitManager.refresh_indices = False  # loaded once: open() reads the same copy, no ls-remote per file
+        for path in args.paths or sorted(store):
+            gitManager.check_cancelled()
+            version = store.latest(path) if path in store else None
+            if version is None:
+                results.append({"path": path, "status": "missing"})
+                continue
+            try:
+                with gitManager.open(path) as f:
+                    content_hash = hash_stream(f, f.size)
+            except Exception as e:
+                results.append({"path": path, "status": "error", "error": str(e)})
+                continue
+            expected = version.get("hash") if isinstance(version, dict) else None
+            status = "readable" if expected is None else "ok" if content_hash == expected else "mismatch"
+            results.append({"path": path, "status": status, "hash": content_hash})
+        return results
+    results = run(args, gitManager, verify)
+    for record in results:
+        emit(args, record, f"{record['status']:>9}  {record['path']}" + (f" ({record['error']})" if "error" in record else ""))
+    return EXIT_OK if all(record["status"] in ("ok", "readable") for record in results) else EXIT_FAILED
+
+def cmd_watch(args, settings):
+    """Push what changes under the folder until Ctrl+C / SIGTERM."""
+    from watcher import Watch
+    root = args.root or settings.get("PushRoot")
+    if not root:
+        raise SystemExit("cli :: no folder to watch: set PushRoot in settings.json or pass --root")
+    gitManager = make_manager(args, settings, root)
+    def pushed(paths, ok):
+        count = "all" if paths is None else len(paths)
+        emit(args, {"command": "push", "paths": paths, "ok": bool(ok)}, f"{'pushed' if ok else 'push failed'} ({count} paths)")
+    watch = Watch(gitManager, args.debounce, args.max_delay, args.interval, on_push=pushed)
+    def stop(*_):
+        watch.stop()
+    previous = signal.signal(signal.SIGTERM, stop)
+    def target():
+        with contextlib.redirect_stdout(sys.stderr):
+            watch.run()
+    worker = threading.Thread(target=target, daemon=True)
+    try:
+        worker.start()
+        while worker.is_alive():
+            try:
+                worker.join(0.5)
+            except KeyboardInterrupt:
+                stop()
+    finally:
+        signal.signal(signal.SIGTERM, previous)
+    return EXIT_OK
+
+def cmd_compact(args, settings):
+    """Fold old timestamp branches into archive branches, so the remote advertises fewer refs."""
+    gitManager = make_manager(args, settings)
+    report = run(args, gitManager, lambda: gitManager.compact(args.keep, args.per_archive))
+    if "error" in report:
+        text = f"compact failed: {report['error']}"
+    elif "compacted" in report:
+        text = (f"compacted {report['compacted']} branches into {report['archives']} archives, "
+                f"{report['refs_before']} -> {report['refs_after']} refs")
+    else:
+        text = f"nothing to compact ({report['refs_before']} refs)"
+    emit(args, {"command": "compact", **report}, text)
+    return EXIT_FAILED if "error" in report else EXIT_OK
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m cli", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--settings", default="settings.json", help="settings file of the GUI")
+    parser.add_argument("--remote", help="git remote url or local bare repository, instead of the settings")
+    parser.add_argument("--json", action="store_true", help="one JSON object per line")
+    parser.add_argument("--progress", action="store_true", help="progress lines on stderr")
+    parser.add_argument("--metrics", help="also write the timed phases to this file: JSON lines, Prometheus text for *.prom")
+    commands = parser.add_subparsers(dest="command", required=True)
+    push = commands.add_parser("push", help="push the changed files of a folder")
+    push.add_argument("--root", help="folder to push, instead of PushRoot")
+    push.add_argument("--no-resume", action="store_true", help="discard an interrupted push instead of finishing it")
+    pull = commands.add_parser("pull", help="download files")
+    pull.add_argument("paths", nargs="+")
+    pull.add_argument("--dest", help="download folder, instead of PullRoot")
+    pull.add_argument("--pin", action="store_true", help="also keep the files in the download cache for offline use")
+    ls = commands.add_parser("ls", help="list stored files")
+    ls.add_argument("prefix", nargs="?", default="")
+    ls.add_argument("-l", "--long", action="store_true", help="with size and timestamp")
+    ls.add_argument("--glob", help="shell pattern of the whole path, e.g. 'photos/*.jpg'")
+    ls.add_argument("--regex", type=parse_regex, help="regular expression searched in the path")
+    ls.add_argument("--ext", help="extension, e.g. jpg")
+    ls.add_argument("--min-size", type=parse_size, help="at least this size, e.g. 5M")
+    ls.add_argument("--max-size", type=parse_size, help="at most this size")
+    ls.add_argument("--since", type=parse_date, help="pushed on or after YYYY-MM-DD")
+    ls.add_argument("--until", type=parse_date, help="pushed on or before YYYY-MM-DD")
+    ls.add_argument("--limit", type=int, help="at most this many files")
+    ls.add_argument("--refresh", action="store_true", help="check the remote for a newer index first")
+    stat = commands.add_parser("stat", help="every version of files")
+    stat.add_argument("paths", nargs="+")
+    stat.add_argument("--refresh", action="store_true", help="check the remote for a newer index first")
+    verify = commands.add_parser("verify", help="download files and check them against their content hash")
+    verify.add_argument("paths", nargs="*", help="all files when omitted")
+    watch = commands.add_parser("watch", help="keep pushing what changes in the folder")
+    watch.add_argument("--root", help="folder to watch, instead of PushRoot")
+    watch.add_argument("--debounce", type=float, default=2.0, help="seconds without change before a batch is pushed")
+    watch.add_argument("--max-delay", type=float, default=30.0, help="push at the latest this long after the first change")
+    watch.add_argument("--interval", type=float, default=5.0, help="polling interval where inotify is not available")
+    compact = commands.add_parser("compact", help="fold old timestamp branches into archive branches")
+    compact.add_argument("--keep", type=int, default=24, help="latest timestamp branches left as they are")
+    compact.add_argument("--per-archive", type=int, default=1000, help="timestamp branches per archive branch")
+    args = parser.parse_args()
+
+    settings = load_settings(args.settings)
+    handlers = {"push": cmd_push, "pull": cmd_pull, "ls": cmd_ls, "stat": cmd_stat, "verify": cmd_verify, "watch": cmd_watch,
+                "compact": cmd_compact}
+    return handlers[args.command](args, settings)
+
+OUT = sys.stdout  # results, everything GitManager prints goes to stderr
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+import math
+import zlib
+from collections import Counter
+
+try:
+    import zstandard  # optional: pip install zstandard
+except ImportError:
+    zstandard = None
+
+SAMPLE_SIZE = 64 * 1024
+ENTROPY_THRESHOLD = 7.5  # bits per byte, jpeg / mp4 / zip are close to 8
+MIN_SAVING = 0.05  # keep the raw bytes unless compression saves at least 5%
+
+def entropy(data):
+    """Shannon entropy of data in bits per byte (0 - 8)."""
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(data).values())
+
+def sample(data):
+    """Up to three SAMPLE_SIZE blocks of data: head, middle and tail."""
+    if len(data) <= 3 * SAMPLE_SIZE:
+        return data
+    middle = (len(data) - SAMPLE_SIZE) // 2
+    return data[:SAMPLE_SIZE] + data[middle:middle + SAMPLE_SIZE] + data[-SAMPLE_SIZE:]
+
+class ZlibCodec:
+    name = "zlib"
+    def __init__(self, level=6):
+        self.level = level
+
+    def compress(self, data):
+        return zlib.compress(data, self.level)
+
+    def decompressor(self):
+        return zlib.decompressobj()
+
+class ZstdCodec:
+    name = "zstd"
+    def __init__(self, level=3):
+        if zstandard is None:
+            raise RuntimeError("zstd compression needs the zstandard package (pip install zstandard)")
+        self.compressor = zstandard.ZstdCompressor(level=level)
+
+    def compress(self, data):
+        return self.compressor.compress(data)
+
+    def decompressor(self):
+        # streaming, unlike ZstdDecompressor().decompress() which needs the content size in the frame
+        return zstandard.ZstdDecompressor().decompressobj()
+
+CODECS = {"zlib": ZlibCodec, "zstd": ZstdCodec}
+
+def get_codec(name, level=None):
+    if name not in CODECS:
+        raise ValueError(f"unknown codec: {name}")
+    return CODECS[name]() if level is None else CODECS[name](level)
+
+def parse_compression(setting):
+    """'zstd:19' / 'zlib' / '' -> (codec name or None, level or None)"""
+    if not setting or setting == "none":
+        return None, None
+    name, _, level = setting.partition(":")
+    get_codec(name)  # fail early on unknown / unavailable codecs
+    return name, int(level) if level else None
+
+class Compressor:
+    """Compresses what is worth it: data that looks random is left alone, so is data that barely shrinks."""
+    def __init__(self, name, level=None):
+        self.codec = get_codec(name, level)
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+
+    def compress(self, data):
+        """(stored bytes, codec name or None)"""
+        stored, codec = data, None
+        if entropy(sample(data)) < ENTROPY_THRESHOLD:
+            compressed = self.codec.compress(data)
+            if len(compressed) <= len(data) * (1 - MIN_SAVING):
+                stored, codec = compressed, self.codec.name
+        self.raw_bytes += len(data)
+        self.stored_bytes += len(stored)
+        return stored, codec
+
+class Decompressor:
+    """Streams data stored with codec back to the original bytes (pass-through for codec None)."""
+    def __init__(self, codec):
+        self.stream = get_codec(codec).decompressor() if codec else None
+
+    def decompress(self, block):
+        return self.stream.decompress(block) if self.stream else block
+
+    def flush(self):
+        return self.stream.flush() if self.stream and hasattr(self.stream, "flush") else b""
+
+def decompress(data, codec):
+    """Whole blob stored with codec back to the original bytes."""
+    if not codec:
+        return data
+    decompressor = Decompressor(codec)
+    return decompressor.decompress(data) + decompressor.flush()
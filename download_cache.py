@@ -0,0 +1,135 @@
+import os
+import json
+import shutil
+import threading
+from manifest import hash_file
+
+try:
+    import fcntl
+except ImportError:  # windows
+    fcntl = None
+
+FICLONE = 0x40049409  # linux ioctl: copy-on-write clone of a whole file (btrfs, xfs, ...)
+
+def reflink(src, dst):
+    """Copy-on-write copy of src, raises OSError where the filesystem cannot clone.
+    dst is left empty then, not removed: it may be a name reserved by unique_file_path()."""
+    if fcntl is None:
+        raise OSError("reflink is not supported on this platform")
+    with open(src, 'rb') as s, open(dst, 'wb') as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+def place(src, dst):
+    """A copy of src at dst, copy-on-write when the filesystem can: never the same file, so editing one
+    leaves the other intact. dst may exist (a reserved name), it is overwritten. Returns how it was placed."""
+    try:
+        reflink(src, dst)
+        return "reflink"
+    except OSError:
+        pass  # other filesystem / not supported
+    shutil.copyfile(src, dst)
+    return "copy"
+
+class DownloadCache:
+    """Downloaded files by content hash (the git blob id in the index), shared by every get_file.
+
+    Entries are read-only copies, placed files are copies of them: the user's files are theirs to edit.
+    An entry is checked against its hash before it is placed.
+    Least recently used entries are evicted above max_size bytes, pinned ones never."""
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        self.pins_path = os.path.join(path, "pins.json")
+        os.makedirs(os.path.join(path, "objects"), exist_ok=True)
+        self.pins = {}  # pins[content hash] = [paths pinned with it]
+        if os.path.exists(self.pins_path):
+            with open(self.pins_path, 'r', encoding='utf-8') as f:
+                self.pins = json.load(f)
+
+    def entry_path(self, content_hash):
+        return os.path.join(self.path, "objects", content_hash[:2], content_hash)
+
+    def __contains__(self, content_hash):
+        return os.path.exists(self.entry_path(content_hash))
+
+    def get(self, content_hash, output_path, size):
+        """Place the cached content at output_path, False on a miss. A damaged entry is removed (a miss)."""
+        entry = self.entry_path(content_hash)
+        try:
+            if os.path.getsize(entry) != size or hash_file(entry, size) != content_hash:
+                print(f"Warning :: cache entry {content_hash} is damaged, removed")
+                self.remove(entry)
+                return False
+            os.utime(entry)  # mtime is the last use
+        except FileNotFoundError:
+            return False
+        place(entry, output_path)
+        return True
+
+    def add(self, content_hash, file_path):
+        """Keep a copy of a downloaded file. Call evict() once done adding."""
+        if self.max_size <= 0 and content_hash not in self.pins:
+            return
+        entry = self.entry_path(content_hash)
+        if os.path.exists(entry):
+            os.utime(entry)
+            return
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        temp_path = f"{entry}.{threading.get_ident()}.tmp"
+        place(file_path, temp_path)
+        os.chmod(temp_path, 0o444)  # the copy only
+        os.replace(temp_path, entry)  # never a half written entry
+
+    def pin(self, content_hash, path):
+        with self.lock:
+            paths = self.pins.setdefault(content_hash, [])
+            if path not in paths:
+                paths.append(path)
+            self.save_pins()
+
+    def unpin(self, path):
+        with self.lock:
+            for content_hash in list(self.pins):
+                if path in self.pins[content_hash]:
+                    self.pins[content_hash].remove(path)
+                    if not self.pins[content_hash]:
+                        del self.pins[content_hash]
+            self.save_pins()
+        self.evict()
+
+    def save_pins(self):
+        temp_path = self.pins_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.pins, f, indent=4)
+        os.replace(temp_path, self.pins_path)
+
+    def entries(self):
+        """[(last use, size, content hash)] of every entry."""
+        entries = []
+        objects = os.path.join(self.path, "objects")
+        for directory in os.scandir(objects):
+            if not directory.is_dir():
+                continue
+            for entry in os.scandir(directory.path):
+                if not entry.name.endswith(".tmp"):
+                    st = entry.stat()
+                    entries.append((st.st_mtime, st.st_size, entry.name))
+        return entries
+
+    def evict(self):
+        """Remove the least recently used unpinned entries until the cache fits in max_size."""
+        with self.lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            for _, size, content_hash in entries:
+                if total <= self.max_size:
+                    break
+                if content_hash in self.pins:
+                    continue
+                self.remove(self.entry_path(content_hash))
+                total -= size
+
+    def remove(self, entry):
+        os.chmod(entry, 0o644)  # windows cannot remove read-only files
+        os.remove(entry)
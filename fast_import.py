@@ -0,0 +1,133 @@
+import subprocess
+from git.exc import GitCommandError  # type: ignore
+
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+def quote_path(path):
+    # fast-import takes paths unquoted unless they start with '"' or contain a newline
+    if path.startswith('"') or "\n" in path or "\\" in path:
+        return '"' + path.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    return path
+
+class FastImport:
+    """Streams blobs and one commit into the object database with `git fast-import`.
+    Nothing is written to the working tree and file contents are never held in memory."""
+    def __init__(self, repo, force=False, compression=None):
+        self.repo = repo
+        options = ['--quiet', '--done'] + (['--force'] if force else [])
+        # compression: zlib level of the pack, 0 when the blobs are compressed already
+        git = repo.git(c=f"pack.compression={compression}") if compression is not None else repo.git
+        self.process = git.fast_import(*options, istream=subprocess.PIPE, as_process=True)
+        self.stdin = self.process.proc.stdin
+        self.files = []  # [(path in commit, mode, mark or object id)]
+        self.marks = 0
+        self.bytes_written = 0
+
+    def _blob_header(self, size):
+        self.marks += 1
+        self.stdin.write(b"blob\nmark :%d\ndata %d\n" % (self.marks, size))
+        return self.marks
+
+    def add_file(self, path, file_path, size):
+        """Stream size bytes of file_path as the blob at path."""
+        mark = self._blob_header(size)
+        remaining = size
+        with open(file_path, 'rb') as f:
+            while remaining:
+                block = f.read(min(STREAM_BLOCK_SIZE, remaining))
+                if not block:
+                    raise IOError(f"{file_path} changed while pushing")
+                self.stdin.write(block)
+                remaining -= len(block)
+        self.stdin.write(b"\n")
+        self.files.append((path, "100644", f":{mark}"))
+        self.bytes_written += size
+
+    def add_data(self, path, data):
+        mark = self._blob_header(len(data))
+        self.stdin.write(data)
+        self.stdin.write(b"\n")
+        self.files.append((path, "100644", f":{mark}"))
+        self.bytes_written += len(data)
+
+    def add_tree(self, path, tree):
+        """Put an existing tree object at path. Nothing under it is read or written again."""
+        self.files.append((path, "040000", tree))
+
+    def commit(self, branch, message, parent=None, deletes=()):
+        """Write a commit of every added file to refs/heads/branch and wait for fast-import.
+        Without parent the commit is parentless, with parent only the added and deleted paths change."""
+        committer = self.repo.git.var("GIT_COMMITTER_IDENT")
+        message = message.encode()
+        self.stdin.write(f"commit refs/heads/{branch}\ncommitter {committer}\n".encode())
+        self.stdin.write(b"data %d\n%s\n" % (len(message), message))
+        if parent:
+            self.stdin.write(f"from {parent}\n".encode())
+        for path in deletes:
+            self.stdin.write(f"D {quote_path(path)}\n".encode())
+        for path, mode, dataref in self.files:
+            self.stdin.write(f"M {mode} {dataref} {quote_path(path)}\n".encode())
+        self.stdin.write(b"\ndone\n")
+        self.close()
+
+    def abort(self):
+        """Stop without a commit. Blobs written so far stay unreferenced in the object database."""
+        if not self.stdin.closed:
+            try:
+                self.stdin.write(b"done\n")
+                self.close()
+            except (GitCommandError, OSError):
+                pass  # stopped in the middle of a blob: fast-import fails on the truncated stream, nothing is committed
+
+    def close(self):
+        self.stdin.close()
+        self.process.wait()  # raises GitCommandError if fast-import failed
+
+class BatchImport:
+    """FastImport split into commits of at most max_bytes on one branch, each on top of the previous one.
+    on_commit(sha, size, paths) is called after every commit, so a batch can be pushed while the next one is written.
+    A single file bigger than max_bytes still goes into one batch. head: commit to continue the branch from."""
+    def __init__(self, repo, branch, message, max_bytes, on_commit, compression=None, head=None):
+        self.repo = repo
+        self.branch = branch
+        self.message = message
+        self.max_bytes = max_bytes
+        self.on_commit = on_commit
+        self.compression = compression
+        self.current: FastImport = None  # batch being written
+        self.head = head  # last commit of the branch
+        self.batches = 0
+        self.committed_bytes = 0
+
+    @property
+    def bytes_written(self):
+        return self.committed_bytes + (self.current.bytes_written if self.current else 0)
+
+    def _reserve(self, size):
+        if self.current and self.current.files and self.current.bytes_written + size > self.max_bytes:
+            self.flush()
+        if self.current is None:
+            self.current = FastImport(self.repo, compression=self.compression)
+        return self.current
+
+    def add_file(self, path, file_path, size):
+        self._reserve(size).add_file(path, file_path, size)
+
+    def add_data(self, path, data):
+        self._reserve(len(data)).add_data(path, data)
+
+    def flush(self):
+        """Commit the current batch, if it has any file."""
+        if self.current is None or not self.current.files:
+            return
+        fast_import, self.current = self.current, None
+        fast_import.commit(self.branch, self.message, parent=self.head)
+        self.head = self.repo.git.rev_parse(f"refs/heads/{self.branch}")
+        self.batches += 1
+        self.committed_bytes += fast_import.bytes_written
+        self.on_commit(self.head, fast_import.bytes_written, [path for path, _, _ in fast_import.files])
+
+    def abort(self):
+        if self.current is not None:
+            self.current.abort()
+            self.current = None
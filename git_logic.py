@@ -1,311 +1,1085 @@
 # -*- coding: utf-8 -*-
 import os
 import re
-from git import Repo, GitCommandError # type: ignore
+import copy
+import json
+import time
+import hashlib
+import tempfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from git import Repo, Git, GitCommandError # type: ignore
 from dotenv import load_dotenv
-from typing import List, Dict, Set, Tuple
+from typing import List
 from split_file import *
+from manifest import *
+from chunker import *
+from compression import Compressor, Decompressor, decompress, parse_compression
+from fast_import import FastImport, BatchImport, STREAM_BLOCK_SIZE
+from chunk_reader import ChunkReader
+from download_cache import DownloadCache
+from index_store import IndexStore, shard_of
+from metrics import Metrics, ConsoleExporter, make_exporter
+from progress import Progress, OperationCancelled, run_git
+from journal import Journal
+from mirror import MirrorUse, object_store_size, prune_blobs
 from utils import *
     
 class GitManager:
-    def __init__(self, local_path: str):
+    def __init__(self, local_path: str, repo_url: str = ""):
         load_dotenv()
         self.repo_url = ""
         self.local_path = os.path.abspath(local_path)
         self.index_branch_name: str = 'index'
-        self.index_file_name: str = 'indices'
-        self.index_directory: str = '.index'
+        self.index_file_name: str = 'indices'  # old monolithic index, replaced by shards
+        self.shard_directory: str = 'shards'
+        self.archive_file_name: str = 'archives'  # archives[timestamp] = archive branch holding it
+        self.archive_prefix: str = 'archive'
+        self.chunk_directory: str = '.chunks'
+        self.excluded_folders = ['.git', '.index', '.download', '.cache', self.chunk_directory]  # incl. leftovers of older versions
+        self.excluded_files = ['.DS_Store', '.gitignore']
+        # persistent workspace per remote, outside the user's folder
+        self.workspace_root: str = get_workspace_root()
+        self.mirror_directory: str = 'mirror.git'
+        self.manifest_directory: str = 'manifests'
+        self.index_store_file_name: str = 'index.sqlite3'
+        self.cache_directory: str = 'cache'
         self.MAX_FILE_SIZE = 3 * 1024 * 1024
+        # content-defined chunking of files >= MAX_FILE_SIZE
+        self.CHUNK_MIN_SIZE = 512 * 1024
+        self.CHUNK_AVG_SIZE = 1024 * 1024
+        self.CHUNK_MAX_SIZE = self.MAX_FILE_SIZE
+        # optional compression of pushed files and chunks: "zstd:3", "zlib:6", "" to store raw bytes
+        self.COMPRESSION = os.getenv("GITHUB_CLOUD_COMPRESSION", "")
+        # a push is committed and uploaded in batches of about this many bytes, under the host's push limit
+        self.PUSH_BATCH_SIZE = int(os.getenv("GITHUB_CLOUD_PUSH_BATCH_SIZE", 1024 * 1024 * 1024))
+        # downloaded files kept by content hash for the next get_file, 0 keeps pinned files only
+        self.CACHE_SIZE = int(os.getenv("GITHUB_CLOUD_CACHE_SIZE", 10 * 1024 * 1024 * 1024))
+        # blobs the mirror may gain before the ones the remote has are dropped again (pushed and downloaded files)
+        self.MIRROR_SIZE = int(os.getenv("GITHUB_CLOUD_MIRROR_SIZE", 16 * 1024 * 1024))
+        self.DOWNLOAD_WORKERS = 4
+        self.CHUNKS_PER_WORKER = 16
+        self.repo: Repo = None  # bare mirror: object store and refs shared by every operation
+        self.index_store: IndexStore = None  # local copy of the remote indices
+        self.download_cache: DownloadCache = None
+        # timed phases of every operation: add exporters (JSON lines, memory, Prometheus, GUI log) as needed
+        self.metrics = Metrics(ConsoleExporter())
+        if os.getenv("GITHUB_CLOUD_METRICS"):  # metrics.jsonl, or metrics.prom for Prometheus
+            self.metrics.add_exporter(make_exporter(os.getenv("GITHUB_CLOUD_METRICS")))
+        self.progress: Progress = Progress()  # byte progress of the running operation
+        self.cancel_event = threading.Event()  # set by cancel(), checked at every cancellation point
+        # runs the git commands that talk to the remote: AsyncGitManager runs them on its event loop instead
+        self.run_git = run_git
+        self.refresh_indices = True  # False: use the cached indices as they are, the caller refreshes them
+        self.refs_lock = threading.Lock()  # fetches writing refs (and the shallow file) of the mirror, shared by fork()s
+        self.mirror_use = MirrorUse()  # operations writing to the mirror, shared by fork()s: see prune_mirror()
+        if repo_url:
+            self.set_remote_url(repo_url)
         
     def set_repo_url(self, git_user, git_repo, git_pat):
-        print(f"git user: {git_user} git_repo: {git_repo} git_pat: {git_pat}")
         if git_user and git_repo and git_pat:
-            self.repo_url = f"https://{git_pat}@github.com/{git_user}/{git_repo}.git"
+            self.set_remote_url(f"https://{git_pat}@github.com/{git_user}/{git_repo}.git")
+
+    def fork(self):
+        """A GitManager of the same folder and remote that can run next to this one:
+        its own repository handle, index connection, progress and cancellation."""
+        forked = copy.copy(self)
+        forked.repo = None
+        forked.index_store = None
+        forked.progress = Progress()
+        forked.cancel_event = threading.Event()
+        return forked
+
+    def set_remote_url(self, repo_url):
+        """Any git remote: https://, ssh, file:// or the path of a local bare repository."""
+        self.repo_url = normalize_remote_url(repo_url)
             
+    def get_workspace_path(self):
+        return make_hidden_dir(os.path.join(self.workspace_root, get_workspace_key(self.repo_url)))
+
     def git_init(self):
-        # 0. remove previous .git
-        self.remove_git(self.local_path)
-        
-        # 1. init repo
-        try:
-            self.repo = Repo(self.local_path)
-        except Exception as e:
-            self.repo = Repo.init(self.local_path)
-        self.set_git_config(self.repo)
-        
-        # 2. add remote
+        """Open the persistent bare mirror (created on first use). Fetches only ever add to it."""
+        mirror_path = os.path.join(self.get_workspace_path(), self.mirror_directory)
+        if self.repo is None or os.path.abspath(self.repo.git_dir) != mirror_path:
+            try:
+                self.repo = Repo(mirror_path)
+            except Exception:
+                self.repo = Repo.init(mirror_path, bare=True)
+                self.set_git_config(self.repo)
+            
+        # add remote, the PAT in the url may have changed
         try:
-            self.origin = self.repo.create_remote('origin', self.repo_url)
-        except GitCommandError as e:
             self.origin = self.repo.remote('origin')
-            print(f"Remote 'origin' already exists.")
+            if self.origin.url != self.repo_url:
+                self.origin.set_url(self.repo_url)
+        except ValueError:
+            self.origin = self.repo.create_remote('origin', self.repo_url)
+            self.set_partial_clone_config(self.repo)
+        return self.repo
     
-    def push_index(self):
-        self.index_repo.git.add(A=True)
-        self.index_repo.git.commit('--allow-empty', '-m', 'commited in git_init')
-        self.index_repo.git.push("--force", "origin", self.index_branch_name)
+    def push_index(self, store: IndexStore, touched, refspecs=(), archives=False):
+        """Commit only the touched shards (and the archives file) on top of the fetched index commit and push it.
+        Extra refspecs go in the same atomic push."""
+        parent = self.repo.git.rev_parse(f"refs/remotes/origin/{self.index_branch_name}")
+        deletes = []
+        if self.repo.git.ls_tree(parent, '--', self.index_file_name):
+            # first push after the monolithic index: write every shard once
+            touched = store.shards()
+            deletes.append(self.index_file_name)
+
+        fast_import = FastImport(self.repo, force=True)
+        blobs = {}
+        for shard in sorted(touched):
+            data = store.export_shard(shard)
+            fast_import.add_data(f"{self.shard_directory}/{shard}", data)
+            blobs[shard] = hash_bytes(data)
+        if archives:
+            data = store.export_archives()
+            fast_import.add_data(self.archive_file_name, data)
+        fast_import.commit(self.index_branch_name, 'commited in push', parent=parent, deletes=deletes)
+
+        # not forced: a concurrent index push is rejected instead of overwritten
+        index_refspec = f"refs/heads/{self.index_branch_name}:refs/heads/{self.index_branch_name}"
+        if refspecs:
+            self.run_git(self.repo.git, "push", "--atomic", "origin", index_refspec, *refspecs)
+        else:
+            self.run_git(self.repo.git, "push", "origin", index_refspec)
+        self.repo.git.update_ref(f"refs/remotes/origin/{self.index_branch_name}", f"refs/heads/{self.index_branch_name}")
+        for shard, blob in blobs.items():
+            store.set_shard_blob(shard, blob)
+        if archives:
+            store.set_archives_blob(hash_bytes(data))
+        store.commit(self.repo.git.rev_parse(f"refs/heads/{self.index_branch_name}"))
     
-    def push(self):
+    def push(self, progress=None, resume=True, paths=None):
+        """progress: optional callback receiving progress.Progress snapshots (bytes, percent, ETA) while pushing.
+        resume: finish an interrupted push from its journal first, instead of discarding it.
+        paths: push only these relative paths (watch mode), the whole folder is scanned by default.
+        Returns False if the push failed or was cancelled."""
+        self.progress = Progress(progress)
+        self.cancel_event.clear()
+        with self.metrics.span("push"):
+            with self.mirror_use:
+                pushed = self._push(resume, paths)
+            self.prune_mirror()
+            return pushed
+
+    def cancel(self):
+        """Stop the running push / download at its next cancellation point. Safe to call from any thread."""
+        self.cancel_event.set()
+
+    def check_cancelled(self):
+        if self.cancel_event.is_set():
+            raise OperationCancelled()
+
+    def _push(self, resume, paths=None):
         # 0. git init
         self.git_init()
         
         # 1. git actions
-        indices = self.load_indices()
-        # print("Loaded: ", indices)
+        store = self.load_indices()
+        journal = Journal(self.get_journal_path())
+        fast_import = None
+        timestamp = journal.timestamp
+        uploading = []  # [(future, sha, paths)] of the batch in flight
+        staged_files = {}  # staged_files[relative path] = version, staged_chunks[chunk path] = (hash, codec)
+        staged_chunks = {}
+
+        def landed():
+            # one batch in flight: pushes stay in order and fail early
+            future, sha, batch = uploading.pop()
+            future.result()
+            journal.land(timestamp, sha, {path: staged_files[path] for path in batch if path in staged_files},
+                         dict(staged_chunks[path] for path in batch if path in staged_chunks))
         try:
-            # 1-1. make branch
-            print("1-1. make branch")
-            timestamp: str = generate_timestamp()
-            self.repo.git.checkout(f"{timestamp}", b=True)
-
-            # 1-2. write index & get duplicated
-            print("1-3. write index")
-            written_data = self.write_indices(timestamp, indices)
-            duplicated = written_data[0]
-            data = written_data[1]
+            # 1-0. an interrupted push: only what is not confirmed yet, then what changed since
+            head = None  # last landed batch of the push continued here
+            if journal.state == "landed":
+                head = self.continue_landed(journal) if resume else None
+                if head is None:
+                    self.discard_landed(journal)
+            elif journal.pending and not (resume and self.resume_push(store, journal)):
+                journal.clear()
+
+            # 1-1. write index & get changed files
+            timestamp: str = journal.timestamp if head else generate_timestamp()
+            self.progress.begin("scan")
+            with self.metrics.span("scan"):
+                manifest = Manifest(self.get_manifest_path())
+                written_data = self.write_indices(timestamp, store, manifest, paths, journal.landed_files if head else None)
+            changed = written_data[0]
+            versions = written_data[1]
             big_files = written_data[2]
+            if not versions:
+                print("git push :: nothing changed since last push")
+                manifest.save()  # every scanned file is uploaded: no need to hash them again
+                return True
+            stage_bytes = sum(file_size for _, _, file_size, _ in changed)
+            chunk_bytes = sum(version["size"] for _, version in big_files)
+            # upload is corrected once the pack size is known
+            self.progress.plan({"stage": stage_bytes, "chunk": chunk_bytes, "upload": stage_bytes + chunk_bytes})
+
+            # 1-2. stream changed files into the object database, one commit per batch
+            #      every batch is pushed by the upload thread while the next one is written,
+            #      the journal records each one that landed
+            compressor = self.get_compressor()
+            with ThreadPoolExecutor(max_workers=1) as uploads:
+                push_span = self.metrics.current()
+                def upload(sha, size, batch):
+                    if uploading:
+                        landed()
+                    uploading.append((uploads.submit(self.push_branch, timestamp, size, sha, push_span), sha, batch))
+                # pack zlib would only burn CPU on blobs that are compressed already or did not compress
+                fast_import = BatchImport(self.repo, timestamp, 'commited in push', self.PUSH_BATCH_SIZE, upload,
+                                          compression=0 if compressor else None, head=head)
+                self.progress.begin("stage")
+                with self.metrics.span("stage") as span:
+                    for rel_path, file_path, file_size, version in changed:
+                        self.check_cancelled()
+                        if compressor:
+                            with open(file_path, 'rb') as f:
+                                data, codec = compressor.compress(f.read())
+                            fast_import.add_data(rel_path, data)
+                            if codec: version["codec"] = codec
+                        else:
+                            fast_import.add_file(rel_path, file_path, file_size)
+                        staged_files[rel_path] = version
+                        span.add("files")
+                        span.add("bytes", file_size)
+                        self.progress.advance(file_size, rel_path)
+
+                # 1-3. chunk big files
+                self.progress.begin("chunk")
+                with self.metrics.span("chunk"):
+                    landed_chunks = journal.landed_chunks if head else {}
+                    self.write_chunks(timestamp, big_files, store, fast_import, compressor, landed_chunks, staged_chunks)
+
+                # 1-4. commit the last batch, from here on the push can be resumed
+                self.check_cancelled()
+                self.progress.begin("commit")
+                with self.metrics.span("commit") as span:
+                    fast_import.flush()
+                    span.add("bytes", fast_import.bytes_written)
+                    span.add("batches", fast_import.batches)
+                    if compressor:
+                        span.add("raw_bytes", compressor.raw_bytes)
+                journal.start(timestamp, versions)
+
+                # 1-5. wait for the last upload
+                self.progress.begin("upload")
+                if uploading:
+                    landed()
+                self.progress.end()
+            journal.update("pushed")
+            manifest.save()
             
-            # 1-3. handle big files
-            for big_file in big_files:
-                big_file.split_file()
-
-            # 1-4. add all
-            print("1-2. add all")
-            self.repo.git.add(A=True)
-
-            # 1-5. unstage duplicated
-            print("1-4. unstage duplicate")
-            # print("@duplicated: ", duplicated)
-            for file in duplicated:
-                self.repo.git.reset(file)
-    
-            # 1-6. commit
-            print("===========================")
-            print(self.repo.git.status())
-            print("===========================")
-            print("1-5. commit")
-            self.repo.git.commit('--allow-empty', '-m', 'commited in push')
-            # print(f"status: {self.repo.git.status()}")
-            
-            # 1-7. push
-            print("1-6. push")
-            self.repo.git.push("origin", timestamp)
-            
-            # 1-8. save index
-            print("1-7. save index")
-            self.save_indices(data)
-            
-            # 1-9. push git index
-            print("1-8. push git index")
-            self.push_index()
-            
-            # 1-10. remove splitted
-            for big_file in big_files:
-                for file in big_file.splited_file_path:
-                    os.remove(file)
-                
+            # 1-6. save index: every batch landed, the files appear at once
+            self.save_index(store, versions)
+            journal.clear()
+            return True
+
+        except OperationCancelled:
+            store.rollback()
+            self.stop_batches(fast_import, journal, landed if uploading else None)
+            print("git push :: cancelled" + (f", {timestamp} can be resumed" if journal.pending else ""))
+            return False
         except GitCommandError as e:
+            store.rollback()
+            self.stop_batches(fast_import, journal, landed if uploading else None)
             if e.status == 1:
                 print(f"git push :: nothing to add in {timestamp} branch")
             else:
                 print(f"git push error in {timestamp} branch\n{e}")
-                
-        # 2. remove leftovers
-        print("2. remove leftovers")
-        self.remove_git(self.local_path)
-        remove_tree(os.path.join(self.local_path, self.index_directory))
+            if journal.state == "landed":
+                print(f"git push :: {len(journal.landed_files)} files of {timestamp} landed, continued by the next push")
+            return False
+        except OSError as e:
+            # a file removed or changed between the scan and the upload: the next push scans it again
+            store.rollback()
+            self.stop_batches(fast_import, journal, landed if uploading else None)
+            print(f"git push :: {e}, {timestamp} not pushed" + (", can be resumed" if journal.pending else ""))
+            return False
+
+    def push_branch(self, timestamp, size, sha=None, parent=None):
+        """Push the timestamp branch, or its batch commit sha, and track it as origin/timestamp.
+        parent: the push span when running in the upload thread."""
+        self.check_cancelled()
+        sha = sha or self.repo.git.rev_parse(f"refs/heads/{timestamp}")
+        with self.metrics.span("push_branch", parent) as span:
+            # git reports a fraction of this push only: place it after the batches uploaded before
+            done = self.progress.done.get("upload", 0)
+            total = max(self.progress.planned.get("upload", 0), done + size, 1)
+            part = (done / size, total / size) if size else (0, 1)
+            self.run_git(self.repo.git, "push", "origin", f"{sha}:refs/heads/{timestamp}",
+                    progress=self.progress, part=part, phase="upload", cancel=self.cancel_event)
+            self.progress.set_fraction((done + size) / total, phase="upload")
+            self.repo.git.update_ref(f"refs/remotes/origin/{timestamp}", sha)
+            span.add("bytes", size)
+
+    def stop_batches(self, fast_import: BatchImport, journal: Journal, landed=None):
+        """After a failed push: keep the batches that landed, the next push continues from the last one.
+        landed: records the batch still in flight, if it landed."""
+        if fast_import is None:
+            return
+        fast_import.abort()
+        if landed:
+            try:
+                landed()  # the upload thread is done with it
+            except (OperationCancelled, GitCommandError):
+                pass
+        if fast_import.head is None or journal.state in ("staged", "pushed"):
+            return
+        if journal.state == "landed":
+            # batches committed after the last landed one are written again
+            self.repo.git.update_ref(f"refs/heads/{fast_import.branch}", journal.head)
+        else:
+            self.delete_refs([f"refs/heads/{fast_import.branch}"])
+
+    def continue_landed(self, journal: Journal):
+        """Commit the landed batches of the journal end with on the remote, None if they are gone (start over).
+        A batch that landed after the journal was written is kept, its files are staged again."""
+        timestamp = journal.timestamp
+        try:
+            remote_sha = self.get_remote_ref_sha(timestamp)
+            if remote_sha is None:
+                return None
+            if remote_sha != journal.head:
+                try:
+                    self.repo.git.cat_file('-e', f"{remote_sha}^{{commit}}")
+                except GitCommandError:
+                    self.run_git(self.repo.git, "fetch", '--filter=blob:none', '--depth', '1', 'origin',
+                                 f"+refs/heads/{timestamp}:refs/remotes/origin/{timestamp}", cancel=self.cancel_event)
+        except GitCommandError as e:
+            print(f"git push :: could not check the landed batches of {timestamp}\n{e}")
+            return None
+        self.repo.git.update_ref(f"refs/heads/{timestamp}", remote_sha)
+        self.repo.git.update_ref(f"refs/remotes/origin/{timestamp}", remote_sha)
+        print(f"git push :: continuing {timestamp} after {len(journal.landed_files)} landed files")
+        return remote_sha
+
+    def discard_landed(self, journal: Journal):
+        """Remove the landed batches of a push that is not continued: the index never pointed at them."""
+        branch = journal.timestamp
+        self.delete_refs([f"refs/heads/{branch}", f"refs/remotes/origin/{branch}"])
+        try:
+            if self.get_remote_ref_sha(branch):
+                self.run_git(self.repo.git, "push", 'origin', '--delete', branch)
+        except GitCommandError as e:
+            print(f"git push :: could not remove the pushed batches of {branch}\n{e}")
+        journal.clear()
+
+    def save_index(self, store: IndexStore, versions):
+        self.check_cancelled()
+        self.progress.begin("index_save")
+        with self.metrics.span("index_save") as span:
+            for path, version in versions:
+                store.append(path, version)
         
-    def _get_file(self, files):
-        print("selected files: ", files)
-        indices = self.load_indices()
-        finder = {} # finder[timestamp] = [files]
-        for file in files:
-            if file in indices:
-                timestamp = indices[file][0]
-                if timestamp in finder:
-                    match = is_splitted_file(file)
-                    if match:
-                        split_index = int(match.group(1))  # 숫자만 추출
-                        no_idx_file = re.sub(r'.split\d+$', '.split', file)  
-                        for idx in range(split_index):
-                            _file = os.path.join(f"{no_idx_file}{idx+1}")
-                            finder[timestamp].append(_file)
-                    else:
-                        finder[timestamp].append(file)
+            # push touched index shards
+            touched = {shard_of(path) for path, _ in versions}
+            self.push_index(store, touched)
+            span.add("files", len(versions))
+            span.add("shards", len(touched))
+
+    def resume_push(self, store: IndexStore, journal: Journal):
+        """Finish the push in the journal, skipping every step the remote already confirms.
+        False if there is nothing left to resume from (start over)."""
+        timestamp = journal.timestamp
+        print(f"git push :: resuming {timestamp} ({journal.state})")
+        try:
+            local_sha = self.repo.git.rev_parse('--verify', f"refs/heads/{timestamp}")
+        except GitCommandError:
+            return False
+        with self.metrics.span("resume"):
+            if journal.state == "staged":
+                if self.get_remote_ref_sha(timestamp) != local_sha:
+                    # batches that landed before are not sent again
+                    size = sum(version.get("size") or 0 for _, version in journal.versions)
+                    self.progress.begin("upload", size)
+                    self.push_branch(timestamp, size, local_sha)
+                    self.progress.end()
                 else:
-                    match = is_splitted_file(file)
-                    if match:
-                        split_index = int(match.group(1))  # 숫자만 추출
-                        no_idx_file = re.sub(r'.split\d+$', '.split', file)  
-                        for idx in range(split_index):
-                            _file = os.path.join(f"{no_idx_file}{idx+1}")
-                            if timestamp in finder:
-                                finder[timestamp].append(_file)
-                            else:
-                                finder[timestamp] = [_file]
-                    else:
-                        finder[timestamp] = [file]
-            else:
+                    self.repo.git.update_ref(f"refs/remotes/origin/{timestamp}", local_sha)
+                journal.update("pushed")
+
+            # the index may have landed before the journal was cleared
+            missing = [(path, version) for path, version in journal.versions
+                       if path not in store or timestamp not in (get_timestamp(v) for v in store[path])]
+            if missing:
+                self.save_index(store, missing)
+            journal.clear()
+        # the manifest is not saved: the next push hashes these files again and finds them uploaded
+        return True
+
+    def write_chunks(self, timestamp: str, big_files, store: IndexStore, fast_import: BatchImport, compressor: Compressor = None,
+                     landed=None, staged=None):
+        """Chunk big files and write the chunks the remote does not have yet.
+        Chunks are named by the hash of their raw bytes, compressed or not.
+        landed: landed[chunk hash] = codec of the chunks already in the timestamp branch.
+        staged: filled with staged[chunk path] = (chunk hash, codec) of every written chunk."""
+        chunker = Chunker(self.CHUNK_MIN_SIZE, self.CHUNK_AVG_SIZE, self.CHUNK_MAX_SIZE)
+        # known[chunk hash] = (timestamp of the branch holding it, codec)
+        known = {chunk_hash: (timestamp, codec) for chunk_hash, codec in (landed or {}).items()}
+        for file_path, version in big_files:
+            chunks = []
+            self.metrics.add("files")
+            for chunk in chunker.chunks(file_path):
+                self.check_cancelled()
+                chunk_hash = hash_bytes(chunk)
+                self.progress.advance(len(chunk), os.path.basename(file_path))
+                self.metrics.add("chunks")
+                self.metrics.add("bytes", len(chunk))
+                if chunk_hash not in known:
+                    known[chunk_hash] = store.known_chunk(chunk_hash)
+                    if known[chunk_hash] is None:
+                        data, codec = compressor.compress(chunk) if compressor else (chunk, None)
+                        fast_import.add_data(self.chunk_path(chunk_hash), data)
+                        known[chunk_hash] = (timestamp, codec)
+                        if staged is not None:
+                            staged[self.chunk_path(chunk_hash)] = (chunk_hash, codec)
+                        self.metrics.add("new_chunks")
+                chunk_timestamp, codec = known[chunk_hash]
+                chunks.append([chunk_hash, len(chunk), chunk_timestamp] + ([codec] if codec else []))
+            version["chunks"] = chunks
+
+    def get_compressor(self):
+        codec, level = parse_compression(self.COMPRESSION)
+        return Compressor(codec, level) if codec else None
+
+    def chunk_path(self, chunk_hash):
+        return f"{self.chunk_directory}/{chunk_hash[:2]}/{chunk_hash}"
+
+    def locate(self, store: IndexStore, timestamp):
+        """(branch, path prefix) of the files pushed at timestamp: the timestamp branch, or its archive."""
+        archive = store.archive_of(timestamp)
+        return (archive, timestamp + "/") if archive else (timestamp, "")
+
+    def list_remote_heads(self):
+        """Every branch name on the remote, and how long the ref advertisement took."""
+        started = time.time()
+        output = Git().ls_remote('--heads', self.repo_url)
+        elapsed = time.time() - started
+        return [line.split('\trefs/heads/', 1)[1] for line in output.splitlines()], elapsed
+
+    def compact(self, keep_recent=24, branches_per_archive=1000):
+        """Move every timestamp branch but the keep_recent latest into archive branches and delete their refs.
+        An archive holds each old branch tree under the branch name, so no file is read or uploaded again.
+        Returns a report: refs and ref advertisement time before / after, "error" if nothing could be compacted."""
+        self.cancel_event.clear()
+        with self.metrics.span("compact"), self.mirror_use:
+            return self._compact(keep_recent, branches_per_archive)
+
+    def _compact(self, keep_recent, branches_per_archive):
+        # 0. refs before
+        heads, elapsed = self.list_remote_heads()
+        print(f"compact :: {len(heads)} refs before, ref advertisement {elapsed * 1000:.0f} ms")
+        report = {"refs_before": len(heads), "advertisement_before": elapsed}
+        store = self.load_indices()
+        timestamps = sorted(head for head in heads if head.startswith('date'))
+        old = timestamps[:max(len(timestamps) - keep_recent, 0)]
+        # a branch an unfinished push continues (landed) or lands (staged, pushed) stays
+        journal = Journal(self.get_journal_path())
+        if journal.pending:
+            old = [timestamp for timestamp in old if timestamp != journal.timestamp]
+        if not old:
+            print("compact :: nothing to compact")
+            return report
+
+        # 1. trees of the old branches: commits and trees only
+        with self.refs_lock:
+            fetched = set(self.repo.git.for_each_ref('--format=%(refname)', 'refs/remotes/origin/').split())
+            refspecs = [f"+refs/heads/{timestamp}:refs/remotes/origin/{timestamp}" for timestamp in old
+                        if f"refs/remotes/origin/{timestamp}" not in fetched]
+            for i in range(0, len(refspecs), branches_per_archive):
+                self.run_git(self.repo.git, "fetch", '--filter=blob:none', '--depth', '1', 'origin', *refspecs[i:i + branches_per_archive],
+                             cancel=self.cancel_event)
+        trees = dict(line.split() for line in self.repo.git.for_each_ref(
+            '--format=%(refname:lstrip=3) %(tree)', 'refs/remotes/origin/').splitlines())
+
+        # 2. one archive commit per batch, pointing at the existing trees
+        archives = {}  # archives[timestamp] = archive branch
+        for i in range(0, len(old), branches_per_archive):
+            batch = old[i:i + branches_per_archive]
+            archive = self.archive_prefix + batch[-1][len('date'):]
+            fast_import = FastImport(self.repo, force=True)
+            for timestamp in batch:
+                fast_import.add_tree(timestamp, trees[timestamp])
+            fast_import.commit(archive, 'commited in compact')
+            archives.update(dict.fromkeys(batch, archive))
+        branches = sorted(set(archives.values()))
+
+        # 3. archives and the index pointing at them land together or not at all
+        try:
+            store.set_archives(archives)
+            self.push_index(store, set(), [f"refs/heads/{branch}:refs/heads/{branch}" for branch in branches], archives=True)
+        except GitCommandError as e:
+            store.rollback()
+            print(f"compact :: index push failed, nothing deleted\n{e}")
+            report["error"] = str(e)
+            return report
+        for branch in branches:
+            self.repo.git.update_ref(f"refs/remotes/origin/{branch}", f"refs/heads/{branch}")
+
+        # 4. delete the old refs, remote and local
+        for i in range(0, len(old), branches_per_archive):
+            self.repo.git.push("origin", *[f":refs/heads/{timestamp}" for timestamp in old[i:i + branches_per_archive]])
+        self.delete_refs([f"refs/{kind}/{timestamp}" for timestamp in old for kind in ("heads", "remotes/origin")])
+
+        # 5. refs after
+        heads, elapsed = self.list_remote_heads()
+        print(f"compact :: {len(old)} branches into {len(branches)} archives, "
+              f"{len(heads)} refs after, ref advertisement {elapsed * 1000:.0f} ms")
+        report.update({"compacted": len(old), "archives": len(branches), "refs_after": len(heads), "advertisement_after": elapsed})
+        return report
+
+    def delete_refs(self, refs):
+        # one update-ref for every ref, missing ones are ignored
+        process = self.repo.git.update_ref('--stdin', istream=subprocess.PIPE, as_process=True)
+        process.proc.stdin.write("".join(f"delete {ref}\n" for ref in refs).encode())
+        process.proc.stdin.close()
+        process.wait()
+        
+    def _get_file(self, files, indices: IndexStore = None):
+        """Resolve every requested file to the branch and paths holding it."""
+        if indices is None:
+            indices = self.load_indices()
+        finder = {} # finder[timestamp] = [paths]
+        chunked = {} # chunked[file] = latest version with its chunk list
+        splitted = {} # splitted[timestamp] = [[file.split1, ...], ...]
+        codecs = {} # codecs[(timestamp, path)] = codec of a compressed blob
+        for file in files:
+            if file not in indices:
                 print(f"Warning :: {file} NOT found in indices")
-        return finder
+                continue
+            versions = indices[file]
+            version = versions[-1]
+            if isinstance(version, dict) and "chunks" in version:
+                chunked[file] = version
+                for chunk_hash, _, timestamp, *codec in version["chunks"]:
+                    finder.setdefault(timestamp, []).append(self.chunk_path(chunk_hash))
+                    if codec: codecs[(timestamp, self.chunk_path(chunk_hash))] = codec[0]
+                continue
+
+            timestamp = get_stored_timestamp(versions)
+            match = is_splitted_file(file)
+            if match:
+                split_index = int(match.group(1))  # 숫자만 추출
+                no_idx_file = re.sub(r'.split\d+$', '.split', file)  
+                split_files = [f"{no_idx_file}{idx+1}" for idx in range(split_index)]
+                finder.setdefault(timestamp, []).extend(split_files)
+                splitted.setdefault(timestamp, []).append(split_files)
+            else:
+                finder.setdefault(timestamp, []).append(file)
+                if isinstance(version, dict) and version.get("codec"):
+                    codecs[(timestamp, file)] = version["codec"]
+        return finder, chunked, splitted, codecs
     
-    def get_file(self, files: List[str], download_path="Downloads", show_process=True, progress=None):
-        # from gui
-        if show_process: progress.emit(20)
-        self.git_init()
-        
+    def get_file(self, files: List[str], download_path="Downloads", show_process=True, progress=None, pin=False):
+        """progress: optional callback receiving progress.Progress snapshots while downloading (if show_process).
+        pin: also keep the files in the download cache for offline use, see pin().
+        Returns the downloaded path of every file that was found."""
+        self.progress = Progress(progress if show_process else None)
+        self.cancel_event.clear()
+        try:
+            with self.metrics.span("get_file"):
+                with self.mirror_use:
+                    placed = self._get_files(files, download_path, pin)
+                self.prune_mirror()
+                return placed
+        except OperationCancelled:
+            print("git pull :: cancelled, incomplete files removed")
+            return {}
+
+    def _get_files(self, files, download_path, pin=False):
         if download_path == "Downloads":
             download_path = os.path.join(os.path.expanduser('~'), "Downloads")
-        if show_process: progress.emit(40)
-        finder = self._get_file(files)
-        
-        if show_process: progress.emit(60)
-        for timestamp, file in finder.items():
-            self.git_sparse_pull(timestamp, file, download_path)
-
-        print("Getfile: remove leftovers")
-        if show_process: progress.emit(80)
-        self.remove_git(self.local_path)
-        remove_tree(os.path.join(self.local_path, self.index_directory))
-
-    def git_sparse_pull(self, target_branch, path, download_path):
-        temp_path = ".download"
-        temp_path = os.path.join(self.local_path, temp_path)
-        if not os.path.exists(temp_path):
-            os.mkdir(temp_path)
-            if os.name == "nt": os.system(f'attrib +h "{temp_path}"')
-
-        pull_repo = None
-        pull_origin = None
-        if not os.path.exists(os.path.join(temp_path, ".git")):
-            pull_repo = Repo.init(temp_path)
-            self.set_git_config(pull_repo)
-            pull_origin = pull_repo.create_remote('origin', self.repo_url)
-        else:
-            pull_repo = Repo(temp_path)
-            pull_origin = pull_repo.remotes.origin
+        store = self.load_indices()
+        cache = self.open_download_cache()
+        hashes = {}  # hashes[file] = content hash of its latest version (none for old index entries)
+        for file in files:
+            version = store.latest(file) if file in store else None
+            if isinstance(version, dict) and version.get("hash"):
+                hashes[file] = version["hash"]
+                if pin:
+                    cache.pin(version["hash"], file)
 
-        downloaded_files(temp_path)
+        # 0. files the cache holds are placed without touching the network
+        placed = {}  # placed[file] = downloaded path
+        with self.metrics.span("cache") as span:
+            missed = []
+            for file in files:
+                if file not in hashes or hashes[file] not in cache:
+                    missed.append(file)
+                    continue
+                output_path = unique_file_path(download_path, os.path.basename(file))
+                if cache.get(hashes[file], output_path, store.latest(file)["size"]):
+                    placed[file] = output_path
+                    span.add("hits")
+                    span.add("bytes", store.latest(file)["size"])
+                else:
+                    os.remove(output_path)  # the reserved name, downloaded under a new one
+                    missed.append(file)
+        if not missed:
+            return placed
 
-        # sparse-checkout init
-        pull_repo.git.sparse_checkout("init")
-        pull_origin.fetch(target_branch)
-        
-        # execute sparse-checkout
-        self.set_sparse_checkout(temp_path, path)
-        pull_repo.git.checkout(target_branch)
+        finder, chunked, splitted, codecs = self._get_file(missed, store)
+        latest = [store.latest(file) for file in missed if file in store]
+        total = sum(version.get("size") or 0 for version in latest if isinstance(version, dict))
+        self.progress.plan({"download": total, "extract": total})  # sizes before compression and dedup
 
-        print(f"Successfully fetched files: {path}")
-        
+        # chunked files are written in place as their chunks arrive
+        assembler = FileAssembler()
+        outputs = {}  # outputs[file] = downloaded path
+        for file, version in chunked.items():
+            outputs[file] = unique_file_path(download_path, os.path.basename(file))
+            assembler.add_file(outputs[file], version["chunks"])
         
-        # TODO: input 여러개 일때 case 추가하기!!!!!
-        # fuze splitted file
-        match = is_splitted_file(path[0])
-        print("matched? ", match)
-        if match:
-            merged_path = merge_files(temp_path, path)
-            print("tmerged", merged_path, temp_path)
-            move_files_with_unique_names([merged_path], temp_path, download_path, is_splitted=True)
-        else:
-            # move sparse-checkouted files
-            move_files_with_unique_names(path, temp_path, download_path)
-            
-        # remove dir after moved
-        print("t1")
-        remove_tree(os.path.join(self.local_path, temp_path))
-        print("t2")
-
-    def write_indices(self, timestamp: str, data: Dict):
-        excluding_files = ['.DS_Store', '.gitignore']
-        excluded_folders = ['.git', '.index', '.download']
-        
-        big_files = []
-        duplicated = []
-        for root, dirs, files in os.walk(self.local_path):
-            for _ in excluded_folders:
-                if _ in dirs: dirs.remove(_)
+        try:
+            if finder:
+                pulled = self.git_batch_pull(finder, download_path, assembler, splitted, codecs)
+                for file in missed:
+                    if file in store and (get_stored_timestamp(store[file]), file) in pulled:
+                        outputs[file] = pulled[(get_stored_timestamp(store[file]), file)]
+        finally:
+            with self.metrics.span("assemble") as span:
+                span.add("files", len(chunked))
+                for output_path in assembler.finish():
+                    print(f"Error :: {output_path} is missing chunks, removed")
+                    span.add("incomplete")
+                span.add("bytes", assembler.bytes_written)
+            self.progress.end()
 
-            for file in files:
-                file_path = os.path.join(root, file)
-                if file in excluding_files: continue
-                if file in data:
-                    # duplicated push
-                    file_size = os.path.getsize(file_path)
-                    if file_size >= self.MAX_FILE_SIZE:
-                        duplicated.append(file)
-                        chuck_count = file_size // self.MAX_FILE_SIZE + 1
-                        _file = file + f".split{chuck_count}"
-                        data[_file].append(timestamp)
-                    else:
-                        duplicated.append(file)
-                        data[file].append(timestamp)
+        # 1. keep what was downloaded for the next get_file
+        with self.metrics.span("cache_fill") as span:
+            for file, output_path in outputs.items():
+                if file in hashes and os.path.exists(output_path):
+                    cache.add(hashes[file], output_path)
+                    span.add("files")
+            cache.evict()
+        placed.update((file, output_path) for file, output_path in outputs.items() if os.path.exists(output_path))
+        return placed
+
+    def pin(self, files: List[str]):
+        """Keep files in the download cache for offline use: get_file places them without the network.
+        The latest version is pinned, downloading it into the cache if it is not there yet."""
+        store = self.load_indices()
+        cache = self.open_download_cache()
+        for file in files:
+            self.unpin([file])
+        missing = [file for file in files
+                   if file in store and isinstance(store.latest(file), dict) and store.latest(file).get("hash") not in cache]
+        if missing:
+            # same filesystem as the cache: the downloads are reflinked into it where it can
+            with tempfile.TemporaryDirectory(dir=cache.path) as temp_path:
+                self.get_file(missing, temp_path, show_process=False, pin=True)
+        for file in files:
+            version = store.latest(file) if file in store else None
+            if isinstance(version, dict) and version.get("hash"):
+                cache.pin(version["hash"], file)
+            else:
+                print(f"Warning :: {file} cannot be pinned, pushed by an older version without a content hash")
+
+    def unpin(self, files: List[str]):
+        cache = self.open_download_cache()
+        for file in files:
+            cache.unpin(file)
+
+    def git_batch_pull(self, finder, download_path, assembler, splitted, codecs=None):
+        """Fetch every needed branch at once, then extract the branches concurrently.
+        Returns the output path of every file that is not chunked by (timestamp, path in the index)."""
+        codecs = codecs or {}
+        pull_repo = self.git_init()
+        store = self.open_index_store()
+        located = {timestamp: self.locate(store, timestamp) for timestamp in finder}
+        branches = sorted({branch for branch, _ in located.values()})
+
+        # 1. one blobless fetch for the branches the mirror does not have yet: commits and trees only
+        with self.metrics.span("fetch") as span:
+            self.progress.begin("fetch")
+            span.add("branches", self.fetch_branches(pull_repo, branches))
+
+        # 1-1. then only the blobs of the requested paths
+        with self.metrics.span("fetch_blobs") as span:
+            trees = {}  # trees[timestamp] = {path: blob}
+            for timestamp, paths in finder.items():
+                branch, prefix = located[timestamp]
+                trees[timestamp] = self.list_indexed_blobs(pull_repo, branch, prefix, list(dict.fromkeys(paths)))
+            blobs = {blob for tree in trees.values() for blob in tree.values()}
+            blobs = sorted(blobs & self.missing_blobs(pull_repo, [f"origin/{branch}" for branch in branches]))
+            self.progress.begin("download")
+            self.fetch_blobs(pull_repo, blobs)
+            self.progress.end()
+            span.add("blobs", len(blobs))
+        self.check_cancelled()
+
+        # 2. reserve the final file names (created empty): jobs[timestamp] = [(output path, [blobs], codec)]
+        chunk_prefix = self.chunk_directory + "/"
+        jobs = {}
+        chunks = {}  # chunks[timestamp] = [(chunk hash, blob, codec)]
+        pulled = {}  # pulled[(timestamp, path in the index)] = output path
+        for timestamp, paths in finder.items():
+            tree = trees[timestamp]
+            jobs[timestamp] = []
+            chunks[timestamp] = [(path.rsplit('/', 1)[1], tree[path], codecs.get((timestamp, path)))
+                                 for path in dict.fromkeys(paths) if path.startswith(chunk_prefix) and path in tree]
+            merged = set()
+            for split_files in splitted.get(timestamp, []):
+                merged.update(split_files)
+                if not all(path in tree for path in split_files):
+                    print(f"Warning :: {split_files[-1]} NOT found in {timestamp}")
+                    continue
+                output_path = unique_file_path(download_path, get_original_file_name(os.path.basename(split_files[0])))
+                jobs[timestamp].append((output_path, [tree[path] for path in split_files], None))
+                pulled[(timestamp, split_files[-1])] = output_path  # indexed as name.splitN
+            for path in dict.fromkeys(paths):
+                if path in merged or path.startswith(chunk_prefix):
+                    continue
+                if path not in tree:
+                    print(f"Warning :: {path} NOT found in {timestamp}")
+                    continue
+                output_path = unique_file_path(download_path, os.path.basename(path))
+                jobs[timestamp].append((output_path, [tree[path]], codecs.get((timestamp, path))))
+                pulled[(timestamp, path)] = output_path
+
+        # 3. stream blobs concurrently: one worker per branch for files, chunks spread over several workers
+        self.progress.begin("extract")
+        with self.metrics.span("extract") as span, ThreadPoolExecutor(max_workers=self.DOWNLOAD_WORKERS) as executor:
+            futures = []
+            for timestamp in finder:
+                if jobs[timestamp]:
+                    futures.append(executor.submit(self.extract_branch, pull_repo.git_dir, jobs[timestamp], [], assembler))
+                branch_chunks = chunks[timestamp]
+                for i in range(0, len(branch_chunks), self.CHUNKS_PER_WORKER):
+                    futures.append(executor.submit(self.extract_branch, pull_repo.git_dir, [], branch_chunks[i:i + self.CHUNKS_PER_WORKER], assembler))
+            for future in futures:
+                future.result()
+            outputs = [output_path for branch_jobs in jobs.values() for output_path, _, _ in branch_jobs]
+            span.add("files", len(outputs))
+            span.add("bytes", sum(os.path.getsize(output_path) for output_path in outputs))
+            span.add("chunks", sum(len(branch_chunks) for branch_chunks in chunks.values()))
+        return pulled
+
+    def fetch_branches(self, repo, branches):
+        """Blobless fetch of the branches the mirror does not have yet: commits and trees only."""
+        # under the lock: another operation may have fetched them meanwhile
+        with self.refs_lock:
+            fetched = set(repo.git.for_each_ref('--format=%(refname)', 'refs/remotes/origin/').split())
+            refspecs = [f"+refs/heads/{branch}:refs/remotes/origin/{branch}" for branch in branches
+                        if f"refs/remotes/origin/{branch}" not in fetched]
+            if refspecs:
+                self.run_git(repo.git, "fetch", '--filter=blob:none', '--depth', '1', 'origin', *refspecs, progress=self.progress, cancel=self.cancel_event)
+        return len(refspecs)
+
+    def open(self, path, cache_size=64 * 1024 * 1024, prefetch=4) -> ChunkReader:
+        """Seekable, read-only file object of the latest version of path.
+        Only the chunks covering what is read are downloaded (cache_size bytes of them are kept in memory),
+        sequential reads fetch the next `prefetch` chunks ahead."""
+        self.progress = Progress()
+        self.cancel_event.clear()
+        with self.metrics.span("open") as span, self.mirror_use:
+            store = self.load_indices()
+            if path not in store:
+                raise FileNotFoundError(f"{path} NOT found in indices")
+            versions = store[path]
+            version = versions[-1]
+
+            # 1. pieces of the file: [(timestamp, path in the branch, size, codec)]
+            pieces = []
+            if isinstance(version, dict) and "chunks" in version:
+                for chunk_hash, size, timestamp, *codec in version["chunks"]:
+                    pieces.append((timestamp, self.chunk_path(chunk_hash), size, codec[0] if codec else None))
+            else:
+                timestamp = get_stored_timestamp(versions)
+                match = is_splitted_file(path)
+                if match:
+                    no_idx_file = re.sub(r'.split\d+$', '.split', path)
+                    pieces = [(timestamp, f"{no_idx_file}{idx+1}", None, None) for idx in range(int(match.group(1)))]
                 else:
-                    # first push
-                    file_size = os.path.getsize(file_path)
-                    print("@@@@@@@@ test 1", file_size, file_path)
-                    if file_size >= self.MAX_FILE_SIZE:
-                        duplicated.append(file)
-                        big_files.append(BigFile(file_path, self.MAX_FILE_SIZE))
-                        chuck_count = file_size // self.MAX_FILE_SIZE + 1
-                        _file = file + f".split{chuck_count}"
-                        data[_file] = [timestamp]
-                    else:
-                        data[file] = [timestamp]
-        return [duplicated, data, big_files]
-
-    def load_indices(self) -> Dict:
-        # 0. create index path
-        self.index_path = os.path.join(self.local_path, self.index_directory)
-        if not os.path.exists(self.index_path):
-            os.mkdir(self.index_path)
-            if os.name == "nt": os.system(f'attrib +h "{self.index_path}"')
-            
-        # 1. check for index branch
+                    size = version.get("size") if isinstance(version, dict) else None
+                    pieces = [(timestamp, path, size, version.get("codec") if isinstance(version, dict) else None)]
+
+            # 2. blob of every piece, from the trees of a blobless fetch
+            repo = self.git_init()
+            located = {timestamp: self.locate(store, timestamp) for timestamp, _, _, _ in pieces}
+            self.fetch_branches(repo, sorted({branch for branch, _ in located.values()}))
+            trees = {}
+            for timestamp, (branch, prefix) in located.items():
+                paths = [piece_path for piece_timestamp, piece_path, _, _ in pieces if piece_timestamp == timestamp]
+                trees[timestamp] = self.list_indexed_blobs(repo, branch, prefix, list(dict.fromkeys(paths)))
+            blobs = []
+            for timestamp, piece_path, size, codec in pieces:
+                blob = trees[timestamp].get(piece_path)
+                if blob is None:
+                    raise FileNotFoundError(f"{piece_path} NOT found in {timestamp}")
+                if size is None:
+                    size = int(repo.git.cat_file('-s', blob))  # old index entry without size: the blob is small
+                blobs.append((blob, size, codec))
+            missing = {blob for blob, _, _ in blobs} & self.missing_blobs(repo, [f"origin/{branch}" for branch, _ in located.values()])
+            span.add("pieces", len(blobs))
+        return ChunkReader(repo.git_dir, blobs, lambda blobs: self.fetch_pieces(repo, blobs), missing, cache_size, prefetch)
+
+    def fetch_pieces(self, repo, blobs):
+        # blobs of a ChunkReader, fetched after open() returned
+        with self.mirror_use:
+            self.fetch_blobs(repo, blobs)
+
+    def list_blobs(self, repo, ref, paths=None, batch_size=1000):
+        """tree[path] = blob of every file in ref (or only of paths).
+        Trees are local after a blobless fetch, so this does not touch the network."""
+        tree = {}
+        env = {"GIT_LITERAL_PATHSPECS": "1"}
+        batches = [paths[i:i + batch_size] for i in range(0, len(paths), batch_size)] if paths is not None else [[]]
+        for batch in batches:
+            output = repo.git.ls_tree('-r', '-z', ref, '--', *batch, env=env)
+            for entry in output.split('\0'):
+                if entry:
+                    info, path = entry.split('\t', 1)
+                    tree[path] = info.split()[2]
+        return tree
+
+    def list_indexed_blobs(self, repo, branch, prefix, paths):
+        """blobs[path] = blob of every index path found in branch, where the files are stored under prefix.
+        Older versions indexed the files of subfolders by their name only: those are matched by name."""
+        tree = self.list_blobs(repo, f"origin/{branch}", [prefix + path for path in paths])
+        blobs = {path[len(prefix):]: blob for path, blob in tree.items()}
+        unmatched = [path for path in paths if path not in blobs and '/' not in path]
+        if unmatched:
+            by_name = {}  # by_name[file name] = blob of the first file with that name, by path
+            for path, blob in sorted(self.list_blobs(repo, f"origin/{branch}", [prefix.rstrip('/')] if prefix else None).items()):
+                by_name.setdefault(path.rsplit('/', 1)[-1], blob)
+            blobs.update((path, by_name[path]) for path in unmatched if path in by_name)
+        return blobs
+
+    def missing_blobs(self, repo, refs):
+        # blobs of refs that the partial clone has not fetched yet (listed without fetching them)
+        output = repo.git.rev_list('--objects', '--missing=print', '--no-object-names', *refs)
+        return {line[1:] for line in output.splitlines() if line.startswith('?')}
+
+    def fetch_blobs(self, repo, blobs, batch_size=1000):
+        # same as git's own lazy fetch: no negotiation, or the server assumes we hold every blob of our commits
+        batches = range(0, len(blobs), batch_size)
+        for n, i in enumerate(batches):
+            self.run_git(repo.git, "fetch", '--filter=blob:none', '--no-tags', '--no-write-fetch-head', '--recurse-submodules=no', 'origin', *blobs[i:i + batch_size],
+                    progress=self.progress, part=(n, len(batches)), cancel=self.cancel_event, config=["fetch.negotiationAlgorithm=noop"])
+
+    def extract_branch(self, repo_path, jobs, chunks, assembler):
+        """Stream blobs straight into their final files through a persistent `git cat-file --batch`.
+        Splitted files are fuzed and compressed blobs decompressed on the fly, chunks go to the assembler.
+        When cancelled, the unfinished files of jobs are removed."""
+        git = Git(repo_path)  # one cat-file process per thread
+        finished = 0
         try:
-            self.index_repo = Repo(self.index_path)
-        except Exception as e:
-            self.index_repo = Repo.init(self.index_path)
-            self.index_repo.create_remote('origin', self.repo_url)
-            
+            for output_path, blobs, codec in jobs:
+                decompressor = Decompressor(codec)
+                with open(output_path, 'wb') as f:
+                    for blob in blobs:
+                        _, _, _, stream = git.stream_object_data(blob)
+                        while block := stream.read(STREAM_BLOCK_SIZE):
+                            self.check_cancelled()
+                            data = decompressor.decompress(block)
+                            f.write(data)
+                            self.progress.advance(len(data))
+                    f.write(decompressor.flush())
+                finished += 1
+            for chunk_hash, blob, codec in chunks:
+                self.check_cancelled()
+                _, _, size, stream = git.stream_object_data(blob)
+                data = decompress(stream.read(size), codec)
+                assembler.write_chunk(chunk_hash, data)
+                self.progress.advance(len(data))
+        except OperationCancelled:
+            for output_path, _, _ in jobs[finished:]:
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            raise
+        finally:
+            git.clear_cache()  # also kills a cat-file process left in the middle of a blob
+
+    def write_indices(self, timestamp: str, store: IndexStore, manifest: Manifest, paths=None, landed=None):
+        """paths: only scan these relative paths instead of the whole folder.
+        landed: landed[relative path] = version of the files a continued push of timestamp has on the remote already."""
+        big_files = []  # [(file path, version)], chunked later
+        changed = []  # [(relative path, file path, size, version)]
+        versions = []  # [(relative path, version)], appended to the store once pushed
+        legacy = []  # [(relative path, file path, record)] of old index entries without hash
+
+        def add(rel_path, file_path, record):
+            # first push or modified
+            previous = landed.get(rel_path) if landed else None
+            if previous and previous["hash"] == record["hash"]:
+                versions.append((rel_path, previous))  # in a landed batch, not staged again
+                return
+            file_size = record["size"]
+            version = {"timestamp": timestamp, "size": file_size, "hash": record["hash"]}
+            if file_size >= self.MAX_FILE_SIZE:
+                big_files.append((file_path, version))
+            else:
+                changed.append((rel_path, file_path, file_size, version))
+            versions.append((rel_path, version))
+            self.metrics.add("changed")
+            self.metrics.add("bytes", file_size)
+
+        for rel_path, file_path, record, _ in manifest.scan(self.local_path, self.excluded_folders, self.excluded_files, paths):
+            self.metrics.add("files")
+            self.progress.advance(0, rel_path)
+            latest = store.latest(rel_path)
+            if isinstance(latest, dict):
+                if latest.get("hash") == record["hash"]:
+                    continue
+            elif latest is not None:
+                # old index entry without hash: compared with the blob it was pushed as, below
+                legacy.append((rel_path, file_path, record))
+                continue
+            # files pushed before chunking as name.splitN cannot be compared: pushed again once, as chunks
+            add(rel_path, file_path, record)
+
+        if legacy:
+            # the hash of the manifest is the git blob id, the same as in the branch tree
+            blobs = self.legacy_blobs(store, [rel_path for rel_path, _, _ in legacy])
+            for rel_path, file_path, record in legacy:
+                if blobs.get(rel_path) != record["hash"]:
+                    add(rel_path, file_path, record)
+        return [changed, versions, big_files]
+
+    def legacy_blobs(self, store: IndexStore, paths):
+        """blobs[path] = blob id of paths indexed by an older version (bare timestamps), read from the trees of their branches."""
+        repo = self.git_init()
+        finder = {}  # finder[timestamp] = [paths]
+        for path in paths:
+            finder.setdefault(get_stored_timestamp(store[path]), []).append(path)
+        located = {timestamp: self.locate(store, timestamp) for timestamp in finder}
+        self.fetch_branches(repo, sorted({branch for branch, _ in located.values()}))
+        blobs = {}
+        for timestamp, paths in finder.items():
+            branch, prefix = located[timestamp]
+            blobs.update(self.list_indexed_blobs(repo, branch, prefix, paths))
+        return blobs
+
+    def load_indices(self) -> IndexStore:
+        if not self.refresh_indices:
+            store = self.get_cached_file_list()
+            if store is not None:
+                return store
+        self.progress.begin("load_indices")
+        with self.metrics.span("load_indices"), self.mirror_use:
+            store = self._load_indices()
+        self.progress.end()
+        return store
+
+    def _load_indices(self) -> IndexStore:
+        # 0. open the mirror, the index branch is never checked out
+        self.git_init()
+        store = self.open_index_store()
+
+        # 1. check remote index sha
         try:
-            if not self.check_remote_branch_exists(self.index_branch_name):
-                self.index_repo.git.checkout('-b', self.index_branch_name)
-                self.index_repo.git.commit('--allow-empty', '-m', 'commited in git_init')
-                self.index_repo.git.push("origin", self.index_branch_name)
+            remote_sha = self.get_remote_ref_sha(self.index_branch_name)
+        except GitCommandError as e:
+            # offline: serve whatever is cached
+            print(f"Error checking index branch: {e}")
+            return store
+
+        try:
+            if remote_sha is None:
+                fast_import = FastImport(self.repo, force=True)
+                fast_import.commit(self.index_branch_name, 'commited in git_init')
+                self.run_git(self.repo.git, "push", "origin", self.index_branch_name)
+                remote_sha = self.repo.git.rev_parse(f"refs/heads/{self.index_branch_name}")
         except GitCommandError as e:
                 print(f"Error making index branch: {e}")
 
-        # 2. clone index
+        # 2. cache hit: index branch has not moved
+        if store.sha == remote_sha:
+            return store
+
+        # 3. fetch only the latest index commit, trees only
         try:
-            remove_tree(self.index_path)
-            Repo.clone_from(self.repo_url, self.index_path, branch=self.index_branch_name, single_branch=True)
-            try:
-                self.index_repo = Repo(self.index_path)
-            except Exception as e:
-                self.index_repo = Repo.init(self.index_path)
+            with self.refs_lock:
+                self.run_git(self.repo.git, "fetch", '--filter=blob:none', '--depth', '1', 'origin',
+                             f"+refs/heads/{self.index_branch_name}:refs/remotes/origin/{self.index_branch_name}", progress=self.progress)
         except GitCommandError as e:
-            print(f"Error cloning branch: {e}")
+            print(f"Error fetching index branch: {e}")
+            return store
+        tree = self.list_blobs(self.repo, f"origin/{self.index_branch_name}")
                 
-        # 3. check and get data
-        index_file_path = os.path.join(self.index_path, self.index_file_name)
-        if not os.path.exists(index_file_path):
-            save_to_json({}, index_file_path)
-            
-        load_index = load_from_json(index_file_path)
-        return load_index
+        # 4. monolithic index from older versions: migrate it whole
+        if self.index_file_name in tree:
+            store.import_json(self.read_index_blobs([tree[self.index_file_name]])[0], remote_sha)
+            return store
 
-    def save_indices(self, data: Dict):
-        index_file_path = os.path.join(self.index_path, self.index_file_name)
-        if os.path.exists(index_file_path): #
-            save_to_json(data, index_file_path)
+        # 5. shards: the tree holds the hash of every shard, fetch and import only the changed ones
+        shard_prefix = self.shard_directory + "/"
+        shards = {path[len(shard_prefix):]: blob for path, blob in tree.items() if path.startswith(shard_prefix)}
+        current = store.shard_blobs()
+        changed = {shard: blob for shard, blob in shards.items() if current.get(shard) != blob}
+        for (shard, blob), data in zip(changed.items(), self.read_index_blobs(list(changed.values()))):
+            store.import_shard(shard, data, blob)
+        for shard in current.keys() - shards.keys():
+            store.remove_shard(shard)
 
-    def remove_git(self, git_path):
-        git_dir = os.path.join(git_path, ".git")
-        if os.path.exists(git_dir):
-            try:
-                remove_tree(git_dir)
-            except PermissionError:
-                print(f"PermissionError: Could not delete {git_dir}. Check file permissions.")
+        # 6. timestamp branches moved into archives by compact()
+        archives_blob = tree.get(self.archive_file_name)
+        if archives_blob != store.archives_blob:
+            store.import_archives(self.read_index_blobs([archives_blob])[0] if archives_blob else {}, archives_blob)
+        store.commit(remote_sha)
+        self.metrics.add("shards", len(shards))
+        self.metrics.add("changed", len(changed))
+        return store
+
+    def read_index_blobs(self, blobs):
+        self.fetch_blobs(self.repo, sorted(set(blobs)))
+        return [json.loads(self.repo.git.get_object_data(blob)[3]) for blob in blobs]
+
+    def open_index_store(self) -> IndexStore:
+        store_path = os.path.join(self.get_workspace_path(), self.index_store_file_name)
+        if self.index_store is None or self.index_store.db_path != store_path:
+            self.index_store = IndexStore(store_path)
+        return self.index_store
+
+    def open_download_cache(self) -> DownloadCache:
+        cache_path = os.path.join(self.get_workspace_path(), self.cache_directory)
+        if self.download_cache is None or self.download_cache.path != cache_path:
+            self.download_cache = DownloadCache(cache_path, self.CACHE_SIZE)
+        return self.download_cache
+
+    def get_journal_path(self):
+        key = hashlib.sha1(self.local_path.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(make_hidden_dir(os.path.join(self.get_workspace_path(), self.manifest_directory)), f"{key}.journal")
+
+    def get_manifest_path(self):
+        # the manifest describes one local folder
+        key = hashlib.sha1(self.local_path.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(make_hidden_dir(os.path.join(self.get_workspace_path(), self.manifest_directory)), f"{key}.json")
+
+    def get_cached_file_list(self) -> IndexStore:
+        """Return the locally cached indices without touching the network (None if not cached)."""
+        store = self.open_index_store()
+        return store if store.sha else None
+
+    def prune_mirror(self):
+        """Once the mirror grew MIRROR_SIZE bytes since it was last pruned, drop the blobs the remote has.
+        Only the commits and trees of the fetched branches stay (and whatever is not pushed yet), so the
+        mirror does not grow with every push and download: blobs are fetched again when read.
+        Skipped while another operation uses the mirror, the next one prunes it."""
+        if self.repo is None:
+            return
+        pruned_path = os.path.join(self.repo.git_dir, "pruned-size")  # size after the last pruning
+        pruned = int(open(pruned_path).read()) if os.path.exists(pruned_path) else 0
+        if object_store_size(self.repo.git_dir) <= pruned + self.MIRROR_SIZE:
+            return
+        if not self.mirror_use.try_exclusive():
+            return
+        try:
+            with self.metrics.span("prune") as span:
+                size = prune_blobs(self.repo)
+                span.add("bytes", size)
+            with open(pruned_path, 'w') as f:
+                f.write(str(size))
+        except GitCommandError as e:
+            print(f"prune_mirror :: {e}")
+        finally:
+            self.mirror_use.release()
 
     def set_git_config(self, repo):
         config = repo.config_writer()
@@ -321,40 +1095,40 @@ class GitManager:
         else:
             print("set_git_config :: Git config not set.")
             
+    def set_partial_clone_config(self, repo):
+        # missing blobs are fetched from origin on demand
+        config = repo.config_writer()
+        config.set_value("extensions", "partialClone", "origin")
+        config.set_value('remote "origin"', "promisor", "true")
+        config.set_value('remote "origin"', "partialCloneFilter", "blob:none")
+        config.release()
+
+    def get_remote_ref_sha(self, branch_name):
+        # ls-remote only reads the ref advertisement, nothing is downloaded
+        output = self.run_git(Git(), "ls_remote", self.repo_url, f"refs/heads/{branch_name}")
+        return output.split()[0] if output else None
+
     def check_remote_branch_exists(self, branch_name):
         try:
-            remote_refs = self.repo.remotes['origin'].fetch()
-            for ref in remote_refs:
-                if ref.name == f'origin/{branch_name}':
-                    return True
-            return False
+            return self.get_remote_ref_sha(branch_name) is not None
         except Exception as e:
             print(f"check_remote_branch_exists :: {e}")
             return False
     
-    def set_sparse_checkout(self, repo_path, files_to_checkout):
-        repo = Repo(repo_path)
-        
-        # .git/info/sparse-checkout 경로 설정
-        sparse_checkout_path = os.path.join(repo_path, '.git', 'info', 'sparse-checkout')
-        
-        # sparse-checkout 파일 작성
-        with open(sparse_checkout_path, 'w') as f:
-            for file in files_to_checkout:
-                f.write(file.lstrip('/') + '\n')  # 루트 '/' 제거
-        
-        # sparse-checkout 활성화
-        repo.git.config('core.sparseCheckout', 'true')
-        # print(f"Sparse-checkout 설정 완료: {files_to_checkout}")
-    
-    def get_remote_file_list(self):
-        self.git_init()
-        indices = self.load_indices()
+    def query(self, prefix="", glob=None, regex=None, extension=None, min_size=None, max_size=None, since=None, until=None, limit=None,
+              refresh=False):
+        """Stream (path, size, timestamp) of the stored files matching every given filter, by path.
+        See IndexStore.query(): answered from the indexes of the local index copy, loaded if there is none.
+        refresh: check the remote index first (an ls-remote), get_remote_file_list() refreshes it as well."""
+        store = None if refresh else self.get_cached_file_list()
+        if store is None:
+            store = self.load_indices()
+        return store.query(prefix, glob, regex, extension, min_size, max_size, since, until, limit)
 
-        # remove leftovers
-        self.remove_git(self.local_path)
-        remove_tree(os.path.join(self.local_path, self.index_directory))
-        
+    def get_remote_file_list(self, progress=None):
+        self.progress = Progress(progress)
+        self.progress.plan({"load_indices": 1})  # no sizes before the fetch: git's percentage only
+        indices = self.load_indices()
         return indices
         
 # if __name__ == "__main__":
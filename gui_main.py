@@ -2,80 +2,62 @@
 import os
 import sys
 import json
+from datetime import datetime
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QTreeView, QFileSystemModel,
                             QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QFileDialog,
                             QSplitter, QMessageBox, QLabel, QMenu, QFrame, QTabWidget,
-                            QListWidget, QProgressDialog, QCheckBox, QLineEdit)
-from PyQt5.QtCore import QDir, QFile, Qt, QUrl, QThread, pyqtSignal
+                            QTableView, QAbstractItemView, QHeaderView, QProgressDialog, QCheckBox, QLineEdit)
+from PyQt5.QtCore import QDir, QFile, Qt, QUrl, QObject, QTimer, pyqtSignal
 from PyQt5.QtGui import QDesktopServices, QPixmap, QImageReader
 from PyQt5.QtCore import QSettings
 from git_logic import GitManager
+from async_git import AsyncGitManager, EventLoopThread
+from remote_files_model import RemoteFilesModel, RemoteFilesFilter
+from metrics import CallbackExporter
+from progress import format_progress
 from utils import *
 
-# Worker thread for Git push operations
-class GitPushWorker(QThread):
+# One operation of the AsyncGitManager on the background event loop, reporting through Qt signals
+class GitOperation(QObject):
     progress = pyqtSignal(int)  # Progress update signal
     log = pyqtSignal(str)      # Log message update signal
-    finished = pyqtSignal()    # Operation completion signal
+    finished = pyqtSignal(object)  # Operation completion signal: its result, None if it failed or was cancelled
 
-    def __init__(self, gitManager):
+    def __init__(self, loop_thread, make_coroutine):
         super().__init__()
-        self.gitManager = gitManager
-    
-    def run(self):
-        self.progress.emit(25)
-        self.progress.emit(75)
-        self.gitManager.push()
-        self.progress.emit(100)
-
-# Worker thread for Git pull operations
-class GitPullWorker(QThread):
-    progress = pyqtSignal(int)  # Progress update signal
-    log = pyqtSignal(str)      # Log message update signal
-    finished = pyqtSignal()    # Operation completion signal
-
-    def __init__(self, gitManager, selected_paths, download_path):
-        super().__init__()
-        self.gitManager = gitManager
-        self.selected_paths = selected_paths
-        self.download_path = download_path
-
-    def run(self):
-        self.progress.emit(10)
-        self.gitManager.get_file(self.selected_paths, self.download_path, show_process=True, progress=self.progress)
-        self.progress.emit(100)
-
-class GitRefreshWorker(QThread):
-    progress = pyqtSignal(int)  # Progress update signal
-    log = pyqtSignal(str)      # Log message update signal
-    finished = pyqtSignal()    # Operation completion signal
-
-    def __init__(self, gitManager, listWidget):
-        super().__init__()
-        self.gitManager = gitManager
-        self.listWidget = listWidget
-    
-    def run(self):
-        self.progress.emit(10)
-        self.update_custom_list()
-        self.progress.emit(100)
-        
-    def update_custom_list(self):
-        """Update the Custom List with remote files."""
-        self.listWidget.clear()
-        if self.gitManager is None:
-            return
-        self.progress.emit(60)
-        remote_files = self.gitManager.get_remote_file_list()
-        self.progress.emit(85)
-        if remote_files is None:
-            return
-        for file_name in remote_files:
-            self.listWidget.addItem(file_name)
-        self.progress.emit(100)
+        self.loop_thread = loop_thread
+        self.make_coroutine = make_coroutine  # make_coroutine(report) -> coroutine of the AsyncGitManager
+        self.future = None
+        self.cancelled = False
+
+    def start(self):
+        self.future = self.loop_thread.submit(self.make_coroutine(self.report))
+        self.future.add_done_callback(self.done)
+
+    def cancel(self):
+        # stops at the next cancellation point, an interrupted push is resumed by the next one
+        if self.future is not None:
+            self.future.cancel()
+
+    def done(self, future):
+        result = None
+        self.cancelled = future.cancelled()
+        if not self.cancelled:
+            try:
+                result = future.result()
+            except Exception as e:
+                self.log.emit(f"Error :: {e}")
+        self.finished.emit(result)
+
+    def report(self, snapshot):
+        self.progress.emit(snapshot["percent"])
+        self.log.emit(format_progress(snapshot))
 
 # Main application window
 class MainWindow(QMainWindow):
+    log_message = pyqtSignal(str)  # finished phases of every operation, from the worker threads
+    listing_ready = pyqtSignal(object)  # (index sha, IndexStore.listing()) read by a worker thread
+
     def __init__(self):
         super().__init__()
         
@@ -83,6 +65,12 @@ class MainWindow(QMainWindow):
         self.push_root = None
         self.pull_root = None
         self.gitManager = None  # Initialized later when push_root is set
+        # every git operation runs on one background event loop, several at a time
+        self.loop_thread = EventLoopThread()
+        self.asyncManager = None
+        self.operations = []  # running GitOperations
+        self.log_message.connect(self.update_log)
+        self.listing_ready.connect(self.fill_list)
         
         # 설정 불러오기
         self.setting_panel = QWidget()
@@ -132,11 +120,25 @@ class MainWindow(QMainWindow):
         self.list_splitter = QSplitter(Qt.Horizontal)
         list_layout.addWidget(self.list_splitter)
 
-        # Set up QListWidget
-        self.listWidget = QListWidget()
-        self.listWidget.setSelectionMode(QListWidget.MultiSelection)  # Enable multi-selection
-        self.listWidget.setDragEnabled(True)  # Enable drag
-        self.list_splitter.addWidget(self.listWidget)
+        # Set up the remote files view: only the visible rows are ever drawn
+        self.remoteFiles = RemoteFilesModel(self)
+        self.remoteFilter = RemoteFilesFilter(self)
+        self.remoteFilter.setSourceModel(self.remoteFiles)
+        self.remoteView = QTableView()
+        self.remoteView.setModel(self.remoteFilter)
+        self.remoteView.setSelectionMode(QAbstractItemView.MultiSelection)  # Enable multi-selection
+        self.remoteView.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.remoteView.setDragEnabled(True)  # Enable drag
+        self.remoteView.setShowGrid(False)
+        self.remoteView.verticalHeader().hide()
+        self.remoteView.verticalHeader().setDefaultSectionSize(22)  # fixed row height: no per-row layout
+        self.remoteView.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        remote_panel = QWidget()
+        remote_layout = QVBoxLayout(remote_panel)
+        remote_layout.setContentsMargins(0, 0, 0, 0)
+        remote_layout.addLayout(self.create_filter_bar())
+        remote_layout.addWidget(self.remoteView)
+        self.list_splitter.addWidget(remote_panel)
 
         # Add right panel for Custom List
         self.list_right_panel = self.create_list_right_panel()
@@ -172,8 +174,8 @@ class MainWindow(QMainWindow):
         self.treeView.activated.connect(self.open_file)
         self.treeView.setContextMenuPolicy(Qt.CustomContextMenu)
         self.treeView.customContextMenuRequested.connect(self.show_context_menu)
-        self.listWidget.itemSelectionChanged.connect(self.update_list_remove_button)
-        self.listWidget.itemSelectionChanged.connect(self.update_list_file_info)
+        self.remoteView.selectionModel().selectionChanged.connect(self.update_list_remove_button)
+        self.remoteView.selectionModel().selectionChanged.connect(self.update_list_file_info)
         self.tab_widget.currentChanged.connect(self.on_tab_changed)
 
         # Initialize labels
@@ -204,6 +206,10 @@ class MainWindow(QMainWindow):
         if user and repo and pat:
             if self.gitManager:
                 self.gitManager.set_repo_url(git_user=user, git_repo=repo, git_pat=pat)
+        elif not user and self.gitpub_url_input.text():
+            # not a GitHub SSH url: any other git remote (https://, file://, local bare repository)
+            if self.gitManager:
+                self.gitManager.set_remote_url(self.gitpub_url_input.text())
 
     def load_settings(self):
         """JSON 파일에서 설정을 불러와 UI에 반영합니다."""
@@ -300,6 +306,10 @@ class MainWindow(QMainWindow):
         git_pull_btn.clicked.connect(self.async_git_pull)
         right_layout.addWidget(git_pull_btn)
 
+        git_pin_btn = QPushButton("Download && Keep Offline")
+        git_pin_btn.clicked.connect(lambda: self.async_git_pull(pin=True))
+        right_layout.addWidget(git_pin_btn)
+
         right_layout.addStretch()
         return right_panel
     
@@ -356,8 +366,8 @@ class MainWindow(QMainWindow):
                 (For security, ensure that the PAT is only accessible to the storage repository created above.)
                 - Example: GitHub PAT: github_pat_ABCDEF~~
 
-            CAUTION!: If you set a directory that has already been git-initialized as the storage folder,
-                        IT WILL ERASE THE ENTIRE GIT HISTORY!
+            Git objects are kept in a mirror under ~/.github_cloud (or $GITHUB_CLOUD_HOME),
+                the storage folder itself is never git-initialized.
         """)
         setting_layout.addWidget(explain_label)
         
@@ -373,18 +383,90 @@ class MainWindow(QMainWindow):
         else:
             self.gitpub_pat_input.setEchoMode(QLineEdit.Normal)    # 일반 텍스트로 표시
 
-    def async_refresh_list(self):
-        self.worker = GitRefreshWorker(self.gitManager, self.listWidget)
-        self.worker.progress.connect(self.update_progress)
-        self.worker.log.connect(self.update_log)
-        self.worker.finished.connect(self.on_git_push_finished)
+    def get_async_manager(self):
+        """AsyncGitManager of the current GitManager (replaced when another folder is specified)."""
+        if self.asyncManager is None or self.asyncManager.gitManager is not self.gitManager:
+            self.asyncManager = AsyncGitManager(self.gitManager)
+            self.gitManager.metrics.add_exporter(CallbackExporter(self.log_message.emit))
+        return self.asyncManager
+
+    def start_operation(self, label, make_coroutine, on_result=None):
+        """Run a coroutine of the AsyncGitManager with its own progress dialog, next to the running ones."""
+        operation = GitOperation(self.loop_thread, make_coroutine)
+        progress_dialog = QProgressDialog(label, "Cancel", 0, 100, self)
+        progress_dialog.setAutoClose(False)
+        progress_dialog.setAutoReset(False)
+        operation.progress.connect(progress_dialog.setValue)
+        operation.log.connect(self.update_log)
+        operation.finished.connect(lambda result: self.on_operation_finished(operation, progress_dialog, result, on_result))
+        progress_dialog.canceled.connect(operation.cancel)
+        progress_dialog.show()
+        self.operations.append(operation)
+        operation.start()
 
-        self.progress_dialog = QProgressDialog("Refreshing from Git...", "Cancel", 0, 100, self)
-        self.progress_dialog.setWindowModality(Qt.WindowModal)
-        self.progress_dialog.canceled.connect(self.worker.terminate)
-        self.progress_dialog.show()
-
-        self.worker.start()
+    def async_refresh_list(self):
+        if self.gitManager is None:
+            self.remoteFiles.set_rows([])
+            return
+        asyncManager = self.get_async_manager()
+        def read_listing(gitManager):
+            store = gitManager.get_cached_file_list()
+            return None if store is None else (store.sha, store.listing())
+        async def refresh(report):
+            # stale-while-revalidate: show the cached listing first
+            cached = await asyncManager.run(read_listing)
+            if cached is not None:
+                self.listing_ready.emit(cached)
+            await asyncManager.list(progress=report)
+            listing = await asyncManager.run(read_listing)
+            if listing is not None and (cached is None or listing[0] != cached[0]):
+                self.listing_ready.emit(listing)
+        self.start_operation("Refreshing from Git...", refresh)
+
+    def fill_list(self, listing):
+        """Apply a refreshed listing: only the rows that changed are touched."""
+        _, rows = listing
+        self.remoteFiles.set_rows(rows)
+
+    def create_filter_bar(self):
+        """Name / size / date filter of the remote files, applied while typing."""
+        filter_layout = QHBoxLayout()
+        self.filter_inputs = {}
+        for key, placeholder, width in [("name", "Filter by name (text or *.jpg)", None),
+                                        ("min_size", "Min MB", 60), ("max_size", "Max MB", 60),
+                                        ("since", "From YYYY-MM-DD", 110), ("until", "To YYYY-MM-DD", 110)]:
+            line_edit = QLineEdit()
+            line_edit.setPlaceholderText(placeholder)
+            if width:
+                line_edit.setMaximumWidth(width)
+            line_edit.textChanged.connect(lambda _: self.filter_timer.start())
+            filter_layout.addWidget(line_edit)
+            self.filter_inputs[key] = line_edit
+        # one filter pass once typing pauses, not one per key
+        self.filter_timer = QTimer(self)
+        self.filter_timer.setSingleShot(True)
+        self.filter_timer.setInterval(200)
+        self.filter_timer.timeout.connect(self.apply_filter)
+        return filter_layout
+
+    def apply_filter(self):
+        values = {key: line_edit.text().strip() for key, line_edit in self.filter_inputs.items()}
+        def megabytes(text):
+            try:
+                return int(float(text) * 1024 * 1024) if text else None
+            except ValueError:
+                return None
+        def date(text):
+            try:
+                return datetime.strptime(text, "%Y-%m-%d").date() if text else None
+            except ValueError:
+                return None
+        self.remoteFilter.set_filter(values["name"], megabytes(values["min_size"]), megabytes(values["max_size"]),
+                                     date(values["since"]), date(values["until"]))
+
+    def selected_remote_paths(self):
+        rows = self.remoteView.selectionModel().selectedRows()
+        return [self.remoteFiles.path(self.remoteFilter.mapToSource(index).row()) for index in rows]
 
     def specify_folder(self):
         """Specify the directory for the File Explorer tab."""
@@ -439,52 +521,36 @@ class MainWindow(QMainWindow):
         if self.push_root is None or self.gitManager is None:
             QMessageBox.warning(self, "Error", "Please specify a folder first.")
             return
-        self.worker = GitPushWorker(self.gitManager)
-        self.worker.progress.connect(self.update_progress)
-        self.worker.finished.connect(self.on_git_push_finished)
-
-        self.progress_dialog = QProgressDialog("Pushing to Git...", "Cancel", 0, 100, self)
-        self.progress_dialog.setWindowModality(Qt.WindowModal)
-        self.progress_dialog.canceled.connect(self.worker.terminate)
-        self.progress_dialog.show()
-
-        self.worker.start()
+        asyncManager = self.get_async_manager()
+        self.start_operation("Pushing to Git...", lambda report: asyncManager.push(progress=report))
 
-    def async_git_pull(self):
-        """Asynchronously pull selected files from Git."""
+    def async_git_pull(self, pin=False):
+        """Asynchronously pull selected files from Git. pin: keep them in the download cache for offline use."""
         if self.pull_root is None:
             QMessageBox.warning(self, "Error", "Please specify a download folder first.")
             return
         download_path = self.pull_root
-        selected_items = self.listWidget.selectedItems()
-        if not selected_items:
+        selected_paths = self.selected_remote_paths()
+        if not selected_paths:
             return
 
-        selected_paths = [item.text() for item in selected_items]
-        self.worker = GitPullWorker(self.gitManager, selected_paths, download_path)
-        self.worker.progress.connect(self.update_progress)
-        self.worker.log.connect(self.update_log)
-        self.worker.finished.connect(self.on_git_push_finished)
-
-        self.progress_dialog = QProgressDialog("Pulling from Git...", "Cancel", 0, 100, self)
-        self.progress_dialog.setWindowModality(Qt.WindowModal)
-        self.progress_dialog.canceled.connect(self.worker.terminate)
-        self.progress_dialog.show()
-
-        self.worker.start()
-
-    def update_progress(self, value):
-        """Update the progress dialog."""
-        self.progress_dialog.setValue(value)
+        asyncManager = self.get_async_manager()
+        self.start_operation("Pulling from Git...", lambda report: asyncManager.get_file(selected_paths, download_path, progress=report, pin=pin))
 
     def update_log(self, message):
-        """Placeholder for log updates (not implemented)."""
-        pass
+        """Show the last finished phase (from the metrics of the worker) in the status bar."""
+        self.statusBar().showMessage(message.strip())
 
-    def on_git_push_finished(self):
+    def on_operation_finished(self, operation, progress_dialog, result, on_result=None):
         """Handle completion of Git operations."""
-        self.progress_dialog.close()
-        QMessageBox.information(self, "Git Operation", "Operation completed!")
+        self.operations.remove(operation)
+        progress_dialog.close()
+        if on_result is not None:
+            on_result(result)
+        if operation.cancelled:
+            QMessageBox.information(self, "Git Operation", "Operation cancelled.")
+        else:
+            QMessageBox.information(self, "Git Operation", "Operation completed!")
 
     def remove_selected(self):
         """Remove selected items from the current tab."""
@@ -506,19 +572,18 @@ class MainWindow(QMainWindow):
                         if not QFile(path).remove():
                             QMessageBox.warning(self, "Error", f"Failed to delete: {path}")
         else:  # Custom List tab
-            selected_items = self.listWidget.selectedItems()
-            if not selected_items:
+            selected_paths = self.selected_remote_paths()
+            if not selected_paths:
                 QMessageBox.information(self, "No Selection", "No items selected.")
                 return
             reply = QMessageBox.question(self, "Confirm Delete", "Are you sure?",
                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
             if reply == QMessageBox.Yes:
-                for item in selected_items:
-                    file_path = os.path.join(self.push_root, item.text())
-                    if QFile(file_path).remove():
-                        self.listWidget.takeItem(self.listWidget.row(item))
-                    else:
+                for path in selected_paths:
+                    file_path = os.path.join(self.push_root, path)
+                    if not QFile(file_path).remove():
                         QMessageBox.warning(self, "Error", f"Failed to delete: {file_path}")
+                self.remoteView.clearSelection()
 
     def update_tree_remove_button(self):
         """Enable/disable the Remove Selected button in the File Explorer tab."""
@@ -616,12 +681,15 @@ class MainWindow(QMainWindow):
                 QMessageBox.warning(self, "Error", "Please specify a download folder first.")
                 return
             
+            if self.gitManager is None:
+                QMessageBox.warning(self, "Error", "Please specify a folder first.")
+                return
+
             download_path = self.pull_root
-            for file_name in file_names:
-                if file_name:  # Skip empty strings
-                    self.gitManager.get_file([file_name], download_path)  # Download file
-            
-            QMessageBox.information(self, "Download Complete", "Files downloaded successfully!")
+            file_names = [file_name for file_name in file_names if file_name]  # Skip empty strings
+            # downloaded on a fork in the background like every pull, the GUI stays responsive
+            asyncManager = self.get_async_manager()
+            self.start_operation("Pulling from Git...", lambda report: asyncManager.get_file(file_names, download_path, progress=report))
             event.acceptProposedAction()
 
 if __name__ == '__main__':
@@ -0,0 +1,296 @@
+import re
+import json
+import hashlib
+import sqlite3
+import functools
+import threading
+from utils import is_splitted_file
+
+SCHEMA_VERSION = 5
+SHARD_PREFIX_LENGTH = 2  # 256 shards
+BUSY_TIMEOUT = 600  # seconds a write waits for the write lock of another connection
+
+def shard_of(path):
+    """Shard of a path: prefix of the hash of the path, so shards stay evenly sized."""
+    return hashlib.sha1(path.encode('utf-8')).hexdigest()[:SHARD_PREFIX_LENGTH]
+
+def file_name_of(path):
+    """(name, extension) a stored path stands for: name.splitN of older versions is name."""
+    match = is_splitted_file(path)
+    name = path[:match.start()] if match else path
+    base = name.rsplit('/', 1)[-1]
+    return name, base.rsplit('.', 1)[1].lower() if '.' in base.strip('.') else ""
+
+def timestamp_bound(value, end=False):
+    """date / datetime as a timestamp of generate_timestamp(), a whole day when value is a date."""
+    if isinstance(value, str) or value is None:
+        return value
+    if not hasattr(value, "hour"):
+        return value.strftime("date%y%m%d@235959" if end else "date%y%m%d@000000")
+    return value.strftime("date%y%m%d@%H%M%S")
+
+@functools.lru_cache(maxsize=32)
+def compile_regex(pattern):
+    return re.compile(pattern)
+
+class IndexStore:
+    """Local SQLite copy of the remote indices, tagged with the index commit it was built from.
+
+    Works like the old indices dict for reading: `path in store`, `store[path]` (list of versions),
+    iteration over paths in sorted order (streamed from the database) and len().
+    Appends stay in an open transaction until commit(), so a failed push leaves nothing behind."""
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        # every fork of a GitManager has its own connection: a writer waits while a push holds the
+        # write lock over the index upload (readers never wait in WAL mode)
+        self.conn = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            # only a cache of the remote: rebuild it on format change
+            self.conn.executescript("""
+                DROP TABLE IF EXISTS meta;
+                DROP TABLE IF EXISTS versions;
+                DROP TABLE IF EXISTS chunks;
+                DROP TABLE IF EXISTS shards;
+                DROP TABLE IF EXISTS archives;
+                DROP TABLE IF EXISTS files;
+            """)
+            self.conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            CREATE TABLE IF NOT EXISTS versions (
+                path TEXT NOT NULL, seq INTEGER NOT NULL, shard TEXT NOT NULL,
+                timestamp TEXT NOT NULL, size INTEGER, version TEXT NOT NULL,
+                PRIMARY KEY (path, seq)) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS versions_shard ON versions (shard);
+            CREATE TABLE IF NOT EXISTS chunks (hash TEXT PRIMARY KEY, timestamp TEXT NOT NULL, codec TEXT) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS shards (shard TEXT PRIMARY KEY, blob TEXT NOT NULL) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS archives (timestamp TEXT PRIMARY KEY, branch TEXT NOT NULL) WITHOUT ROWID;
+            -- latest version of every path, with the secondary indexes of query()
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY, shard TEXT NOT NULL, name TEXT NOT NULL, extension TEXT NOT NULL,
+                size INTEGER, timestamp TEXT NOT NULL) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS files_shard ON files (shard);
+            CREATE INDEX IF NOT EXISTS files_size ON files (size);
+            CREATE INDEX IF NOT EXISTS files_timestamp ON files (timestamp);
+            CREATE INDEX IF NOT EXISTS files_extension ON files (extension);
+        """)
+        # `name REGEXP pattern` in query()
+        self.conn.create_function("regexp", 2, lambda pattern, value: compile_regex(pattern).search(value) is not None, deterministic=True)
+        self.conn.commit()
+
+    @property
+    def sha(self):
+        """Index commit this store was built from (None if never loaded)."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'sha'").fetchone()
+        return row[0] if row else None
+
+    @property
+    def archives_blob(self):
+        """Blob id of the archives file this store holds (None if there is none)."""
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'archives_blob'").fetchone()
+        return row[0] if row else None
+
+    def __contains__(self, path):
+        return self.conn.execute("SELECT 1 FROM files WHERE path = ?", (path,)).fetchone() is not None
+
+    def __getitem__(self, path):
+        rows = self.conn.execute("SELECT version FROM versions WHERE path = ? ORDER BY seq", (path,)).fetchall()
+        if not rows:
+            raise KeyError(path)
+        return [json.loads(row[0]) for row in rows]
+
+    def __iter__(self):
+        # a separate cursor, so listing does not load every path at once
+        cursor = self.conn.execute("SELECT path FROM files ORDER BY path")
+        for (path,) in cursor:
+            yield path
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def latest(self, path):
+        row = self.conn.execute("SELECT version FROM versions WHERE path = ? ORDER BY seq DESC LIMIT 1", (path,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def listing(self):
+        """[(path, size, timestamp)] of the latest version of every path, sorted by path.
+        size is None for entries pushed by older versions."""
+        return self.conn.execute("SELECT path, size, timestamp FROM files ORDER BY path").fetchall()
+
+    def query(self, prefix="", glob=None, regex=None, extension=None, min_size=None, max_size=None, since=None, until=None, limit=None):
+        """Stream (path, size, timestamp) of the latest version of every path matching all the given filters, by path.
+
+        prefix: start of the path. glob: shell pattern (* ? [...], case-sensitive) of the whole path,
+        regex: searched in the path. Both see legacy name.splitN entries as name.
+        extension: without the dot, case-insensitive. min_size / max_size: bytes, both included.
+        since / until: date, datetime or timestamp string, both included.
+        The path, size, timestamp and extension indexes narrow the search, only the rows they select are read."""
+        conditions, args = [], []
+        if glob:
+            # the literal start of the pattern narrows it like a prefix, a literal *.ext like an extension
+            literal = re.split(r'[*?\[]', glob, 1)[0]
+            prefix = literal if literal.startswith(prefix) else prefix
+            ending = re.search(r'\.([^*?\[\]./]+)$', glob)
+            if extension is None and ending:
+                extension = ending.group(1)
+            conditions.append("name GLOB ?")
+            args.append(glob)
+        if prefix:
+            conditions.append("path >= ?")
+            args.append(prefix)
+            if ord(prefix[-1]) < 0x10ffff:
+                conditions.append("path < ?")
+                args.append(prefix[:-1] + chr(ord(prefix[-1]) + 1))
+        if regex:
+            conditions.append("name REGEXP ?")
+            args.append(regex)
+        if extension is not None:
+            conditions.append("extension = ?")
+            args.append(extension.lstrip('.').lower())
+        ranges = 0
+        for condition, value in (("size >= ?", min_size), ("size <= ?", max_size),
+                                 ("timestamp >= ?", timestamp_bound(since)), ("timestamp <= ?", timestamp_bound(until, end=True))):
+            if value is not None:
+                conditions.append(condition)
+                args.append(value)
+                ranges += 1
+        sql = "SELECT path, size, timestamp FROM files"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        # the path and extension indexes already hold the rows in path order. With a size / date range only,
+        # SQLite would rather walk every path than sort: +path lets it search the size / timestamp index first
+        sql += " ORDER BY +path" if ranges and not prefix and extension is None else " ORDER BY path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        # a separate cursor: rows are read as the caller iterates
+        cursor = self.conn.execute(sql, args)
+        for row in cursor:
+            yield row
+
+    def known_chunk(self, chunk_hash):
+        """(timestamp of the branch holding the chunk, codec it is stored with), or None."""
+        return self.conn.execute("SELECT timestamp, codec FROM chunks WHERE hash = ?", (chunk_hash,)).fetchone()
+
+    def append(self, path, version):
+        with self.lock:
+            seq = self.conn.execute("SELECT COALESCE(MAX(seq) + 1, 0) FROM versions WHERE path = ?", (path,)).fetchone()[0]
+            self._insert(path, seq, version)
+
+    def _insert(self, path, seq, version):
+        if isinstance(version, dict):
+            timestamp, size = version["timestamp"], version.get("size")
+            self.conn.executemany("INSERT OR IGNORE INTO chunks (hash, timestamp, codec) VALUES (?, ?, ?)",
+                                  ((chunk[0], chunk[2], chunk[3] if len(chunk) > 3 else None) for chunk in version.get("chunks", ())))
+        else:
+            timestamp, size = version, None
+        shard = shard_of(path)
+        self.conn.execute("INSERT INTO versions (path, seq, shard, timestamp, size, version) VALUES (?, ?, ?, ?, ?, ?)",
+                          (path, seq, shard, timestamp, size, json.dumps(version, separators=(',', ':'))))
+        # versions come in seq order: the last one inserted is the latest
+        self.conn.execute("INSERT OR REPLACE INTO files (path, shard, name, extension, size, timestamp) VALUES (?, ?, ?, ?, ?, ?)",
+                          (path, shard, *file_name_of(path), size, timestamp))
+
+    def _import(self, data):
+        for path, versions in data.items():
+            for seq, version in enumerate(versions):
+                self._insert(path, seq, version)
+
+    def import_json(self, data, sha):
+        """Replace the whole store with an indices dict (the old monolithic JSON format) built from index commit sha."""
+        with self.lock:
+            self.conn.execute("DELETE FROM versions")
+            self.conn.execute("DELETE FROM files")
+            self.conn.execute("DELETE FROM chunks")
+            self.conn.execute("DELETE FROM shards")
+            self.conn.execute("DELETE FROM archives")
+            self.conn.execute("DELETE FROM meta WHERE key = 'archives_blob'")
+            self._import(data)
+            self._set_sha(sha)
+            self.conn.commit()
+
+    def import_shard(self, shard, data, blob):
+        """Replace the entries of one shard. Call commit() once every changed shard is in."""
+        with self.lock:
+            self.conn.execute("DELETE FROM versions WHERE shard = ?", (shard,))
+            self.conn.execute("DELETE FROM files WHERE shard = ?", (shard,))
+            self._import(data)
+            self.conn.execute("INSERT OR REPLACE INTO shards (shard, blob) VALUES (?, ?)", (shard, blob))
+
+    def remove_shard(self, shard):
+        with self.lock:
+            self.conn.execute("DELETE FROM versions WHERE shard = ?", (shard,))
+            self.conn.execute("DELETE FROM files WHERE shard = ?", (shard,))
+            self.conn.execute("DELETE FROM shards WHERE shard = ?", (shard,))
+
+    def set_shard_blob(self, shard, blob):
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO shards (shard, blob) VALUES (?, ?)", (shard, blob))
+
+    def shard_blobs(self):
+        """shard_blobs[shard] = blob id of the shard file this store holds."""
+        return dict(self.conn.execute("SELECT shard, blob FROM shards"))
+
+    def shards(self):
+        return [row[0] for row in self.conn.execute("SELECT DISTINCT shard FROM versions ORDER BY shard")]
+
+    def export_shard(self, shard):
+        """One shard as compact JSON bytes, in the {path: [versions]} format."""
+        parts = ["{"]
+        current = None
+        for path, version in self.conn.execute("SELECT path, version FROM versions WHERE shard = ? ORDER BY path, seq", (shard,)):
+            if path != current:
+                parts.append("]," if current is not None else "")
+                parts.append(json.dumps(path) + ":[")
+                current = path
+            else:
+                parts.append(",")
+            parts.append(version)
+        parts.append("]}" if current is not None else "}")
+        return "".join(parts).encode('utf-8')
+
+    def archive_of(self, timestamp):
+        """Archive branch now holding the branch timestamp, or None if it was not compacted."""
+        row = self.conn.execute("SELECT branch FROM archives WHERE timestamp = ?", (timestamp,)).fetchone()
+        return row[0] if row else None
+
+    def set_archives(self, archives):
+        """Add archives[timestamp] = archive branch. Stays in the open transaction until commit()."""
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO archives (timestamp, branch) VALUES (?, ?)", archives.items())
+
+    def import_archives(self, data, blob):
+        with self.lock:
+            self.conn.execute("DELETE FROM archives")
+            self.conn.executemany("INSERT INTO archives (timestamp, branch) VALUES (?, ?)", data.items())
+            self._set_archives_blob(blob)
+
+    def set_archives_blob(self, blob):
+        with self.lock:
+            self._set_archives_blob(blob)
+
+    def _set_archives_blob(self, blob):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('archives_blob', ?)", (blob,))
+
+    def export_archives(self):
+        """The archives file as compact JSON bytes, {timestamp: archive branch}."""
+        data = dict(self.conn.execute("SELECT timestamp, branch FROM archives ORDER BY timestamp"))
+        return json.dumps(data, separators=(',', ':')).encode('utf-8')
+
+    def _set_sha(self, sha):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('sha', ?)", (sha,))
+
+    def commit(self, sha):
+        with self.lock:
+            self._set_sha(sha)
+            self.conn.commit()
+
+    def rollback(self):
+        with self.lock:
+            self.conn.rollback()
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,80 @@
+import os
+import json
+
+class Journal:
+    """What an unfinished push planned and how far it got, kept on disk until the push is complete.
+
+    states: "landed"  some batches are confirmed on the remote, the rest is not staged yet:
+                      the next push continues the branch from the last one
+            "staged"  the timestamp branch is committed in the mirror
+            "pushed"  the branch is confirmed on the remote, the index is not updated yet
+    A push that failed before its first batch landed leaves no journal: nothing of it is worth keeping."""
+    def __init__(self, path):
+        self.path = path
+        self.data = {}
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                self.data = json.load(f)
+
+    @property
+    def pending(self):
+        return bool(self.data)
+
+    @property
+    def timestamp(self):
+        return self.data.get("timestamp")
+
+    @property
+    def state(self):
+        return self.data.get("state")
+
+    @property
+    def versions(self):
+        """[(relative path, version)] to append to the index once the branch landed."""
+        return [tuple(entry) for entry in self.data.get("versions", [])]
+
+    @property
+    def head(self):
+        """Last batch commit confirmed on the remote ("landed")."""
+        return self.data.get("head")
+
+    @property
+    def landed_files(self):
+        """landed_files[relative path] = version of the files in the landed batches."""
+        return self.data.get("files", {})
+
+    @property
+    def landed_chunks(self):
+        """landed_chunks[chunk hash] = codec (None if stored raw) of the chunks in the landed batches."""
+        return self.data.get("chunks", {})
+
+    def land(self, timestamp, head, files, chunks):
+        """Record a batch of timestamp confirmed on the remote, with the versions and chunks it holds."""
+        if self.state not in (None, "landed"):
+            return  # staged: the whole branch is resumed from the mirror
+        if self.timestamp != timestamp:
+            self.data = {"timestamp": timestamp, "state": "landed", "files": {}, "chunks": {}}
+        self.data["head"] = head
+        self.data["files"].update(files)
+        self.data["chunks"].update(chunks)
+        self.write()
+
+    def start(self, timestamp, versions):
+        self.data = {"timestamp": timestamp, "state": "staged", "versions": versions}
+        self.write()
+
+    def update(self, state):
+        self.data["state"] = state
+        self.write()
+
+    def clear(self):
+        self.data = {}
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def write(self):
+        # a crash while writing must not lose the previous state
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, separators=(',', ':'))
+        os.replace(temp_path, self.path)
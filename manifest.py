@@ -0,0 +1,87 @@
+import os
+import stat
+import hashlib
+from utils import *
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+def hash_bytes(data):
+    """Git blob id of data (same as `git hash-object`)."""
+    sha = hashlib.sha1(b"blob %d\0" % len(data))
+    sha.update(data)
+    return sha.hexdigest()
+
+def hash_file(file_path, file_size):
+    """Git blob id of a file, read in HASH_BLOCK_SIZE blocks."""
+    with open(file_path, 'rb') as f:
+        return hash_stream(f, file_size)
+
+def hash_stream(stream, size):
+    """Git blob id of the size bytes a file object reads."""
+    sha = hashlib.sha1(b"blob %d\0" % size)
+    while block := stream.read(HASH_BLOCK_SIZE):
+        sha.update(block)
+    return sha.hexdigest()
+
+def scan_tree(top, excluded_folders=(), excluded_files=()):
+    """Yield (relative path, DirEntry) of every file under top. Relative paths use '/'."""
+    stack = [(top, "")]
+    while stack:
+        path, prefix = stack.pop()
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in excluded_folders:
+                        stack.append((entry.path, prefix + entry.name + "/"))
+                elif entry.is_file(follow_symlinks=False):
+                    if entry.name not in excluded_files:
+                        yield prefix + entry.name, entry
+
+def stat_paths(top, paths, excluded_folders=(), excluded_files=()):
+    """Yield (relative path, absolute path, stat) of the given relative paths that are files."""
+    for rel_path in sorted(set(paths)):
+        parts = rel_path.split("/")
+        if any(part in excluded_folders for part in parts[:-1]) or parts[-1] in excluded_files:
+            continue
+        file_path = os.path.join(top, *parts)
+        try:
+            st = os.lstat(file_path)
+        except FileNotFoundError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            yield rel_path, file_path, st
+
+class Manifest:
+    """size / mtime / content hash of every local file, as of the last successful push."""
+    def __init__(self, manifest_path):
+        self.manifest_path = manifest_path
+        self.entries = {}   # entries[relative path] = {"size", "mtime", "hash"}
+        self.scanned = {}
+        if os.path.exists(manifest_path):
+            self.entries = load_from_json(manifest_path)
+
+    def scan(self, top, excluded_folders=(), excluded_files=(), paths=None):
+        """Yield (relative path, absolute path, record, previous record) for every local file.
+        Files whose size and mtime did not change are not hashed again.
+        paths: only these relative paths (a watcher knows what changed), the other records are kept."""
+        if paths is None:
+            self.scanned = {}
+            files = ((rel_path, entry.path, entry.stat(follow_symlinks=False))
+                     for rel_path, entry in scan_tree(top, excluded_folders, excluded_files))
+        else:
+            paths = set(paths)
+            self.scanned = {rel_path: record for rel_path, record in self.entries.items() if rel_path not in paths}
+            files = stat_paths(top, paths, excluded_folders, excluded_files)
+        for rel_path, file_path, st in files:
+            previous = self.entries.get(rel_path)
+            if previous and previous["size"] == st.st_size and previous["mtime"] == st.st_mtime_ns:
+                record = previous
+            else:
+                record = {"size": st.st_size, "mtime": st.st_mtime_ns, "hash": hash_file(file_path, st.st_size)}
+            self.scanned[rel_path] = record
+            yield rel_path, file_path, record, previous
+
+    def save(self):
+        """Make the last scan the new baseline. Call only after the push landed."""
+        self.entries = self.scanned
+        save_to_json(self.entries, self.manifest_path, indent=None)
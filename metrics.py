@@ -0,0 +1,190 @@
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+class Span:
+    """One timed phase of an operation with its counters (bytes, files, ...)."""
+    def __init__(self, name, operation, parent=None):
+        self.name = name
+        self.operation = operation  # outermost span: push, get_file, ...
+        self.parent = parent
+        self.start = time.time()
+        self.seconds = None
+        self.status = "ok"
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def add(self, counter, value=1):
+        with self.lock:
+            self.counters[counter] = self.counters.get(counter, 0) + value
+
+    def to_dict(self):
+        return {"operation": self.operation, "phase": self.name, "parent": self.parent, "start": self.start,
+                "seconds": self.seconds, "status": self.status, "counters": dict(self.counters)}
+
+class Metrics:
+    """Times every phase as a span and hands finished spans to the exporters.
+    Spans nest per thread: a span opened inside span("push") belongs to the push operation."""
+    def __init__(self, *exporters):
+        self.exporters = list(exporters)
+        self.local = threading.local()
+
+    def add_exporter(self, exporter):
+        self.exporters.append(exporter)
+
+    def remove_exporter(self, exporter):
+        if exporter in self.exporters:
+            self.exporters.remove(exporter)
+
+    @contextmanager
+    def exporting(self, exporter):
+        """Export to exporter for the duration of the with block only."""
+        self.add_exporter(exporter)
+        try:
+            yield exporter
+        finally:
+            self.remove_exporter(exporter)
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def current(self):
+        """Innermost open span of this thread, or None."""
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name, parent: Span = None):
+        """parent: span of another thread this one belongs to, e.g. the push span in an upload thread."""
+        stack = self._stack()
+        parent = stack[-1] if stack else parent
+        span = Span(name, parent.operation if parent else name, parent.name if parent else None)
+        stack.append(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except BaseException:
+            span.status = "error"
+            raise
+        finally:
+            span.seconds = time.perf_counter() - started
+            stack.pop()
+            self.export(span)
+
+    def add(self, counter, value=1):
+        """Count on the innermost span of this thread (ignored outside of any span)."""
+        stack = self._stack()
+        if stack:
+            stack[-1].add(counter, value)
+
+    def export(self, span):
+        record = span.to_dict()
+        for exporter in list(self.exporters):
+            try:
+                exporter.export(record)
+            except Exception as e:
+                # metrics never break an operation
+                print(f"metrics :: {type(exporter).__name__} failed: {e}")
+
+    def close(self):
+        for exporter in self.exporters:
+            exporter.close()
+
+def format_span(record):
+    counters = " ".join(f"{key}={value}" for key, value in record["counters"].items())
+    indent = "    " if record["parent"] else ""
+    status = "" if record["status"] == "ok" else f" [{record['status']}]"
+    return f"{indent}{record['phase']} :: {record['seconds']:.3f}s {counters}{status}".rstrip()
+
+class Exporter:
+    def export(self, record):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class ConsoleExporter(Exporter):
+    """One line per finished phase on stdout."""
+    def export(self, record):
+        print(format_span(record))
+
+class CallbackExporter(Exporter):
+    """One line per finished phase to a callback, e.g. a Qt log signal."""
+    def __init__(self, callback):
+        self.callback = callback
+
+    def export(self, record):
+        self.callback(format_span(record))
+
+class MemoryExporter(Exporter):
+    """Keeps every record in memory, for headless callers and the tests."""
+    def __init__(self):
+        self.records = []
+
+    def export(self, record):
+        self.records.append(record)
+
+    def phases(self, operation=None):
+        return [record["phase"] for record in self.records if operation is None or record["operation"] == operation]
+
+    def find(self, phase):
+        return [record for record in self.records if record["phase"] == phase]
+
+class JsonLinesExporter(Exporter):
+    """Appends one JSON object per finished phase to a file."""
+    def __init__(self, path):
+        self.lock = threading.Lock()
+        self.file = open(path, 'a', encoding='utf-8')
+
+    def export(self, record):
+        with self.lock:
+            self.file.write(json.dumps(record, separators=(',', ':')) + "\n")
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+class PrometheusExporter(Exporter):
+    """Totals per operation and phase in the Prometheus text format, rewritten after every operation
+    (for the node_exporter textfile collector)."""
+    PREFIX = "github_cloud"
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.totals = {}  # totals[(metric, operation, phase)] = value
+
+    def _add(self, metric, record, value):
+        key = (metric, record["operation"], record["phase"])
+        self.totals[key] = self.totals.get(key, 0) + value
+
+    def export(self, record):
+        with self.lock:
+            self._add("phase_seconds_total", record, record["seconds"])
+            self._add("phase_runs_total", record, 1)
+            if record["status"] != "ok":
+                self._add("phase_errors_total", record, 1)
+            for counter, value in record["counters"].items():
+                self._add(f"phase_{counter}_total", record, value)
+            if record["parent"] is None:
+                self.write()
+
+    def write(self):
+        lines = []
+        for metric in sorted({key[0] for key in self.totals}):
+            lines.append(f"# TYPE {self.PREFIX}_{metric} counter")
+            for (name, operation, phase), value in sorted(self.totals.items()):
+                if name == metric:
+                    lines.append(f'{self.PREFIX}_{metric}{{operation="{operation}",phase="{phase}"}} {value}')
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(temp_path, self.path)  # scrapers never see a half written file
+
+def make_exporter(path):
+    """Exporter writing to path: the Prometheus text format for *.prom (textfile collector), JSON lines otherwise."""
+    return PrometheusExporter(path) if path.endswith(".prom") else JsonLinesExporter(path)
@@ -0,0 +1,94 @@
+import os
+import subprocess
+import threading
+
+class MirrorUse:
+    """Operations using the object store of the mirror, shared by the fork()s of a GitManager.
+    Blobs are only pruned while no other operation runs: a running push or fetch may have
+    written objects that no ref points to yet."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.count = 0
+
+    def __enter__(self):
+        with self.lock:  # waits while pruning
+            self.count += 1
+        return self
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.count -= 1
+
+    def try_exclusive(self):
+        """Lock out every operation if none runs. True if locked, release() when done."""
+        self.lock.acquire()
+        if self.count:
+            self.lock.release()
+            return False
+        return True
+
+    def release(self):
+        self.lock.release()
+
+def object_store_size(git_dir):
+    """Bytes of the packs and loose objects of a repository."""
+    total = 0
+    for root, _, files in os.walk(os.path.join(git_dir, "objects")):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+def write_pack(repo, objects, promisor=False):
+    """Pack the given object ids, marked as coming from the promisor remote if promisor.
+    Returns the name of every pack written: pack.packSizeLimit splits them into several."""
+    pack_dir = os.path.join(repo.git_dir, "objects", "pack")
+    process = repo.git.pack_objects('-q', os.path.join(pack_dir, "pack"), istream=subprocess.PIPE, as_process=True)
+    process.proc.stdin.write("".join(f"{sha}\n" for sha in objects).encode())
+    process.proc.stdin.close()
+    names = process.proc.stdout.read().decode().split()  # one line per pack
+    process.wait()
+    if promisor:
+        for name in names:
+            open(os.path.join(pack_dir, f"pack-{name}.promisor"), 'w').close()
+    return names
+
+def prune_blobs(repo):
+    """Repack a blobless mirror without the blobs the remote has (`git repack --filter=blob:none` of newer gits).
+    Kept: commits and trees of every ref, and every object of the local branches the remote does not have
+    (a push to resume). The missing blobs are fetched again from the promisor remote when they are read.
+    Call only while nothing else writes to the repository. Returns the size of the object store after."""
+    objects_dir = os.path.join(repo.git_dir, "objects")
+    pack_dir = os.path.join(objects_dir, "pack")
+    # 0. what is there now, removed once the new packs are written
+    old = [os.path.join(pack_dir, name) for name in os.listdir(pack_dir)
+           if name.startswith("pack-") and not os.path.exists(os.path.join(pack_dir, name.rsplit('.', 1)[0] + ".keep"))]
+    old += [os.path.join(objects_dir, directory, name) for directory in os.listdir(objects_dir) if len(directory) == 2
+            for name in os.listdir(os.path.join(objects_dir, directory))]
+
+    # 1. commits and trees of every ref, the remote has the rest of them
+    listed = repo.git.rev_list('--objects', '--no-object-names', '--all', '--filter=blob:none', '--missing=allow-any')
+    # 2. objects not pushed yet, blobs included
+    local = repo.git.rev_list('--objects', '--no-object-names', '--branches', '--not', '--remotes', '--missing=allow-any')
+    local = set(local.split())
+    remote = [sha for sha in listed.split() if sha not in local]
+    written = set()
+    if remote:
+        written.update(write_pack(repo, remote, promisor=True))
+    if local:
+        written.update(write_pack(repo, sorted(local)))
+
+    # 3. the previous packs and loose objects (a pack written again with the same content has the same name)
+    for path in old:
+        if os.path.basename(path).split('.')[0][len("pack-"):] in written:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    for directory in os.listdir(objects_dir):
+        if len(directory) == 2 and not os.listdir(os.path.join(objects_dir, directory)):
+            os.rmdir(os.path.join(objects_dir, directory))
+    return object_store_size(repo.git_dir)
@@ -0,0 +1,155 @@
+import re
+import time
+import threading
+from git import RemoteProgress, GitCommandError # type: ignore
+from git.cmd import handle_process_output # type: ignore
+
+class OperationCancelled(Exception):
+    """The running operation stopped at a cancellation point because cancel() was called."""
+
+class Progress:
+    """Byte progress of one operation across its phases, with throughput and ETA.
+
+    plan() declares the bytes every phase will move, begin() starts a phase and advance() / set_fraction()
+    move it forward. The callback receives a snapshot dict at most every min_interval seconds."""
+    def __init__(self, callback=None, min_interval=0.2):
+        self.callback = callback
+        self.min_interval = min_interval
+        self.lock = threading.Lock()
+        self.planned = {}  # planned[phase] = bytes
+        self.done = {}  # done[phase] = bytes
+        self.phase = None
+        self.message = ""
+        self.started = time.time()
+        self.last_emit = 0.0
+
+    def plan(self, phases):
+        with self.lock:
+            self.planned.update(phases)
+
+    def begin(self, phase, total=None):
+        with self.lock:
+            self.phase = phase
+            if total is not None:
+                self.planned[phase] = total
+            self.done.setdefault(phase, 0)
+            self.message = ""
+        self.emit(force=True)
+
+    def advance(self, nbytes, message=None, phase=None):
+        """phase: a phase running next to the current one (uploads while staging), the current one by default."""
+        with self.lock:
+            phase = phase or self.phase
+            self.done[phase] = self.done.get(phase, 0) + nbytes
+            if message is not None:
+                self.message = message
+        self.emit()
+
+    def set_fraction(self, fraction, message=None, phase=None):
+        """Position in the phase as a fraction of its planned bytes (git reports percentages)."""
+        with self.lock:
+            phase = phase or self.phase
+            self.done[phase] = int(self.planned.get(phase, 0) * min(max(fraction, 0.0), 1.0))
+            if message is not None:
+                self.message = message
+        self.emit()
+
+    def end(self):
+        with self.lock:
+            if self.phase in self.planned:
+                self.done[self.phase] = self.planned[self.phase]
+        self.emit(force=True)
+
+    def snapshot(self):
+        with self.lock:
+            total = sum(self.planned.values())
+            done = sum(min(self.done.get(phase, 0), size) for phase, size in self.planned.items())
+            elapsed = max(time.time() - self.started, 1e-6)
+            rate = done / elapsed
+            return {
+                "phase": self.phase,
+                "done": done,
+                "total": total,
+                "percent": int(done * 100 / total) if total else 0,
+                "phase_done": self.done.get(self.phase, 0),
+                "phase_total": self.planned.get(self.phase),
+                "bytes_per_second": rate,
+                "eta": (total - done) / rate if rate and done * 100 >= total else None,  # after 1%
+                "message": self.message,
+            }
+
+    def emit(self, force=False):
+        if self.callback is None:
+            return
+        now = time.time()
+        if not force and now - self.last_emit < self.min_interval:
+            return
+        self.last_emit = now
+        self.callback(self.snapshot())
+
+def format_progress(snapshot):
+    """'upload 45% 120.0 / 266.5 MB, 3.2 MB/s, 45s left' for log lines."""
+    mb = 1024 * 1024
+    text = f"{snapshot['phase']} {snapshot['percent']}% {snapshot['done'] / mb:.1f} / {snapshot['total'] / mb:.1f} MB"
+    if snapshot["bytes_per_second"]:
+        text += f", {snapshot['bytes_per_second'] / mb:.1f} MB/s"
+    if snapshot["eta"] is not None:
+        text += f", {snapshot['eta']:.0f}s left"
+    if snapshot["message"]:
+        text += f" ({snapshot['message']})"
+    return text
+
+class GitProgress(RemoteProgress):
+    """Feeds `git --progress` output into a Progress: writing objects on push, receiving objects on fetch."""
+    TRACKED = {RemoteProgress.WRITING: "writing objects", RemoteProgress.RECEIVING: "receiving objects"}
+
+    def __init__(self, progress: Progress, part=(0, 1), phase=None):
+        super().__init__()
+        self.progress = progress
+        self.index, self.count = part  # batch index of count batches within the phase
+        self.phase = phase
+
+    def update(self, op_code, cur_count, max_count=None, message=''):
+        stage = op_code & self.OP_MASK
+        if stage in self.TRACKED and max_count:
+            fraction = (self.index + float(cur_count) / float(max_count)) / self.count
+            details = message.strip(", ")
+            self.progress.set_fraction(fraction, f"{self.TRACKED[stage]} {int(cur_count)}/{int(max_count)}" + (f", {details}" if details else ""), self.phase)
+
+def run_git(git, command, *args, progress: Progress = None, part=(0, 1), phase=None, cancel: threading.Event = None, config=(), **kwargs):
+    """Run git push / fetch, with --progress parsed into progress (into phase if given) when one is given.
+    Setting cancel kills git and raises OperationCancelled. config: ["key=value"] for this command only (git -c)."""
+    if config:
+        git = git(c=list(config))
+    if (progress is None or progress.callback is None) and cancel is None:
+        return getattr(git, command)(*args, **kwargs)
+    if cancel is not None and cancel.is_set():
+        raise OperationCancelled()
+    handler = GitProgress(progress or Progress(), part, phase)
+    process = getattr(git, command)('--progress', *args, as_process=True, **kwargs)
+    finished = threading.Event()
+    def watch():
+        while not finished.wait(0.2):
+            if cancel.is_set():
+                process.proc.terminate()
+                return
+    if cancel is not None:
+        threading.Thread(target=watch, daemon=True).start()
+    def finalize(process):
+        try:
+            process.wait()
+        except GitCommandError as e:
+            if cancel is not None and cancel.is_set():
+                raise OperationCancelled() from e
+            # stderr went to the progress parser: put git's own error lines back
+            e.stderr = "\n  stderr: '%s'" % "\n".join(handler.error_lines + handler.other_lines)
+            raise
+        finally:
+            finished.set()
+    parse = handler.new_message_handler()
+    def on_stderr(line):
+        # git redraws its progress with \r: one update per segment
+        for part in re.split(rb'[\r\n]', line):
+            if part:
+                parse(part)
+    handle_process_output(process, None, on_stderr, finalize, decode_streams=False)
@@ -0,0 +1,199 @@
+import re
+import fnmatch
+from PyQt5.QtCore import Qt, QAbstractTableModel, QSortFilterProxyModel, QModelIndex, QMimeData
+
+def format_size(size):
+    if size is None:
+        return ""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+def format_timestamp(timestamp):
+    # dateYYMMDD@HHMMSS, see generate_timestamp()
+    if not timestamp.startswith("date") or len(timestamp) != 17:
+        return timestamp
+    return f"20{timestamp[4:6]}-{timestamp[6:8]}-{timestamp[8:10]} {timestamp[11:13]}:{timestamp[13:15]}:{timestamp[15:17]}"
+
+class RemoteFilesModel(QAbstractTableModel):
+    """Latest version of every remote file: name, size, date. Rows are IndexStore.listing() tuples.
+
+    The view only gets FETCH_SIZE more rows whenever it scrolls to the end (canFetchMore / fetchMore),
+    and set_rows() applies the difference with the current rows instead of resetting the model,
+    so a refresh keeps the selection and the scroll position."""
+    COLUMNS = ["Name", "Size", "Modified"]
+    FETCH_SIZE = 1000
+    MAX_DIFF_RUNS = 256  # above this many inserted / removed runs a reset is cheaper
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []  # [(path, size, timestamp)] sorted by path
+        self.loaded = 0  # rows the view knows about
+
+    # 1. model interface
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        path, size, timestamp = self.rows[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            return path if column == 0 else format_size(size) if column == 1 else format_timestamp(timestamp)
+        if role == Qt.UserRole:  # raw values
+            return (path, size, timestamp)[column]
+        if role == Qt.TextAlignmentRole and column == 1:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.COLUMNS[section]
+        return None
+
+    def flags(self, index):
+        return super().flags(index) | Qt.ItemIsDragEnabled
+
+    def mimeTypes(self):
+        return ["text/plain"]
+
+    def mimeData(self, indexes):
+        # one path per line, what MainWindow.dropEvent downloads
+        mime = QMimeData()
+        mime.setText("\n".join(dict.fromkeys(self.rows[index.row()][0] for index in indexes)))
+        return mime
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.loaded < len(self.rows)
+
+    def fetchMore(self, parent=QModelIndex()):
+        count = min(self.FETCH_SIZE, len(self.rows) - self.loaded)
+        if count > 0:
+            self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+            self.loaded += count
+            self.endInsertRows()
+
+    def fetch_all(self):
+        """Expose every row, for filtering: the filter only sees the rows the view knows about."""
+        if self.loaded < len(self.rows):
+            self.beginInsertRows(QModelIndex(), self.loaded, len(self.rows) - 1)
+            self.loaded = len(self.rows)
+            self.endInsertRows()
+
+    def path(self, row):
+        return self.rows[row][0]
+
+    # 2. refresh
+    def set_rows(self, rows):
+        """Replace the rows by rows (sorted by path), signalling only what changed."""
+        if rows == self.rows:
+            return
+        removed, inserted, changed = self.diff(rows)
+        if not self.rows or len(removed) + len(inserted) > self.MAX_DIFF_RUNS:
+            self.beginResetModel()
+            self.rows = list(rows)
+            self.loaded = min(max(self.loaded, self.FETCH_SIZE), len(self.rows))
+            self.endResetModel()
+            return
+        # 2-1. removals from the bottom, so the positions above stay valid
+        for start, count in reversed(removed):
+            visible = min(start + count, self.loaded) - start
+            if visible > 0:
+                self.beginRemoveRows(QModelIndex(), start, start + visible - 1)
+            del self.rows[start:start + count]
+            if visible > 0:
+                self.loaded -= visible
+                self.endRemoveRows()
+        # 2-2. insertions from the top: positions in the new rows
+        for start, count in inserted:
+            visible = start < self.loaded or self.loaded == len(self.rows)
+            if visible:
+                self.beginInsertRows(QModelIndex(), start, start + count - 1)
+            self.rows[start:start] = rows[start:start + count]
+            if visible:
+                self.loaded += count
+                self.endInsertRows()
+        # 2-3. new size / date of files pushed again
+        for row in changed:
+            self.rows[row] = rows[row]
+        visible = [row for row in changed if row < self.loaded]
+        if visible:
+            self.dataChanged.emit(self.index(min(visible), 1), self.index(max(visible), len(self.COLUMNS) - 1))
+
+    def diff(self, rows):
+        """(removed, inserted, changed) going from self.rows to rows, both sorted by path.
+        removed: [(start, count)] in the current rows, inserted: [(start, count)] in rows, changed: [row in rows]."""
+        removed, inserted, changed = [], [], []
+        def add(runs, position):
+            if runs and runs[-1][0] + runs[-1][1] == position:
+                runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+            else:
+                runs.append((position, 1))
+        old, i, j = self.rows, 0, 0
+        while i < len(old) or j < len(rows):
+            if j == len(rows) or (i < len(old) and old[i][0] < rows[j][0]):
+                add(removed, i)
+                i += 1
+            elif i == len(old) or rows[j][0] < old[i][0]:
+                add(inserted, j)
+                j += 1
+            else:
+                if old[i] != rows[j]:
+                    changed.append(j)
+                i += 1
+                j += 1
+        return removed, inserted, changed
+
+class RemoteFilesFilter(QSortFilterProxyModel):
+    """Live filter of a RemoteFilesModel by name (substring, or a glob with * ? [), size range and date range.
+    Reads the rows of the source directly: a filter pass over 500k rows is a plain loop, not 500k data() calls."""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.name = None  # match(path) of the name pattern, None: any name
+        self.min_size = None
+        self.max_size = None
+        self.since = None  # timestamps (dateYYMMDD@HHMMSS) compare as strings
+        self.until = None
+
+    def set_filter(self, name="", min_size=None, max_size=None, since=None, until=None):
+        """since / until: datetime.date, both included."""
+        name = name.strip()
+        if not name:
+            self.name = None
+        elif any(c in name for c in "*?["):
+            self.name = re.compile(fnmatch.translate(name), re.IGNORECASE).match  # the whole path
+        else:
+            self.name = re.compile(re.escape(name), re.IGNORECASE).search  # anywhere in it
+        self.min_size, self.max_size = min_size, max_size
+        self.since = since.strftime("date%y%m%d@000000") if since else None
+        self.until = until.strftime("date%y%m%d@235959") if until else None
+        if self.active():
+            self.sourceModel().fetch_all()
+        self.invalidateFilter()
+
+    def active(self):
+        return any(value is not None for value in (self.name, self.min_size, self.max_size, self.since, self.until))
+
+    def filterAcceptsRow(self, source_row, source_parent):
+        if not self.active():
+            return True
+        path, size, timestamp = self.sourceModel().rows[source_row]
+        if self.name is not None and not self.name(path):
+            return False
+        if (self.min_size is not None or self.max_size is not None) and size is None:
+            return False
+        if self.min_size is not None and size < self.min_size:
+            return False
+        if self.max_size is not None and size > self.max_size:
+            return False
+        if self.since is not None and timestamp < self.since:
+            return False
+        if self.until is not None and timestamp > self.until:
+            return False
+        return True
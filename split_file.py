@@ -1,46 +1,72 @@
 import os
-import re
+import threading
+from manifest import hash_bytes
 
-class BigFile:
-    def __init__(self, file_path, chunk_size=50*1024*1024):
-        self.file_path = file_path
-        self.chunk_size = chunk_size
-        self.splited_file_path = set()
+def preallocate(fd, size):
+    try:
+        os.posix_fallocate(fd, 0, size)
+    except (AttributeError, OSError):
+        # not available on this OS / filesystem
+        os.ftruncate(fd, size)
 
-    def split_file(self):
-        split_dir = os.path.dirname(self.file_path)
-        if not os.path.exists(split_dir):
-            os.makedirs(split_dir)
+class FileAssembler:
+    """Rebuilds chunked files by writing every chunk at its offset as it arrives.
+    Chunks are verified against the hash stored in the index and may come from any number of threads.
+    Memory use is one chunk per writing thread, whatever the file size."""
+    def __init__(self):
+        self.targets = {}  # targets[chunk hash] = [(output path, offset, size)]
+        self.outputs = {}  # outputs[output path] = [fd, chunks left]
+        self.lock = threading.Lock()
+        self.bytes_written = 0
 
-        with open(self.file_path, 'rb') as f:
-            file_name, file_extension = os.path.splitext(os.path.basename(self.file_path))
-            chunk_num = 1
+    def add_file(self, output_path, chunks):
+        # chunks: ordered [hash, size, timestamp(, codec)] list from the index
+        # 0o666: a plain data file, like open(output_path, "wb"), the umask applies
+        fd = os.open(output_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC | getattr(os, "O_BINARY", 0), 0o666)
+        preallocate(fd, sum(chunk[1] for chunk in chunks))
+        offset = 0
+        for chunk_hash, size, *_ in chunks:
+            self.targets.setdefault(chunk_hash, []).append((output_path, offset, size))
+            offset += size
+        self.outputs[output_path] = [fd, len(chunks)]
 
-            while chunk := f.read(self.chunk_size):
-                chunk_filename = os.path.join(split_dir, f"{file_name}{file_extension}.split{chunk_num}")
-                self.splited_file_path.add(chunk_filename)
-                with open(chunk_filename, 'wb') as chunk_file:
-                    chunk_file.write(chunk)
-                chunk_num += 1
+    def write_chunk(self, chunk_hash, data):
+        if hash_bytes(data) != chunk_hash:
+            raise ValueError(f"chunk {chunk_hash} is corrupted")
+        with self.lock:
+            targets = self.targets.pop(chunk_hash, [])
+        for output_path, offset, size in targets:
+            if len(data) != size:
+                raise ValueError(f"chunk {chunk_hash} is {len(data)} bytes, expected {size}")
+            self.write_at(output_path, data, offset)
+        with self.lock:
+            for output_path, _, _ in targets:
+                self.outputs[output_path][1] -= 1
+            self.bytes_written += len(data) * len(targets)
 
-def merge_files(split_dir, file_names):
-    print("merge1")
-    output_file_path = os.path.join(split_dir, get_original_file_name(file_names[0]))
-    print("merge2", output_file_path)
-    with open(output_file_path, 'wb') as output_file:
-        print("merge3", file_names)
-        for file in file_names:
-            file_path = os.path.join(split_dir, file)
-            print("merge4", file_path)
-            if not os.path.exists(file_path):
-                print(f"{file_path} cannot find file !")
-                raise FileNotFoundError(f"{file_path} cannot find file !")
-            
-            with open(file_path, 'rb') as chunk_file:
-                output_file.write(chunk_file.read())
-    
-    print(f"File Fuzed! : {output_file_path}")
-    return output_file_path
+    def write_at(self, output_path, data, offset):
+        if hasattr(os, "pwrite"):
+            fd = self.outputs[output_path][0]
+            view = memoryview(data)
+            while view:
+                written = os.pwrite(fd, view, offset)
+                view = view[written:]
+                offset += written
+        else:
+            with open(output_path, 'r+b') as f:
+                f.seek(offset)
+                f.write(data)
+
+    def finish(self):
+        """Close every output. Incomplete outputs are removed and returned."""
+        incomplete = []
+        for output_path, (fd, chunks_left) in self.outputs.items():
+            os.close(fd)
+            if chunks_left:
+                os.remove(output_path)
+                incomplete.append(output_path)
+        self.outputs = {}
+        return incomplete
 
 def get_original_file_name(file_name):
     parts = file_name.rsplit('.split', 1)
@@ -48,4 +74,4 @@ def get_original_file_name(file_name):
         original_name = parts[0]
     else:
         original_name = file_name
-    return original_name
\ No newline at end of file
+    return original_name
@@ -0,0 +1,95 @@
+import os
+import time
+import asyncio
+import unittest
+from testing import RemoteTestCase
+
+class AsyncGitManagerTest(RemoteTestCase):
+    """Operations of one AsyncGitManager running at the same time, each on its own fork."""
+    def run_async(self, make_coroutine):
+        from async_git import AsyncGitManager
+        async def main():
+            asyncManager = AsyncGitManager(self.git_manager())
+            try:
+                return await make_coroutine(asyncManager)
+            finally:
+                asyncManager.close()
+        return asyncio.run(main())
+
+    def test_concurrent_push_list_and_get_file(self):
+        big = os.urandom(4 * 1024 * 1024)
+        self.write("big.bin", big)
+        self.write("a.txt", b"a")
+        self.assertTrue(self.git_manager().push())
+        time.sleep(1.1)  # timestamps have a resolution of a second
+        self.write("new.txt", b"new")
+
+        async def operations(asyncManager):
+            return await asyncio.gather(
+                asyncManager.push(),
+                asyncManager.list(),
+                *[asyncManager.get_file(["big.bin", "a.txt"], self.download_path) for _ in range(3)])
+        pushed, store, *placed = self.run_async(operations)
+        self.assertTrue(pushed)
+        self.assertIn("big.bin", store)
+        paths = [result[file] for result in placed for file in ("big.bin", "a.txt")]
+        self.assertEqual(len(set(paths)), 6)
+        for result in placed:
+            self.assertEqual(self.read(result["big.bin"]), big)
+            self.assertEqual(self.read(result["a.txt"]), b"a")
+        self.assertEqual(sorted(self.git_manager().get_remote_file_list()), ["a.txt", "big.bin", "new.txt"])
+
+    def test_concurrent_pushes_run_one_after_the_other(self):
+        self.write("a.txt", b"a")
+        async def operations(asyncManager):
+            return await asyncio.gather(asyncManager.push(), asyncManager.push())
+        self.assertEqual(self.run_async(operations), [True, True])
+        self.assertEqual(len([branch for branch in self.remote_branches() if branch.startswith("date")]), 1)
+
+    def test_cancel_get_file(self):
+        big = os.urandom(8 * 1024 * 1024)
+        self.write("big.bin", big)
+        self.assertTrue(self.git_manager().push())
+
+        async def operations(asyncManager):
+            loop = asyncio.get_running_loop()
+            task = None
+            def progress(snapshot):
+                # from the worker thread, while the blobs are fetched
+                if snapshot["phase"] in ("download", "extract"):
+                    loop.call_soon_threadsafe(task.cancel)
+            await asyncManager.list()
+            task = asyncio.ensure_future(asyncManager.get_file(["big.bin"], self.download_path, progress=progress))
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            cancelled = os.listdir(self.download_path)
+            # the manager goes on: the next operation runs on a new fork
+            placed = await asyncManager.get_file(["big.bin"], self.download_path)
+            return cancelled, placed
+        cancelled, placed = self.run_async(operations)
+        self.assertEqual(cancelled, [])  # the incomplete file is removed
+        self.assertEqual(self.read(placed["big.bin"]), big)
+
+    def test_cancel_push(self):
+        self.write("a.txt", b"a")
+        self.write("b.txt", b"b")
+
+        async def operations(asyncManager):
+            loop = asyncio.get_running_loop()
+            task = None
+            def progress(snapshot):
+                if snapshot["phase"] == "stage":
+                    loop.call_soon_threadsafe(task.cancel)
+            await asyncManager.list()
+            task = asyncio.ensure_future(asyncManager.push(progress=progress))
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            listed = sorted(await asyncManager.list())
+            return listed, await asyncManager.push()
+        listed, pushed = self.run_async(operations)
+        self.assertEqual(listed, [])
+        self.assertTrue(pushed)
+        self.assertEqual(sorted(self.git_manager().get_remote_file_list()), ["a.txt", "b.txt"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+import chunker
+from chunker import Chunker
+
+def cuts(chunker_, data):
+    """Chunk lengths of data cut in memory."""
+    lengths = []
+    start = 0
+    while start < len(data):
+        lengths.append(chunker_.cut(data, len(data), start))
+        start += lengths[-1]
+    return lengths
+
+class ChunkerTest(unittest.TestCase):
+    def setUp(self):
+        self.data = random.Random(1).randbytes(1024 * 1024)
+        self.chunker = Chunker(min_size=2 * 1024, avg_size=8 * 1024, max_size=32 * 1024)
+
+    @unittest.skipIf(chunker.numpy is None, "numpy is not installed")
+    def test_numpy_and_python_find_the_same_cuts(self):
+        with mock.patch.object(chunker, "numpy", None):
+            expected = cuts(self.chunker, self.data)
+        self.assertGreater(len(expected), 50)
+        self.assertEqual(cuts(self.chunker, self.data), expected)
+        # windows across block boundaries
+        with mock.patch.object(chunker, "BLOCK_SIZE", 1000):
+            self.assertEqual(cuts(self.chunker, self.data), expected)
+
+    def test_sizes(self):
+        lengths = cuts(self.chunker, self.data)
+        self.assertEqual(sum(lengths), len(self.data))
+        for length in lengths[:-1]:
+            self.assertGreater(length, self.chunker.min_size)
+            self.assertLessEqual(length, self.chunker.max_size)
+        # no cut point in zeros: max_size chunks
+        self.assertEqual(cuts(self.chunker, bytes(100 * 1024)), [32 * 1024] * 3 + [4 * 1024])
+        with self.assertRaises(ValueError):
+            Chunker(min_size=4, avg_size=2, max_size=8)
+
+    def test_insert_only_changes_the_chunks_around_it(self):
+        middle = len(self.data) // 2
+        edited = self.data[:middle] + b"inserted" * 16 + self.data[middle:]
+        def chunks(data):
+            result, start = [], 0
+            for length in cuts(self.chunker, data):
+                result.append(data[start:start + length])
+                start += length
+            return result
+        before, after = chunks(self.data), chunks(edited)
+        self.assertLessEqual(len(set(after) - set(before)), 2)
+        self.assertEqual(after[:len(before) // 3], before[:len(before) // 3])
+
+    def test_chunks_of_a_file(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        path = os.path.join(root, "file.bin")
+        with open(path, 'wb') as f:
+            f.write(self.data)
+        # reads of a few chunks at a time cut the same as the whole buffer
+        with mock.patch.object(chunker, "READ_SIZE", 50 * 1000):
+            chunks = list(self.chunker.chunks(path))
+        self.assertEqual(b"".join(chunks), self.data)
+        self.assertEqual([len(chunk) for chunk in chunks], cuts(self.chunker, self.data))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import unittest
+import subprocess
+from testing import RemoteTestCase
+
+class CliTest(RemoteTestCase):
+    def cli(self, *args, remote=True):
+        """(exit code, stdout, stderr) of python -m cli, without the GUI's settings."""
+        argv = [sys.executable, "-m", "cli", "--settings", os.path.join(self.root, "settings.json")]
+        if remote:
+            argv += ["--remote", self.remote]
+        process = subprocess.run(argv + list(args), cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True)
+        return process.returncode, process.stdout, process.stderr
+
+    def records(self, stdout):
+        return [json.loads(line) for line in stdout.splitlines()]
+
+    def test_push_ls_stat_pull_verify(self):
+        self.write("photos/a.jpg", b"jpeg" * 1000)
+        self.write("notes.txt", b"notes")
+        code, stdout, _ = self.cli("--json", "push", "--root", self.upload_path)
+        self.assertEqual(code, 0)
+        self.assertEqual(self.records(stdout)[0]["ok"], True)
+
+        code, stdout, _ = self.cli("ls")
+        self.assertEqual((code, stdout.split()), (0, ["notes.txt", "photos/a.jpg"]))
+        code, stdout, _ = self.cli("--json", "ls", "--regex", r"\.jpg$", "--min-size", "3K")
+        self.assertEqual([record["path"] for record in self.records(stdout)], ["photos/a.jpg"])
+        self.assertEqual(self.records(stdout)[0]["size"], 4000)
+        code, stdout, _ = self.cli("ls", "--since", "2000-01-01", "--until", "2000-12-31")
+        self.assertEqual((code, stdout), (0, ""))
+
+        code, stdout, _ = self.cli("--json", "stat", "notes.txt", "missing.txt")
+        self.assertEqual(code, 1)
+        found, missing = self.records(stdout)
+        self.assertEqual(len(found["versions"]), 1)
+        self.assertEqual(missing, {"path": "missing.txt", "error": "not found"})
+
+        code, stdout, _ = self.cli("--json", "pull", "notes.txt", "--dest", self.download_path)
+        self.assertEqual(code, 0)
+        self.assertEqual(self.read(self.records(stdout)[0]["output"]), b"notes")
+        code, stdout, _ = self.cli("pull", "missing.txt", "--dest", self.download_path)
+        self.assertEqual((code, stdout.strip()), (1, "missing.txt :: not found"))
+
+        code, stdout, _ = self.cli("--json", "verify")
+        self.assertEqual(code, 0)
+        self.assertEqual([record["status"] for record in self.records(stdout)], ["ok", "ok"])
+
+    def test_invalid_arguments_are_usage_errors(self):
+        for args, message in ((["ls", "--regex", "("], "invalid regular expression"),
+                              (["ls", "--min-size", "5X"], "invalid size"),
+                              (["ls", "--since", "yesterday"], "invalid date"),
+                              (["pull"], "required: paths")):
+            with self.subTest(args=args):
+                code, stdout, stderr = self.cli(*args)
+                self.assertEqual(code, 2)
+                self.assertEqual(stdout, "")
+                self.assertIn(message, stderr)
+                self.assertNotIn("Traceback", stderr)
+
+    def test_missing_settings(self):
+        code, _, stderr = self.cli("ls", remote=False)
+        self.assertEqual(code, 1)
+        self.assertIn("no remote", stderr)
+        code, _, stderr = self.cli("push")
+        self.assertEqual(code, 1)
+        self.assertIn("no folder to push", stderr)
+
+if __name__ == "__main__":
+    unittest.main()
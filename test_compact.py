@@ -0,0 +1,45 @@
+import time
+import unittest
+from testing import RemoteTestCase
+from journal import Journal
+
+class CompactTest(RemoteTestCase):
+    def test_compact_keeps_the_branch_of_an_unfinished_push(self):
+        gitManager = self.git_manager(PUSH_BATCH_SIZE=1)  # one file per batch
+        for name in ("a.txt", "b.txt"):
+            self.write(name, name.encode())
+            self.assertTrue(gitManager.push())
+            time.sleep(1.1)  # timestamps have a resolution of a second
+        old = sorted(branch for branch in self.remote_branches() if branch.startswith("date"))
+
+        # 1. the first batch lands, the remote rejects the next ones: updates of a timestamp branch
+        self.reject_pushes('zero=0000000000000000000000000000000000000000\n'
+                           'while read old new ref; do\n'
+                           '  case $ref in refs/heads/date*) [ $old = $zero ] || [ $new = $zero ] || exit 1;; esac\n'
+                           'done')
+        for name in ("c1.txt", "c2.txt", "c3.txt"):
+            self.write(name, name.encode())
+        self.assertFalse(gitManager.push())
+        journal = Journal(gitManager.get_journal_path())
+        self.assertEqual(journal.state, "landed")
+
+        # 2. every branch is old, only the one the journal continues stays
+        report = gitManager.compact(keep_recent=0)
+        self.assertEqual(report["compacted"], 2)
+        branches = self.remote_branches()
+        self.assertIn(journal.timestamp, branches)
+        for branch in old:
+            self.assertNotIn(branch, branches)
+
+        # 3. the push continues the landed branch, archived files still read back
+        self.accept_pushes()
+        self.assertTrue(gitManager.push())
+        self.assertFalse(Journal(gitManager.get_journal_path()).pending)
+        self.assertEqual(len([branch for branch in self.remote_branches() if branch.startswith("date")]), 1)
+        files = ["a.txt", "b.txt", "c1.txt", "c2.txt", "c3.txt"]
+        placed = gitManager.get_file(files, self.download_path, show_process=False)
+        for file in files:
+            self.assertEqual(self.read(placed[file]), file.encode())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import time
+import random
+import unittest
+import compression
+from compression import Compressor, Decompressor, decompress, parse_compression, CODECS
+from testing import RemoteTestCase
+from metrics import MemoryExporter
+
+# compresses well, but not so regular that every codec hits the same size
+TEXT = b"".join(b"line %d of a log file, status %s\n" % (i, random.Random(i).choice([b"ok", b"error"])) for i in range(50000))
+CODEC_NAMES = [name for name in CODECS if name != "zstd" or compression.zstandard is not None]
+
+class CompressionTest(unittest.TestCase):
+    def test_round_trips(self):
+        noise = os.urandom(300 * 1024)
+        for name in CODEC_NAMES:
+            compressor = Compressor(name)
+            stored, codec = compressor.compress(TEXT)
+            self.assertEqual(codec, name)
+            self.assertLess(len(stored), len(TEXT) // 4)
+            self.assertEqual(decompress(stored, codec), TEXT)
+            # streamed in blocks, as chunks are extracted
+            decompressor = Decompressor(codec)
+            blocks = [decompressor.decompress(stored[i:i + 1000]) for i in range(0, len(stored), 1000)]
+            self.assertEqual(b"".join(blocks) + decompressor.flush(), TEXT)
+            # random data is stored as it is
+            self.assertEqual(compressor.compress(noise), (noise, None))
+            self.assertEqual((compressor.raw_bytes, compressor.stored_bytes), (len(TEXT) + len(noise), len(stored) + len(noise)))
+        self.assertEqual(decompress(b"raw", None), b"raw")
+
+    def test_parse_compression(self):
+        self.assertEqual(parse_compression(""), (None, None))
+        self.assertEqual(parse_compression("none"), (None, None))
+        self.assertEqual(parse_compression("zlib"), ("zlib", None))
+        self.assertEqual(parse_compression("zlib:9"), ("zlib", 9))
+        with self.assertRaises(ValueError):
+            parse_compression("lz4")
+
+class CompressedPushTest(RemoteTestCase):
+    def test_push_and_get_compressed_files_and_chunks(self):
+        noise = os.urandom(2 * 1024 * 1024)
+        files = {"log.txt": TEXT, "big.log": TEXT * 4, "noise.bin": noise}  # big.log is chunked
+        for path, data in files.items():
+            self.write(path, data)
+        for name in CODEC_NAMES:
+            with self.subTest(codec=name):
+                gitManager = self.git_manager(COMPRESSION=name, workspace_root=os.path.join(self.root, name),
+                                              index_branch_name="index-" + name)
+                with gitManager.metrics.exporting(MemoryExporter()) as memory:
+                    self.assertTrue(gitManager.push())
+                commit = memory.find("commit")[0]["counters"]
+                self.assertEqual(commit["raw_bytes"], sum(len(data) for data in files.values()))
+                self.assertLess(commit["bytes"], len(noise) + len(TEXT))
+                store = gitManager.load_indices()
+                self.assertEqual(store.latest("log.txt")["codec"], name)
+                self.assertNotIn("codec", store.latest("noise.bin"))
+                self.assertEqual({chunk[3] for chunk in store.latest("big.log")["chunks"]}, {name})
+
+                # read back with compression off: the index says how each blob is stored
+                reader = self.git_manager(workspace_root=os.path.join(self.root, name + "-reader"), index_branch_name="index-" + name)
+                download_path = os.path.join(self.download_path, name)
+                os.makedirs(download_path)
+                placed = reader.get_file(list(files), download_path, show_process=False)
+                for path, data in files.items():
+                    self.assertEqual(self.read(placed[path]), data)
+                with reader.open("big.log") as f:
+                    f.seek(len(TEXT) + 10)
+                    self.assertEqual(f.read(100), (TEXT * 2)[len(TEXT) + 10:len(TEXT) + 110])
+                time.sleep(1.1)  # the next codec pushes its own timestamp branch
+
+if __name__ == "__main__":
+    unittest.main()
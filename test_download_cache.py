@@ -0,0 +1,103 @@
+import os
+import stat
+import time
+import unittest
+import threading
+from testing import RemoteTestCase
+from download_cache import DownloadCache
+from manifest import hash_bytes
+from utils import unique_file_path
+
+class DownloadCacheTest(RemoteTestCase):
+    def cache(self, max_size):
+        return DownloadCache(os.path.join(self.root, "cache"), max_size)
+
+    def add(self, cache, data, age):
+        path = os.path.join(self.root, f"source-{age}")
+        with open(path, 'wb') as f:
+            f.write(data)
+        content_hash = hash_bytes(data)
+        cache.add(content_hash, path)
+        os.utime(cache.entry_path(content_hash), (time.time() - age, time.time() - age))
+        return content_hash, path
+
+    def test_entries_are_copies(self):
+        cache = self.cache(1024)
+        content_hash, source = self.add(cache, b"content", 0)
+        output_path = os.path.join(self.root, "placed")
+        self.assertTrue(cache.get(content_hash, output_path, len(b"content")))
+        for path in (source, output_path):
+            self.assertEqual(os.stat(path).st_nlink, 1)
+            self.assertTrue(os.stat(path).st_mode & stat.S_IWUSR)
+        with open(output_path, 'wb') as f:
+            f.write(b"edited")
+        self.assertEqual(self.read(cache.entry_path(content_hash)), b"content")
+
+    def test_damaged_entry_is_a_miss(self):
+        cache = self.cache(1024)
+        content_hash, _ = self.add(cache, b"content", 0)
+        entry = cache.entry_path(content_hash)
+        os.chmod(entry, 0o644)
+        with open(entry, 'wb') as f:
+            f.write(b"CONTENT")
+        self.assertFalse(cache.get(content_hash, os.path.join(self.root, "placed"), len(b"content")))
+        self.assertNotIn(content_hash, cache)
+
+    def test_evicts_least_recently_used_but_not_pinned(self):
+        cache = self.cache(250)
+        old, _ = self.add(cache, b"o" * 100, 30)
+        pinned, _ = self.add(cache, b"p" * 100, 20)
+        recent, _ = self.add(cache, b"r" * 100, 10)
+        cache.pin(pinned, "p.bin")
+        cache.evict()
+        self.assertNotIn(old, cache)
+        self.assertIn(pinned, cache)
+        self.assertIn(recent, cache)
+        # pins survive a new DownloadCache, unpinned entries go once over max_size
+        cache = self.cache(0)
+        self.assertEqual(cache.pins, {pinned: ["p.bin"]})
+        cache.evict()
+        self.assertEqual([entry[2] for entry in cache.entries()], [pinned])
+        cache.unpin("p.bin")
+        self.assertEqual(cache.entries(), [])
+
+    def test_unique_file_path_reserves_names(self):
+        paths = []
+        def reserve():
+            paths.append(unique_file_path(self.download_path, "same.txt"))
+        threads = [threading.Thread(target=reserve) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(paths)), 8)
+        self.assertEqual(sorted(os.listdir(self.download_path)),
+                         ["same (1).txt", "same (2).txt", "same (3).txt", "same (4).txt",
+                          "same (5).txt", "same (6).txt", "same (7).txt", "same.txt"])
+
+    def test_concurrent_downloads_into_one_folder(self):
+        big = os.urandom(4 * 1024 * 1024)  # chunked
+        self.write("big.bin", big)
+        self.write("small.txt", b"small")
+        gitManager = self.git_manager()
+        self.assertTrue(gitManager.push())
+
+        # first from the remote, then from the cache
+        for round in range(2):
+            placed = []
+            def download():
+                placed.append(gitManager.fork().get_file(["big.bin", "small.txt"], self.download_path, show_process=False))
+            threads = [threading.Thread(target=download) for _ in range(3)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            paths = [result[file] for result in placed for file in ("big.bin", "small.txt")]
+            self.assertEqual(len(set(paths)), 6)
+            for result in placed:
+                self.assertEqual(self.read(result["big.bin"]), big)
+                self.assertEqual(self.read(result["small.txt"]), b"small")
+        self.assertEqual(len(os.listdir(self.download_path)), 12)
+
+if __name__ == "__main__":
+    unittest.main()
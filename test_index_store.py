@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from datetime import date, datetime
+from index_store import IndexStore, SCHEMA_VERSION, shard_of
+
+def chunked(timestamp, size, *chunks):
+    return {"timestamp": timestamp, "size": size, "hash": "h" + timestamp, "chunks": [list(chunk) for chunk in chunks]}
+
+class IndexStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.db_path = os.path.join(self.root, "indices.db")
+
+    def store(self):
+        store = IndexStore(self.db_path)
+        self.addCleanup(store.close)
+        return store
+
+    def test_legacy_json_import(self):
+        store = self.store()
+        # timestamps of the first versions, chunked files with a codec per chunk
+        store.import_json({"a.txt": ["date240101@000000", "date240102@000000"],
+                           "big.bin": [chunked("date240102@000000", 10, ("c1", 6, "date240102@000000", "zstd"),
+                                                                        ("c2", 4, "date240102@000000"))],
+                           "video.mp4.split0": ["date240101@000000"]}, "sha1")
+        self.assertEqual(store.sha, "sha1")
+        self.assertEqual(list(store), ["a.txt", "big.bin", "video.mp4.split0"])
+        self.assertEqual(len(store), 3)
+        self.assertEqual(store["a.txt"], ["date240101@000000", "date240102@000000"])
+        self.assertEqual(store.latest("big.bin")["size"], 10)
+        self.assertEqual(store.known_chunk("c1"), ("date240102@000000", "zstd"))
+        self.assertEqual(store.known_chunk("c2"), ("date240102@000000", None))
+        self.assertEqual(store.listing()[0], ("a.txt", None, "date240102@000000"))
+        with self.assertRaises(KeyError):
+            store["missing"]
+
+        # a new import replaces everything
+        store.import_json({"b.txt": ["date240103@000000"]}, "sha2")
+        self.assertEqual(list(store), ["b.txt"])
+        self.assertIsNone(store.known_chunk("c1"))
+
+    def test_appends_wait_for_commit(self):
+        store = self.store()
+        store.append("a.txt", chunked("date240101@000000", 1))
+        store.rollback()
+        self.assertNotIn("a.txt", store)
+        store.append("a.txt", chunked("date240101@000000", 1))
+        store.append("a.txt", chunked("date240102@000000", 2))
+        store.commit("sha1")
+        reopened = self.store()
+        self.assertEqual(reopened.sha, "sha1")
+        self.assertEqual([version["size"] for version in reopened["a.txt"]], [1, 2])
+
+    def test_schema_change_rebuilds_the_cache(self):
+        store = self.store()
+        store.append("a.txt", chunked("date240101@000000", 1))
+        store.commit("sha1")
+        store.close()
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION - 1}")
+        conn.close()
+        store = self.store()
+        self.assertIsNone(store.sha)
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.conn.execute("PRAGMA user_version").fetchone()[0], SCHEMA_VERSION)
+
+    def test_shards_round_trip(self):
+        store = self.store()
+        paths = [f"dir/file{i}.txt" for i in range(20)]
+        for path in paths:
+            store.append(path, chunked("date240101@000000", len(path)))
+        store.commit("sha1")
+        self.assertEqual(store.shards(), sorted({shard_of(path) for path in paths}))
+
+        other = IndexStore(os.path.join(self.root, "other.db"))
+        self.addCleanup(other.close)
+        for shard in store.shards():
+            other.import_shard(shard, json.loads(store.export_shard(shard)), "blob-" + shard)
+        other.commit("sha1")
+        self.assertEqual(list(other), sorted(paths))
+        self.assertEqual(other.shard_blobs(), {shard: "blob-" + shard for shard in store.shards()})
+        # a shard import replaces only that shard
+        shard = shard_of(paths[0])
+        other.import_shard(shard, {}, "empty")
+        other.commit("sha2")
+        self.assertEqual(list(other), sorted(path for path in paths if shard_of(path) != shard))
+        other.remove_shard(shard)
+        self.assertNotIn(shard, other.shard_blobs())
+
+    def test_query(self):
+        store = self.store()
+        store.import_json({"docs/Report.PDF": [chunked("date240110@120000", 500)],
+                           "docs/notes.txt": [chunked("date240105@080000", 50)],
+                           "docs2/other.txt": [chunked("date240120@000000", 5000)],
+                           "photos/a.jpg": [chunked("date240101@000000", 100), chunked("date240201@000000", 2000)],
+                           "video.mp4.split0": ["date231201@000000"]}, "sha1")
+        def paths(**filters):
+            return [row[0] for row in store.query(**filters)]
+        self.assertEqual(len(paths()), 5)
+        self.assertEqual(paths(prefix="docs/"), ["docs/Report.PDF", "docs/notes.txt"])
+        self.assertEqual(paths(glob="docs*/*.txt"), ["docs/notes.txt", "docs2/other.txt"])
+        self.assertEqual(paths(glob="*.mp4"), ["video.mp4.split0"])  # legacy entries by their name
+        self.assertEqual(paths(regex=r"^photos/|\.mp4$"), ["photos/a.jpg", "video.mp4.split0"])
+        self.assertEqual(paths(extension=".pdf"), ["docs/Report.PDF"])
+        # the latest version counts, sizes and dates are included
+        self.assertEqual(paths(min_size=500, max_size=2000), ["docs/Report.PDF", "photos/a.jpg"])
+        self.assertEqual(paths(since=date(2024, 1, 5), until=date(2024, 1, 10)), ["docs/Report.PDF", "docs/notes.txt"])
+        self.assertEqual(paths(until=datetime(2024, 1, 10, 11, 0)), ["docs/notes.txt", "video.mp4.split0"])
+        self.assertEqual(paths(since="date240201@000000"), ["photos/a.jpg"])
+        self.assertEqual(paths(prefix="docs", extension="txt", limit=1), ["docs/notes.txt"])
+        self.assertEqual(list(store.query(prefix="photos/")), [("photos/a.jpg", 2000, "date240201@000000")])
+
+if __name__ == "__main__":
+    unittest.main()
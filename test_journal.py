@@ -0,0 +1,114 @@
+import time
+import unittest
+import subprocess
+from testing import RemoteTestCase
+from journal import Journal
+from metrics import MemoryExporter
+
+class JournalTest(RemoteTestCase):
+    """A push the remote rejects is finished by the next one, from the journal it left."""
+    def journal(self, gitManager):
+        return Journal(gitManager.get_journal_path())
+
+    def check_files(self, gitManager, files):
+        self.assertEqual(sorted(gitManager.get_remote_file_list()), sorted(files))
+        placed = gitManager.get_file(list(files), self.download_path, show_process=False)
+        for path, data in files.items():
+            self.assertEqual(self.read(placed[path]), data)
+
+    def test_resume_a_rejected_branch(self):
+        files = {"a.txt": b"a", "dir/b.txt": b"b"}
+        for path, data in files.items():
+            self.write(path, data)
+        gitManager = self.git_manager()
+        self.reject_pushes()
+        self.assertFalse(gitManager.push())
+        journal = self.journal(gitManager)
+        self.assertEqual(journal.state, "staged")
+        self.assertEqual(sorted(path for path, _ in journal.versions), sorted(files))
+        self.assertEqual(self.remote_branches(), [])
+
+        self.accept_pushes()
+        with gitManager.metrics.exporting(MemoryExporter()) as memory:
+            self.assertTrue(gitManager.push())
+        self.assertEqual([record["parent"] for record in memory.find("push_branch")], ["resume"])
+        self.assertEqual(memory.find("scan")[0]["counters"].get("changed", 0), 0)  # nothing left to stage
+        self.assertFalse(self.journal(gitManager).pending)
+        self.assertIn(journal.timestamp, self.remote_branches())
+        self.check_files(gitManager, files)
+
+    def test_resume_a_rejected_index(self):
+        self.write("a.txt", b"a")
+        gitManager = self.git_manager()
+        self.reject_pushes('while read old new ref; do [ $ref != refs/heads/index ] || exit 1; done')
+        self.assertFalse(gitManager.push())
+        journal = self.journal(gitManager)
+        self.assertEqual(journal.state, "pushed")
+        self.assertIn(journal.timestamp, self.remote_branches())
+
+        # the branch is not sent again, only the index
+        self.accept_pushes()
+        with gitManager.metrics.exporting(MemoryExporter()) as memory:
+            self.assertTrue(gitManager.push())
+        self.assertEqual(memory.find("push_branch"), [])
+        self.assertFalse(self.journal(gitManager).pending)
+        self.check_files(gitManager, {"a.txt": b"a"})
+
+    def test_push_without_resume_starts_over(self):
+        self.write("a.txt", b"a")
+        gitManager = self.git_manager()
+        self.reject_pushes()
+        self.assertFalse(gitManager.push())
+        timestamp = self.journal(gitManager).timestamp
+
+        time.sleep(1.1)  # the new push gets a new timestamp
+        self.accept_pushes()
+        self.assertTrue(gitManager.push(resume=False))
+        self.assertFalse(self.journal(gitManager).pending)
+        self.assertNotIn(timestamp, self.remote_branches())
+        self.check_files(gitManager, {"a.txt": b"a"})
+
+    def test_continue_landed_batches(self):
+        files = {f"{i}.txt": str(i).encode() * 100 for i in range(4)}
+        for path, data in files.items():
+            self.write(path, data)
+        gitManager = self.git_manager(PUSH_BATCH_SIZE=1)  # one file per batch
+        # the second batch of the branch is rejected, the remote keeps the first one
+        self.reject_pushes('zero=0000000000000000000000000000000000000000\n'
+                           'while read old new ref; do\n'
+                           '  case $ref in refs/heads/date*) [ $old = $zero ] || exit 1;; esac\n'
+                           'done')
+        self.assertFalse(gitManager.push())
+        journal = self.journal(gitManager)
+        self.assertEqual(journal.state, "landed")
+        self.assertEqual(len(journal.landed_files), 1)
+        self.assertEqual([branch for branch in self.remote_branches() if branch.startswith("date")], [journal.timestamp])
+
+        # the branch goes on from the landed batch, only the other files are staged
+        self.accept_pushes()
+        with gitManager.metrics.exporting(MemoryExporter()) as memory:
+            self.assertTrue(gitManager.push())
+        self.assertEqual(memory.find("stage")[0]["counters"]["files"], len(files) - 1)
+        self.assertFalse(self.journal(gitManager).pending)
+        self.assertEqual([branch for branch in self.remote_branches() if branch.startswith("date")], [journal.timestamp])
+        subprocess.run(["git", "-C", self.remote, "merge-base", "--is-ancestor", journal.head, journal.timestamp], check=True)
+        self.check_files(gitManager, files)
+
+    def test_discard_landed_batches(self):
+        files = {f"{i}.txt": str(i).encode() for i in range(3)}
+        for path, data in files.items():
+            self.write(path, data)
+        gitManager = self.git_manager(PUSH_BATCH_SIZE=1)
+        self.reject_pushes('while read old new ref; do [ $old = 0000000000000000000000000000000000000000 ] || exit 1; done')
+        self.assertFalse(gitManager.push())
+        self.assertEqual(self.journal(gitManager).state, "landed")
+
+        time.sleep(1.1)  # the new push gets a new timestamp
+        self.accept_pushes()
+        with gitManager.metrics.exporting(MemoryExporter()) as memory:
+            self.assertTrue(gitManager.push(resume=False))
+        self.assertEqual(memory.find("stage")[0]["counters"]["files"], 3)
+        self.check_files(gitManager, files)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+from git import Repo # type: ignore
+from fast_import import FastImport
+
+class LegacyIndexTest(unittest.TestCase):
+    """Downloads of files indexed by the first version: {file name: [timestamps]} in one `indices` file,
+    files of subfolders stored at their path but indexed by their name only."""
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.old_home = os.environ.get("GITHUB_CLOUD_HOME")
+        os.environ["GITHUB_CLOUD_HOME"] = os.path.join(self.root, "home")
+        remote = os.path.join(self.root, "remote.git")
+        subprocess.run(["git", "init", "-q", "--bare", remote], check=True)
+        subprocess.run(["git", "-C", remote, "config", "uploadpack.allowFilter", "true"], check=True)
+        subprocess.run(["git", "-C", remote, "config", "uploadpack.allowAnySHA1InWant", "true"], check=True)
+        self.url = "file://" + remote
+
+        # 1. what the first version pushed: one branch per push, then the index branch
+        repo = Repo.init(os.path.join(self.root, "old"), bare=True)
+        repo.create_remote("origin", self.url)
+        for timestamp, files in (("date200101@000000", {"top.txt": b"top", "sub/n.txt": b"nested"}),
+                                 ("date200102@000000", {"other.txt": b"other"})):
+            fast_import = FastImport(repo)
+            for path, data in files.items():
+                fast_import.add_data(path, data)
+            fast_import.commit(timestamp, "commited in push")
+            repo.git.push("origin", timestamp)
+        # every push appended its timestamp to every known file, the file itself was only uploaded once
+        indices = {"top.txt": ["date200101@000000", "date200102@000000"],
+                   "n.txt": ["date200101@000000", "date200102@000000"],
+                   "other.txt": ["date200102@000000"]}
+        fast_import = FastImport(repo)
+        fast_import.add_data("indices", json.dumps(indices, indent=4).encode())
+        fast_import.commit("index", "commited in git_init")
+        repo.git.push("origin", "index")
+
+        os.makedirs(os.path.join(self.root, "upload"))
+        self.download_path = os.path.join(self.root, "download")
+        os.makedirs(self.download_path)
+
+    def tearDown(self):
+        if self.old_home is None:
+            del os.environ["GITHUB_CLOUD_HOME"]
+        else:
+            os.environ["GITHUB_CLOUD_HOME"] = self.old_home
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def git_manager(self):
+        from git_logic import GitManager
+        return GitManager(os.path.join(self.root, "upload"), self.url)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_get_file_finds_subfolder_file_by_name(self):
+        placed = self.git_manager().get_file(["n.txt", "top.txt", "other.txt"], self.download_path, show_process=False)
+        self.assertEqual(self.read(placed["n.txt"]), b"nested")
+        self.assertEqual(self.read(placed["top.txt"]), b"top")
+        self.assertEqual(self.read(placed["other.txt"]), b"other")
+
+    def test_open_finds_subfolder_file_by_name(self):
+        with self.git_manager().open("n.txt") as f:
+            self.assertEqual(f.read(), b"nested")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import json
+import unittest
+from testing import RemoteTestCase
+from metrics import Metrics, MemoryExporter, make_exporter, JsonLinesExporter, PrometheusExporter
+
+class MetricsTest(RemoteTestCase):
+    def test_span_tree_of_push_and_get_file(self):
+        self.write("a.txt", b"a")
+        self.write("big.bin", os.urandom(4 * 1024 * 1024))  # chunked
+        gitManager = self.git_manager()
+        with gitManager.metrics.exporting(MemoryExporter()) as memory:
+            self.assertTrue(gitManager.push())
+            gitManager.get_file(["a.txt", "big.bin"], self.download_path, show_process=False)
+
+        # every phase belongs to its operation, the outermost span, which is exported last
+        push = [record for record in memory.records if record["operation"] == "push"]
+        self.assertEqual(push[-1]["phase"], "push")
+        self.assertIsNone(push[-1]["parent"])
+        for phase in ("load_indices", "scan", "stage", "chunk", "commit", "push_branch", "index_save"):
+            self.assertEqual([record["parent"] for record in push if record["phase"] == phase], ["push"], phase)
+        self.assertEqual(memory.find("scan")[0]["counters"]["changed"], 2)
+        self.assertEqual(memory.find("chunk")[0]["counters"]["bytes"], 4 * 1024 * 1024)
+        self.assertEqual(memory.find("push_branch")[0]["counters"]["bytes"], memory.find("commit")[0]["counters"]["bytes"])
+
+        get_file = memory.phases("get_file")
+        self.assertEqual(get_file[-1], "get_file")
+        for phase in ("cache", "extract", "assemble", "cache_fill"):
+            self.assertIn(phase, get_file)
+        self.assertEqual(memory.find("assemble")[0]["counters"], {"files": 1, "bytes": 4 * 1024 * 1024})
+        self.assertTrue(all(record["status"] == "ok" for record in memory.records))
+
+    def test_failed_span_and_broken_exporter(self):
+        class Broken:
+            def export(self, record):
+                raise OSError("disk full")
+        metrics = Metrics(Broken())
+        memory = MemoryExporter()
+        metrics.add_exporter(memory)
+        with self.assertRaises(ValueError):
+            with metrics.span("push"):
+                with metrics.span("scan") as span:
+                    span.add("files", 3)
+                    raise ValueError()
+        self.assertEqual([(record["phase"], record["parent"], record["status"]) for record in memory.records],
+                         [("scan", "push", "error"), ("push", None, "error")])
+        self.assertEqual(memory.records[0]["counters"], {"files": 3})
+
+    def test_make_exporter(self):
+        jsonl = os.path.join(self.root, "metrics.jsonl")
+        prom = os.path.join(self.root, "metrics.prom")
+        self.assertIsInstance(make_exporter(jsonl), JsonLinesExporter)
+        self.assertIsInstance(make_exporter(prom), PrometheusExporter)
+        metrics = Metrics(make_exporter(jsonl), make_exporter(prom))
+        for _ in range(2):
+            with metrics.span("push"):
+                metrics.add("bytes", 10)
+        metrics.close()
+        with open(jsonl) as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual([record["counters"] for record in records], [{"bytes": 10}, {"bytes": 10}])
+        text = self.read(prom).decode()
+        self.assertIn('github_cloud_phase_runs_total{operation="push",phase="push"} 2', text)
+        self.assertIn('github_cloud_phase_bytes_total{operation="push",phase="push"} 20', text)
+
+    def test_environment_selects_the_exporter(self):
+        prom = os.path.join(self.root, "metrics.prom")
+        os.environ["GITHUB_CLOUD_METRICS"] = prom
+        try:
+            gitManager = self.git_manager()
+        finally:
+            del os.environ["GITHUB_CLOUD_METRICS"]
+        self.write("a.txt", b"a")
+        self.assertTrue(gitManager.push())
+        self.assertIn('operation="push",phase="scan"', self.read(prom).decode())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+class PruneMirrorTest(unittest.TestCase):
+    """prune_blobs on a mirror bigger than pack.packSizeLimit: several packs per pack-objects run."""
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.old_home = os.environ.get("GITHUB_CLOUD_HOME")
+        os.environ["GITHUB_CLOUD_HOME"] = os.path.join(self.root, "home")
+        self.remote = os.path.join(self.root, "remote.git")
+        subprocess.run(["git", "init", "-q", "--bare", self.remote], check=True)
+        subprocess.run(["git", "-C", self.remote, "config", "uploadpack.allowFilter", "true"], check=True)
+        subprocess.run(["git", "-C", self.remote, "config", "uploadpack.allowAnySHA1InWant", "true"], check=True)
+        self.upload_path = os.path.join(self.root, "upload")
+        os.makedirs(self.upload_path)
+
+    def tearDown(self):
+        if self.old_home is None:
+            del os.environ["GITHUB_CLOUD_HOME"]
+        else:
+            os.environ["GITHUB_CLOUD_HOME"] = self.old_home
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def git_manager(self):
+        from git_logic import GitManager
+        gitManager = GitManager(self.upload_path, self.remote)
+        gitManager.MIRROR_SIZE = 0  # prune after every operation
+        return gitManager
+
+    def write_files(self, prefix, count, size=64 * 1024):
+        for i in range(count):
+            with open(os.path.join(self.upload_path, f"{prefix}{i}.bin"), 'wb') as f:
+                f.write(os.urandom(size))
+
+    def git(self, repo, *args):
+        return subprocess.run(["git", "-C", repo.git_dir, *args], check=True, capture_output=True, text=True).stdout
+
+    def test_prune_twice_keeps_unpushed_branch(self):
+        from mirror import prune_blobs
+        from journal import Journal
+        gitManager = self.git_manager()
+        self.write_files("a", 40)  # 2.5 MB: several packs of 1 MB
+        self.assertTrue(gitManager.push())
+
+        # 1. a push the remote rejects: staged in the journal, its blobs only exist in the mirror
+        self.write_files("b", 40)
+        hook = os.path.join(self.remote, "hooks", "pre-receive")
+        with open(hook, 'w') as f:
+            f.write("#!/bin/sh\nexit 1\n")
+        os.chmod(hook, 0o755)
+        self.assertFalse(gitManager.push())
+        journal = Journal(gitManager.get_journal_path())
+        self.assertEqual(journal.state, "staged")
+        repo = gitManager.repo
+
+        # 2. pruned twice: the first one already runs after the failed push
+        prune_blobs(repo)
+        pack_dir = os.path.join(repo.git_dir, "objects", "pack")
+        packs = [name for name in os.listdir(pack_dir) if name.endswith(".pack")]
+        self.assertGreater(len(packs), 1)
+        for name in os.listdir(pack_dir):
+            self.assertNotIn("\n", name)
+        subprocess.run(["git", "-C", repo.git_dir, "fsck", "--connectivity-only"], check=True, capture_output=True)
+        missing = self.git(repo, "rev-list", "--objects", "--missing=print", f"refs/heads/{journal.timestamp}")
+        self.assertFalse([line for line in missing.splitlines() if line.startswith("?")])
+
+        # 3. the staged push still lands, every file reads back
+        os.remove(hook)
+        self.assertTrue(gitManager.push())
+        download_path = os.path.join(self.root, "download")
+        os.makedirs(download_path)
+        files = sorted(gitManager.get_remote_file_list())
+        self.assertEqual(len(files), 80)
+        placed = gitManager.get_file(files, download_path, show_process=False)
+        for file in files:
+            with open(placed[file], 'rb') as f, open(os.path.join(self.upload_path, file), 'rb') as g:
+                self.assertEqual(f.read(), g.read())
+
+    def test_prune_mirror_once_it_grew(self):
+        from mirror import object_store_size
+        from metrics import MemoryExporter
+        gitManager = self.git_manager()
+        gitManager.MIRROR_SIZE = 1024 * 1024
+        self.write_files("a", 4, size=100 * 1024)  # below MIRROR_SIZE: kept
+        with gitManager.metrics.exporting(MemoryExporter()) as memory:
+            self.assertTrue(gitManager.push())
+        self.assertEqual(memory.find("prune"), [])
+        self.assertGreater(object_store_size(gitManager.repo.git_dir), 400 * 1024)
+        # not while another operation uses the mirror
+        gitManager.MIRROR_SIZE = 0
+        with gitManager.metrics.exporting(MemoryExporter()) as memory:
+            with gitManager.mirror_use:
+                gitManager.prune_mirror()
+        self.assertEqual(memory.find("prune"), [])
+        gitManager.MIRROR_SIZE = 1024 * 1024
+
+        time.sleep(1.1)  # timestamps have a resolution of a second
+        self.write_files("b", 20)  # 1.25 MB more: pruned down to commits and trees
+        with gitManager.metrics.exporting(MemoryExporter()) as memory:
+            self.assertTrue(gitManager.push())
+        self.assertEqual([record["parent"] for record in memory.find("prune")], ["push"])
+        size = object_store_size(gitManager.repo.git_dir)
+        self.assertLess(size, 200 * 1024)
+        with open(os.path.join(gitManager.repo.git_dir, "pruned-size")) as f:
+            self.assertEqual(int(f.read()), memory.find("prune")[0]["counters"]["bytes"])
+
+        # blobs are fetched again when read
+        download_path = os.path.join(self.root, "download")
+        os.makedirs(download_path)
+        placed = gitManager.get_file(["a0.bin", "b0.bin"], download_path, show_process=False)
+        for file in ("a0.bin", "b0.bin"):
+            with open(placed[file], 'rb') as f, open(os.path.join(self.upload_path, file), 'rb') as g:
+                self.assertEqual(f.read(), g.read())
+
+if __name__ == "__main__":
+    unittest.main()
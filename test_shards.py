@@ -0,0 +1,50 @@
+import os
+import json
+import time
+import unittest
+import subprocess
+from testing import RemoteTestCase
+from index_store import shard_of
+from metrics import MemoryExporter
+
+class ShardTest(RemoteTestCase):
+    """The index branch holds one file per shard: pushes write and loads read only the shards that changed."""
+    def remote_git(self, *args):
+        return subprocess.run(["git", "-C", self.remote, *args], check=True, capture_output=True, text=True).stdout
+
+    def test_only_touched_shards_are_pushed_and_loaded(self):
+        paths = [f"dir/file{i}.txt" for i in range(30)]
+        for path in paths:
+            self.write(path, path.encode())
+        writer = self.git_manager()
+        self.assertTrue(writer.push())
+
+        # 1. every path in the shard of its hash
+        shards = self.remote_git("ls-tree", "--name-only", "index", "shards/").split()
+        self.assertEqual(shards, sorted(f"shards/{shard}" for shard in {shard_of(path) for path in paths}))
+        for shard in shards:
+            data = json.loads(self.remote_git("show", f"index:{shard}"))
+            self.assertEqual(sorted(data), sorted(path for path in paths if shard_of(path) == shard[len("shards/"):]))
+
+        # 2. a reader with its own workspace loads every shard once
+        reader = self.git_manager(workspace_root=os.path.join(self.root, "reader"))
+        with reader.metrics.exporting(MemoryExporter()) as memory:
+            self.assertEqual(list(reader.load_indices()), sorted(paths))
+        self.assertEqual(memory.find("load_indices")[0]["counters"], {"shards": len(shards), "changed": len(shards)})
+
+        # 3. one changed file: one shard in the index commit, one shard loaded
+        time.sleep(1.1)  # timestamps have a resolution of a second
+        self.write(paths[0], b"changed")
+        self.assertTrue(writer.push())
+        self.assertEqual(self.remote_git("diff-tree", "--name-only", "-r", "index~1", "index").split(),
+                         [f"shards/{shard_of(paths[0])}"])
+        with reader.metrics.exporting(MemoryExporter()) as memory:
+            store = reader.load_indices()
+        self.assertEqual(memory.find("load_indices")[0]["counters"], {"shards": len(shards), "changed": 1})
+        self.assertEqual(len(store[paths[0]]), 2)
+        placed = reader.get_file([paths[0], paths[1]], self.download_path, show_process=False)
+        self.assertEqual(self.read(placed[paths[0]]), b"changed")
+        self.assertEqual(self.read(placed[paths[1]]), paths[1].encode())
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+import threading
+from testing import RemoteTestCase
+from watcher import InotifyWatcher, PollingWatcher, Watch, expand
+
+class WatcherTest(unittest.TestCase):
+    def setUp(self):
+        self.top = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.top)
+
+    def write(self, rel_path, data=b"data"):
+        path = os.path.join(self.top, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def check_watcher(self, watcher):
+        self.addCleanup(watcher.close)
+        os.makedirs(os.path.join(self.top, ".git"))
+        self.write("a.txt")
+        self.write("new/b.txt")  # in a folder created after the watch
+        self.write(".git/ignored")
+        changed = set()
+        for _ in range(10):
+            changed |= watcher.read(0.2)
+        self.assertEqual(expand(self.top, changed, {".git"}), {"a.txt", "new/b.txt"})
+        os.remove(os.path.join(self.top, "a.txt"))
+        self.assertEqual(watcher.read(1.0), {"a.txt"})
+
+    @unittest.skipUnless(os.path.exists("/proc/sys/fs/inotify"), "inotify is not available")
+    def test_inotify(self):
+        watcher = InotifyWatcher(self.top, {".git"})
+        self.check_watcher(watcher)
+        self.assertEqual(watcher.read(0.1), set())  # nothing changed
+
+    def test_polling(self):
+        self.check_watcher(PollingWatcher(self.top, {".git"}, (), interval=0.1))
+
+class WatchTest(RemoteTestCase):
+    def start_watch(self, **settings):
+        pushes = []  # (time, paths, ok)
+        watch = Watch(self.git_manager(), on_push=lambda paths, ok: pushes.append((time.time(), paths, ok)), **settings)
+        thread = threading.Thread(target=watch.run)
+        thread.start()
+        def stop():
+            watch.stop()
+            thread.join()
+        self.addCleanup(stop)
+        return pushes
+
+    def wait_for(self, pushes, count, timeout=10):
+        deadline = time.time() + timeout
+        while len(pushes) < count and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertGreaterEqual(len(pushes), count)
+
+    def test_changes_are_pushed_once_they_settle(self):
+        self.write("old.txt", b"old")
+        pushes = self.start_watch(debounce=0.5, max_delay=10)
+        self.wait_for(pushes, 1)
+        self.assertEqual(pushes[0][1:], (None, True))  # what changed while nobody watched: a full scan
+
+        time.sleep(1.1)  # timestamps have a resolution of a second
+        for i in range(3):
+            self.write(f"dir/{i}.txt", b"%d" % i)
+            time.sleep(0.1)
+        written = time.time()
+        self.wait_for(pushes, 2)
+        when, paths, ok = pushes[1]
+        self.assertTrue(ok)
+        self.assertEqual(paths, ["dir/0.txt", "dir/1.txt", "dir/2.txt"])
+        self.assertGreaterEqual(when, written + 0.4)
+        time.sleep(1.0)
+        self.assertEqual(len(pushes), 2)
+        self.assertEqual(sorted(self.git_manager().get_remote_file_list()), ["dir/0.txt", "dir/1.txt", "dir/2.txt", "old.txt"])
+
+    def test_max_delay_pushes_while_files_keep_changing(self):
+        pushes = self.start_watch(debounce=0.5, max_delay=1.5)
+        self.wait_for(pushes, 1)
+        time.sleep(1.1)
+        started = time.time()
+        while time.time() < started + 3:
+            self.write("busy.log", str(time.time()).encode())
+            time.sleep(0.1)
+        # never quiet for debounce seconds, pushed max_delay after the first change anyway
+        self.assertGreaterEqual(len(pushes), 2)
+        self.assertLess(pushes[1][0], started + 2.5)
+        self.assertEqual(pushes[1][1], ["busy.log"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+class RemoteTestCase(unittest.TestCase):
+    """A local bare remote, an upload folder and a download folder in a temporary workspace."""
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.old_env = {key: os.environ.get(key) for key in ("GITHUB_CLOUD_HOME", "GITHUB_CLOUD_COMPRESSION")}
+        os.environ["GITHUB_CLOUD_HOME"] = os.path.join(self.root, "home")
+        os.environ.pop("GITHUB_CLOUD_COMPRESSION", None)
+        self.remote = os.path.join(self.root, "remote.git")
+        subprocess.run(["git", "init", "-q", "--bare", self.remote], check=True)
+        # blobs are fetched by id from the remote
+        subprocess.run(["git", "-C", self.remote, "config", "uploadpack.allowFilter", "true"], check=True)
+        subprocess.run(["git", "-C", self.remote, "config", "uploadpack.allowAnySHA1InWant", "true"], check=True)
+        self.upload_path = os.path.join(self.root, "upload")
+        self.download_path = os.path.join(self.root, "download")
+        os.makedirs(self.upload_path)
+        os.makedirs(self.download_path)
+
+    def tearDown(self):
+        for key, value in self.old_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def git_manager(self, **settings):
+        """GitManager of the upload folder, settings override its attributes (PUSH_BATCH_SIZE=...)."""
+        from git_logic import GitManager
+        gitManager = GitManager(self.upload_path, self.remote)
+        for name, value in settings.items():
+            setattr(gitManager, name, value)
+        return gitManager
+
+    def write(self, rel_path, data):
+        path = os.path.join(self.upload_path, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+        return path
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def reject_pushes(self, script="exit 1"):
+        """pre-receive hook of the remote: script decides, exit 1 rejects the push."""
+        hook = os.path.join(self.remote, "hooks", "pre-receive")
+        with open(hook, 'w') as f:
+            f.write(f"#!/bin/sh\n{script}\n")
+        os.chmod(hook, 0o755)
+
+    def accept_pushes(self):
+        os.remove(os.path.join(self.remote, "hooks", "pre-receive"))
+
+    def remote_branches(self):
+        output = subprocess.run(["git", "-C", self.remote, "for-each-ref", "--format=%(refname:short)", "refs/heads/"],
+                                check=True, capture_output=True, text=True).stdout
+        return output.split()
@@ -1,76 +1,69 @@
 import os
 import re
 import json
-import stat
-import shutil
+import hashlib
+import pathlib
 from datetime import datetime
 
 def generate_timestamp():
     date_str = datetime.now().strftime("date%y%m%d@%H%M%S")
     return date_str
 
-def remove_tree(top):
-    for root, dirs, files in os.walk(top, topdown=False):
-        for name in files:
-            filename = os.path.join(root, name)
-            os.chmod(filename, stat.S_IWUSR)
-            os.remove(filename)
-        for name in dirs:
-            os.rmdir(os.path.join(root, name))
-    os.rmdir(top) 
-    
-def save_to_json(data, file_path, encoding='utf-8'):
-    print(f"Saving to {file_path}")
+def make_hidden_dir(path):
+    if not os.path.exists(path):
+        os.makedirs(path)
+        if os.name == "nt": os.system(f'attrib +h "{path}"')
+    return path
+
+def save_to_json(data, file_path, encoding='utf-8', indent=4):
+    separators = (',', ':') if indent is None else None
     with open(file_path, 'w', encoding=encoding) as f:
-        json.dump(data, f, indent=4)
+        json.dump(data, f, indent=indent, separators=separators)
 
 def load_from_json(file_path, encoding='utf-8'):
     with open(file_path, 'r', encoding=encoding) as f:
         loaded_dict = json.load(f)
     return loaded_dict
 
-def downloaded_files(download_path):
-    for root, dirs, files in os.walk(download_path):
-        folder_name = os.path.basename(root)
-        if folder_name != download_path:
-            continue
-        print(folder_name, files)
-        for file in files:
-            if file.startswith("."):
-                continue
-            file_path = os.path.join(root, file)
-            print(file_path)
+def unique_file_path(download_path, file_name):
+    """Reserve a free name for file_name in download_path: the file is created empty, atomically,
+    so concurrent downloads of the same name never get the same path. Write the download into it."""
+    base_name, extension = os.path.splitext(file_name)
+    fetched_file_path = os.path.join(download_path, file_name)
+    counter = 1
+    while True:
+        try:
+            # 0o666: a plain data file, the umask applies
+            os.close(os.open(fetched_file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+            return fetched_file_path
+        except FileExistsError:
+            # 파일이 이미 존재하면 이름 변경
+            fetched_file_path = os.path.join(download_path, f"{base_name} ({counter}){extension}")
+            counter += 1
 
+def strip_credentials(repo_url):
+    # https://{pat}@github.com/... -> https://github.com/...
+    return re.sub(r"^(\w+://)[^/@]*@", r"\1", repo_url)
 
-def move_files_with_unique_names(paths, temp_path, download_path, is_splitted=False):
-    for path in paths:
-        file_name = os.path.basename(path)
-        
-        # 파일 경로 설정
-        file_path = os.path.join(temp_path, file_name)
-        fetched_file_path = os.path.join(download_path, file_name)
+def normalize_remote_url(repo_url):
+    # a local bare repository is used through its file:// uri
+    if os.path.isdir(repo_url):
+        return pathlib.Path(repo_url).resolve().as_uri()
+    return repo_url
 
-        # 파일이 이미 존재하면 이름 변경
-        if os.path.exists(fetched_file_path):
-            base_name, extension = os.path.splitext(file_name)  # file_name 사용
-            counter = 1
-            while os.path.exists(fetched_file_path):
-                new_name = f"{base_name} ({counter}){extension}"
-                fetched_file_path = os.path.join(download_path, new_name)
-                counter += 1
+def get_remote_url(url, pat):
+    """Remote url from the settings: a GitHub SSH url with a PAT goes over https, anything else as is."""
+    user, repo = is_proper_SSH_url(url)
+    if user and repo:
+        return f"https://{pat}@github.com/{user}/{repo}.git" if is_valid_github_pat(pat) else ""
+    return normalize_remote_url(url) if url else ""
 
-        try:
-            # 파일 이동
-            shutil.move(file_path, fetched_file_path)
-            print(f"Moved: {file_path} -> {fetched_file_path}")
-        except UnicodeEncodeError as e:
-            print(f"인코딩 에러가 발생했습니다: {e}")
-        except FileNotFoundError as e:
-            print(f"파일을 찾을 수 없습니다: {e}")
-        except PermissionError as e:
-            print(f"파일에 대한 권한이 부족합니다: {e}")
-        except Exception as e:
-            print(f"알 수 없는 오류가 발생했습니다: {e}")
+def get_workspace_root():
+    return os.getenv("GITHUB_CLOUD_HOME", os.path.join(os.path.expanduser('~'), '.github_cloud'))
+
+def get_workspace_key(repo_url):
+    # one workspace per remote, credentials are not part of the key
+    return hashlib.sha1(strip_credentials(repo_url).encode('utf-8')).hexdigest()[:16]
 
 def is_proper_SSH_url(ssh_url):
     # 정규 표현식: "git@github.com:{username}/{repo}.git" 형식 검증
@@ -102,5 +95,19 @@ def is_valid_github_pat(pat):
     else:
         return False
     
+def get_timestamp(version):
+    # index versions are either a bare timestamp (old format) or a record dict
+    if isinstance(version, dict):
+        return version["timestamp"]
+    return version
+
+def get_stored_timestamp(versions):
+    """Timestamp of the branch holding the latest content of a path, from its list of index versions.
+    Older versions appended a bare timestamp on every push but only uploaded the file in the first one."""
+    latest = versions[-1]
+    if isinstance(latest, dict):
+        return latest["timestamp"]
+    return versions[0]  # no record dict is ever followed by a bare timestamp
+
 def is_splitted_file(file):
     return re.search(r'.split(\d+)$', file)
\ No newline at end of file
@@ -0,0 +1,218 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+from manifest import scan_tree
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# a file counts as changed once it is closed after writing, not on every write
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_MOVED_FROM | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+EVENT = struct.Struct("iIII")  # wd, mask, cookie, len, then len bytes of name
+
+class InotifyWatcher:
+    """Relative paths changed under top, from Linux inotify: no CPU is used while nothing changes.
+    read() returns None when the kernel queue overflowed and everything must be rescanned."""
+    def __init__(self, top, excluded_folders=()):
+        self.top = os.path.abspath(top)
+        self.excluded_folders = set(excluded_folders)
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.directories = {}  # directories[watch descriptor] = relative path of the directory ("" for top)
+        self.add_tree("")
+
+    def add_watch(self, rel_dir):
+        path = os.path.join(self.top, rel_dir) if rel_dir else self.top
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            if error == errno.ENOSPC:
+                raise OSError(error, "inotify watch limit reached (fs.inotify.max_user_watches)")
+            return  # removed in the meantime
+        self.directories[wd] = rel_dir
+
+    def add_tree(self, rel_dir):
+        self.add_watch(rel_dir)
+        stack = [rel_dir]
+        while stack:
+            current = stack.pop()
+            try:
+                entries = list(os.scandir(os.path.join(self.top, current) if current else self.top))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False) and entry.name not in self.excluded_folders:
+                    child = f"{current}/{entry.name}" if current else entry.name
+                    self.add_watch(child)
+                    stack.append(child)
+
+    def read(self, timeout):
+        """Paths changed within timeout seconds (an empty set if none)."""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set()
+        changed = set()
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT.unpack_from(data, offset)
+                name = os.fsdecode(data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0"))
+                offset += EVENT.size + length
+                if mask & IN_Q_OVERFLOW:
+                    return None
+                if mask & IN_IGNORED:
+                    self.directories.pop(wd, None)
+                    continue
+                rel_dir = self.directories.get(wd)
+                if rel_dir is None or not name or name in self.excluded_folders:
+                    continue
+                rel_path = f"{rel_dir}/{name}" if rel_dir else name
+                if mask & IN_ISDIR:
+                    if mask & (IN_CREATE | IN_MOVED_TO):
+                        self.add_tree(rel_path)  # and whatever was put in it before the watch existed
+                        changed.add(rel_path)
+                elif not mask & IN_CREATE:  # a new file counts once it is closed
+                    changed.add(rel_path)
+        return changed
+
+    def close(self):
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+class PollingWatcher:
+    """Fallback where inotify is not available: compares size / mtime of every file every interval seconds."""
+    def __init__(self, top, excluded_folders=(), excluded_files=(), interval=5.0):
+        self.top = top
+        self.excluded_folders = excluded_folders
+        self.excluded_files = excluded_files
+        self.interval = interval
+        self.next_poll = time.time() + interval
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for rel_path, entry in scan_tree(self.top, self.excluded_folders, self.excluded_files):
+            try:
+                st = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            snapshot[rel_path] = (st.st_size, st.st_mtime_ns)
+        return snapshot
+
+    def read(self, timeout):
+        wait = self.next_poll - time.time()
+        if wait > timeout:
+            time.sleep(timeout)
+            return set()
+        time.sleep(max(wait, 0))
+        self.next_poll = time.time() + self.interval
+        snapshot = self.take_snapshot()
+        changed = {rel_path for rel_path in snapshot.keys() | self.snapshot.keys()
+                   if snapshot.get(rel_path) != self.snapshot.get(rel_path)}
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+def make_watcher(top, excluded_folders=(), excluded_files=(), polling_interval=5.0):
+    """inotify on Linux, polling elsewhere or when inotify cannot be used."""
+    try:
+        return InotifyWatcher(top, excluded_folders)
+    except (OSError, AttributeError) as e:  # not linux / no watches left
+        print(f"watch :: inotify not available ({e}), polling every {polling_interval}s")
+        return PollingWatcher(top, excluded_folders, excluded_files, polling_interval)
+
+def expand(top, paths, excluded_folders=(), excluded_files=()):
+    """Files of paths: directories (created or moved in) stand for every file under them."""
+    files = set()
+    for rel_path in paths:
+        path = os.path.join(top, rel_path)
+        if os.path.isdir(path) and not os.path.islink(path):
+            files.update(f"{rel_path}/{sub_path}" for sub_path, _ in scan_tree(path, excluded_folders, excluded_files))
+        else:
+            files.add(rel_path)
+    return files
+
+class Watch:
+    """Pushes what changes under the folder of a GitManager until stop() is called.
+
+    Events are coalesced: a batch is pushed once nothing changed for `debounce` seconds,
+    or `max_delay` seconds after its first change while files keep changing.
+    A failed push is retried with the next batch, after retry_delay seconds at least (doubling up to 5 minutes)."""
+    def __init__(self, gitManager, debounce=2.0, max_delay=30.0, polling_interval=5.0, on_push=None):
+        self.gitManager = gitManager
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.polling_interval = polling_interval
+        self.on_push = on_push  # on_push(paths, ok) after every batch
+        self.stop_event = threading.Event()
+        self.retry_delay = debounce
+
+    def stop(self):
+        self.stop_event.set()
+        self.gitManager.cancel()  # a push in progress stops at its next cancellation point
+
+    def run(self):
+        gitManager = self.gitManager
+        watcher = make_watcher(gitManager.local_path, gitManager.excluded_folders, gitManager.excluded_files, self.polling_interval)
+        try:
+            # whatever changed while nobody was watching
+            pending, full = set(), True
+            first = last = time.time() - self.max_delay
+            retry_at = 0
+            while not self.stop_event.is_set():
+                now = time.time()
+                if pending or full:
+                    timeout = max(min(last + self.debounce, first + self.max_delay) - now, retry_at - now, 0)
+                else:
+                    timeout = 1.0  # only to notice stop()
+                changed = watcher.read(min(timeout, 1.0))
+                now = time.time()
+                if changed is None:
+                    full = True  # events were lost
+                elif changed:
+                    if not pending and not full:
+                        first = now
+                    pending |= changed
+                    last = now
+                settled = now >= last + self.debounce or now >= first + self.max_delay
+                if (pending or full) and settled and now >= retry_at and not self.stop_event.is_set():
+                    paths = None if full else sorted(expand(gitManager.local_path, pending, gitManager.excluded_folders, gitManager.excluded_files))
+                    try:
+                        ok = gitManager.push(paths=paths)
+                    except Exception as e:  # retried like any failed push, the watch goes on
+                        print(f"watch :: push failed\n{e}")
+                        ok = False
+                    if self.on_push:
+                        self.on_push(paths, ok)
+                    if ok:
+                        pending, full = set(), False
+                        self.retry_delay = self.debounce
+                    else:
+                        retry_at = time.time() + self.retry_delay
+                        self.retry_delay = min(self.retry_delay * 2, 300)
+        finally:
+            watcher.close()